@@ -7,47 +7,63 @@ import time
 import subprocess
 import os
 import hashlib
-import json
 import base64
 from datetime import datetime
 from io import BytesIO
 from PIL import Image
-from crypto import encrypt, decrypt, generate_keypair
+from crypto import encrypt, decrypt, enable_parallel_search
+from cluster import server_address
+from keypool import get_key_pool, get_keypair
 from auth import register_user, login_user, load_users
+from storage import get_backend
+from message_store import conversation_key
+from notifications import feed
+import protocol
+from protocol import FrameDecoder, FRAME_MESSAGE, FRAME_BROADCAST
 
 # Configuration
 HOST = '127.0.0.1'
 PORT = 65432
-MESSAGES_FILE = 'messages.json'
+RECV_SIZE = 65536
+HISTORY_PAGE_SIZE = 50  # messages rendered per page of chat history
+WAIT_SLICE = 0.25      # seconds between interaction checks while waiting for messages
+IDLE_RERUN_MIN = 2.0   # idle safety rerun interval (picks up other processes' writes)
+IDLE_RERUN_MAX = 30.0  # the idle interval doubles after each idle rerun up to this cap
 
 # Avatar colors and icons for users
 AVATAR_COLORS = ['#00C896', '#FF6B6B', '#4ECDC4', '#45B7D1', '#FFA07A', '#98D8C8', '#6C5CE7', '#A29BFE']
 AVATAR_ICONS = ['O', 'A', 'H', 'M', 'J', 'K', 'L', 'S']
 
 def load_messages():
-    """Load all messages from the shared messages file"""
-    if os.path.exists(MESSAGES_FILE):
-        try:
-            with open(MESSAGES_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
+    """Load all messages from the shared storage"""
+    try:
+        return get_backend().load_messages()
+    except Exception:
+        return []
 
-def save_messages(messages):
-    """Save all messages to the shared messages file"""
+def load_conversation_window(user_a, user_b, pages=1):
+    """Latest `pages` pages of a chat (oldest first) and whether older messages exist"""
+    window, cursor = [], None
     try:
-        with open(MESSAGES_FILE, 'w') as f:
-            json.dump(messages, f, indent=2)
-    except Exception as e:
+        for _ in range(pages):
+            page, cursor = get_backend().conversation_page(user_a, user_b, HISTORY_PAGE_SIZE, cursor)
+            window = page + window
+            if cursor is None:
+                break
+    except Exception:
         pass
+    return window, cursor is not None
 
 def add_message(message_data):
-    """Add a new message to the shared storage"""
-    messages = load_messages()
-    messages.append(message_data)
-    save_messages(messages)
-    return messages
+    """Append a new message to the shared storage"""
+    try:
+        get_backend().add_message(message_data)
+        # wake any session showing this chat (broadcasts have no recipient)
+        if message_data["recipient"] is not None:
+            feed.publish(conversation_key(message_data["sender"], message_data["recipient"]))
+    except Exception as e:
+        pass
+    return message_data
 
 def get_user_avatar(username):
     """Generate consistent avatar for user"""
@@ -350,56 +366,62 @@ if 'default_chat_set' not in st.session_state:
     st.session_state.default_chat_set = False
 if 'reset_username' not in st.session_state:
     st.session_state.reset_username = None
+if 'history_chat' not in st.session_state:
+    st.session_state.history_chat = None
+if 'history_pages' not in st.session_state:
+    st.session_state.history_pages = 1
+if 'seen_version' not in st.session_state:
+    st.session_state.seen_version = 0
+if 'idle_rerun' not in st.session_state:
+    st.session_state.idle_rerun = IDLE_RERUN_MIN
 
 def receiver_loop(sock):
     """Background thread to receive messages"""
+    decoder = FrameDecoder()
     while st.session_state.connected:
         try:
-            data = sock.recv(4096)
+            data = sock.recv(RECV_SIZE)
             if not data:
                 st.session_state.connected = False
                 st.session_state.messages.append({"sender": "System", "text": "Server closed connection", "is_encrypted": False})
                 break
             
-            received_data = data.decode('utf-8', errors='ignore')
-            
-            # Parse: sender|recipient|ciphertext
-            parts = received_data.split('|')
-            if len(parts) >= 3:
-                sender, recipient, ciphertext = parts[0], parts[1], '|'.join(parts[2:])
-            elif len(parts) == 2:
-                sender, ciphertext = parts[0], parts[1]
-                recipient = st.session_state.username
-            else:
-                sender = "Unknown"
-                ciphertext = received_data
-                recipient = st.session_state.username
-            
-            # Only process if message is for us
-            if recipient != st.session_state.username:
-                continue
-            
-            try:
-                d_key = st.session_state.decryption_key if st.session_state.decryption_key is not None else st.session_state.crypto_key
-                plaintext = decrypt(ciphertext, d_key, st.session_state.crypto_method)
-                
-                msg_data = {
-                    "sender": sender,
-                    "recipient": st.session_state.username,
-                    "text": plaintext,
-                    "ciphertext": ciphertext,
-                    "is_encrypted": True,
-                    "timestamp": datetime.now().strftime("%I:%M %p"),
-                    "date": datetime.now().strftime("%Y-%m-%d")
-                }
-                
-                # Save to shared file
-                add_message(msg_data)
+            for frame in decoder.feed(data):
+                if frame.type == FRAME_BROADCAST:
+                    # sent to everyone (client.py): kept without a recipient,
+                    # so it belongs to no one-to-one chat
+                    recipient = None
+                elif frame.type == FRAME_MESSAGE:
+                    recipient = frame.recipient or st.session_state.username
+                    # Only process if message is for us
+                    if recipient != st.session_state.username:
+                        continue
+                else:
+                    continue
+                sender = frame.sender or "Unknown"
+                ciphertext = frame.body.decode('utf-8', errors='ignore')
                 
-                # Update local session
-                st.session_state.messages.append(msg_data)
-            except Exception as e:
-                pass
+                try:
+                    d_key = st.session_state.decryption_key if st.session_state.decryption_key is not None else st.session_state.crypto_key
+                    plaintext = decrypt(ciphertext, d_key, st.session_state.crypto_method)
+                    
+                    msg_data = {
+                        "sender": sender,
+                        "recipient": recipient,
+                        "text": plaintext,
+                        "ciphertext": ciphertext,
+                        "is_encrypted": True,
+                        "timestamp": datetime.now().strftime("%I:%M %p"),
+                        "date": datetime.now().strftime("%Y-%m-%d")
+                    }
+                    
+                    # Save to shared file
+                    add_message(msg_data)
+                    
+                    # Update local session
+                    st.session_state.messages.append(msg_data)
+                except Exception as e:
+                    pass
         except Exception as e:
             if st.session_state.connected:
                 st.session_state.messages.append({"sender": "System", "text": f"Connection error: {e}", "is_encrypted": False})
@@ -410,9 +432,10 @@ def connect_to_server():
     """Connect to the chat server"""
     try:
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect((HOST, PORT))
+        # in a cluster (MSECURE_CLUSTER_NODES), the user's home node
+        sock.connect(server_address(st.session_state.username, (HOST, PORT)))
         
-        sock.sendall(st.session_state.username.encode('utf-8'))
+        sock.sendall(protocol.hello(st.session_state.username))
         
         st.session_state.socket = sock
         st.session_state.connected = True
@@ -440,9 +463,11 @@ def send_message(message):
         return False
     
     try:
-        ciphertext = encrypt(message, st.session_state.crypto_key, st.session_state.crypto_method)
-        message_with_sender = f"{st.session_state.username}|{st.session_state.active_chat}|{ciphertext}"
-        st.session_state.socket.sendall(message_with_sender.encode('utf-8'))
+        # rsa_hybrid reuses one session key per conversation
+        conversation = (st.session_state.username, st.session_state.active_chat)
+        ciphertext = encrypt(message, st.session_state.crypto_key, st.session_state.crypto_method, conversation)
+        frame = protocol.message(st.session_state.username, st.session_state.active_chat, ciphertext)
+        st.session_state.socket.sendall(frame)
         
         # Create message data
         msg_data = {
@@ -460,6 +485,7 @@ def send_message(message):
         
         # Also update local session state
         st.session_state.messages.append(msg_data)
+        st.session_state.idle_rerun = IDLE_RERUN_MIN
         return True
     except Exception as e:
         return False
@@ -536,17 +562,18 @@ def login_page():
                         
                         if st.button("Reset Password", use_container_width=True):
                             if new_password == confirm_new and len(new_password) >= 6:
-                                from auth import hash_password, save_users
-                                users = load_users()
-                                users[reset_username] = hash_password(new_password)
-                                save_users(users)
+                                from auth import update_password
+                                success, message = update_password(reset_username, new_password)
                                 
-                                st.success("Password reset successful! Please log in with your new password.")
-                                st.session_state.show_reset_password = False
-                                st.session_state.login_attempts = 0
-                                st.session_state.reset_username = None
-                                time.sleep(1.5)
-                                st.rerun()
+                                if success:
+                                    st.success("Password reset successful! Please log in with your new password.")
+                                    st.session_state.show_reset_password = False
+                                    st.session_state.login_attempts = 0
+                                    st.session_state.reset_username = None
+                                    time.sleep(1.5)
+                                    st.rerun()
+                                else:
+                                    st.error(message)
                             else:
                                 st.error("Passwords must match and be at least 6 characters")
                     else:
@@ -730,15 +757,16 @@ def render_messages():
     active = st.session_state.active_chat
     current_user = st.session_state.username
     
-    # Load messages from shared file and merge with session state
-    all_messages = load_messages()
+    # Only the most recent pages of this chat are loaded and rendered
+    if st.session_state.history_chat != active:
+        st.session_state.history_chat = active
+        st.session_state.history_pages = 1
+    filtered, has_older = load_conversation_window(current_user, active, st.session_state.history_pages) if active else ([], False)
     
-    # Filter messages for active chat (between me and active_chat)
-    filtered = [
-        m for m in all_messages
-        if (m.get("sender") == current_user and m.get("recipient") == active)
-        or (m.get("sender") == active and m.get("recipient") == current_user)
-    ] if active else []
+    if has_older:
+        if st.button("⬆ Load older messages", key="load_older", use_container_width=True):
+            st.session_state.history_pages += 1
+            st.rerun()
     
     if not filtered:
         st.markdown(f'''
@@ -795,8 +823,8 @@ def render_message_input():
     with col1:
         method = st.selectbox(
             "Cipher",
-            ["caesar", "vigenere", "substitution", "transposition", "rsa", "caesar_break"],
-            index=["caesar", "vigenere", "substitution", "transposition", "rsa", "caesar_break"].index(st.session_state.crypto_method),
+            ["caesar", "vigenere", "substitution", "transposition", "rsa", "rsa_hybrid", "caesar_break", "vigenere_break", "substitution_break", "transposition_break"],
+            index=["caesar", "vigenere", "substitution", "transposition", "rsa", "rsa_hybrid", "caesar_break", "vigenere_break", "substitution_break", "transposition_break"].index(st.session_state.crypto_method),
             key="cipher_method"
         )
         if method != st.session_state.crypto_method:
@@ -817,15 +845,28 @@ def render_message_input():
         elif method == "transposition":
             key = st.number_input("Cols", min_value=1, value=5, key="trans_key")
             st.session_state.crypto_key = int(key)
-        elif method == "rsa":
+        elif method in ("rsa", "rsa_hybrid"):
             if st.button("🔑 Gen", key="gen_rsa_keys", use_container_width=True):
-                public_key, private_key = generate_keypair(1024)
+                public_key, private_key = get_keypair(1024)
                 st.session_state.crypto_key = public_key
                 st.session_state.decryption_key = private_key
         elif method == "caesar_break":
             key = st.number_input("Key", min_value=0, max_value=25, value=3, key="break_key")
             st.session_state.crypto_key = key
             st.session_state.decryption_key = "english"
+        elif method == "vigenere_break":
+            key = st.text_input("Key", value="LEMON", key="vig_break_key")
+            st.session_state.crypto_key = key.upper()
+            st.session_state.decryption_key = "english"
+        elif method == "substitution_break":
+            key = st.text_input("Key", value="QWERTY...", max_chars=26, key="sub_break_key")
+            if len(key) == 26:
+                st.session_state.crypto_key = key.upper()
+            st.session_state.decryption_key = "english"
+        elif method == "transposition_break":
+            key = st.number_input("Cols", min_value=1, value=5, key="trans_break_key")
+            st.session_state.crypto_key = int(key)
+            st.session_state.decryption_key = "english"
     
     with col3:
         message = st.text_input("Message", key="message_input", placeholder="Write your message here..")
@@ -836,6 +877,26 @@ def render_message_input():
             if send_message(message):
                 st.rerun()
 
+def wait_for_updates():
+    """Block until the active chat changes, then rerun (instead of polling every 0.5 s)"""
+    active = st.session_state.active_chat
+    if not active:
+        return
+    key = conversation_key(st.session_state.username, active)
+    seen = st.session_state.seen_version
+    heartbeat = st.empty()
+    deadline = time.monotonic() + st.session_state.idle_rerun
+    while st.session_state.connected and time.monotonic() < deadline:
+        if feed.wait(key, seen, WAIT_SLICE) != seen:
+            st.session_state.idle_rerun = IDLE_RERUN_MIN
+            st.rerun()
+        # every st call is a point where Streamlit can stop this run for a user interaction
+        heartbeat.empty()
+    # Nothing arrived in this process: rerun anyway to pick up writes from
+    # other processes, backing off while the chat stays idle
+    st.session_state.idle_rerun = min(st.session_state.idle_rerun * 2, IDLE_RERUN_MAX)
+    st.rerun()
+
 def chat_page():
     """Main chat interface with fixed header, scrollable chat, fixed composer"""
     load_custom_css()
@@ -849,6 +910,10 @@ def chat_page():
     render_header()
     st.markdown('</div>', unsafe_allow_html=True)
     
+    # Remember the chat version we render so wait_for_updates() can't miss a change
+    if st.session_state.active_chat:
+        st.session_state.seen_version = feed.version(conversation_key(st.session_state.username, st.session_state.active_chat))
+    
     # Messages area - scrollable
     st.markdown('<div class="messages-area">', unsafe_allow_html=True)
     render_messages()
@@ -859,10 +924,9 @@ def chat_page():
     render_message_input()
     st.markdown('</div>', unsafe_allow_html=True)
     
-    # Auto-refresh for new messages
+    # Rerun when a new message for the active chat arrives
     if st.session_state.connected:
-        time.sleep(0.5)
-        st.rerun()
+        wait_for_updates()
 
 def main():
     """Main app entry point"""
@@ -872,6 +936,8 @@ def main():
         layout="wide",
         initial_sidebar_state="expanded"
     )
+    enable_parallel_search()
+    get_key_pool()  # keeps RSA keypairs ready for the Gen button (once per process)
     
     if not st.session_state.authenticated:
         login_page()
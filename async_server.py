@@ -0,0 +1,113 @@
+# async_server.py
+# asyncio relay engine: every connection is multiplexed on a single event loop
+# instead of getting its own thread. Wire behavior is identical to server.py.
+import asyncio
+import protocol
+from protocol import (Frame, FrameDecoder, FRAME_HELLO, FRAME_MESSAGE,
+                      FRAME_BROADCAST, FRAME_JOIN, FRAME_LEAVE)
+import outbound as outbound_queues
+from outbound import AsyncOutboundQueue
+from routing import RoutingTable
+from server import HOST, PORT, RECV_SIZE, log_ciphertext
+
+LISTEN_BACKLOG = 4096
+
+routes = RoutingTable()  # username <-> writers, rooms
+framed_clients = set()  # writers speaking the protocol.py framing
+outbound = {}  # writer -> AsyncOutboundQueue, created when the client registers
+# what a client's full outbound queue does with more frames (outbound.py)
+OUTBOUND_POLICY = outbound_queues.OUTBOUND_POLICY
+
+def _unroute(writer):
+    """Stop routing to a connection (closed by its outbound queue or its reader)"""
+    routes.remove(writer)
+    framed_clients.discard(writer)
+
+def _drop(writer):
+    _unroute(writer)
+    queue = outbound.pop(writer, None)
+    if queue is not None:
+        queue.close()
+    else:
+        writer.close()
+
+async def forward(sender_writer, frame: Frame):
+    """
+    Hand a frame to the outbound queue of every routed target. The sender is
+    never held up by a slow recipient: each one has its own bounded queue
+    and writer task, and only its own frames wait.
+    """
+    framed_data = protocol.encode(frame)
+    for writer in routes.targets(sender_writer, frame):
+        queue = outbound.get(writer)
+        if queue is not None:
+            queue.put(framed_data if writer in framed_clients else frame.body)
+
+def register(writer, addr, nickname: str) -> str:
+    if not nickname:
+        nickname = str(addr)
+    routes.add(writer, nickname)
+    if writer not in outbound:
+        outbound[writer] = AsyncOutboundQueue(writer, policy=OUTBOUND_POLICY, on_close=_unroute)
+    print(f"Client name: {nickname}")
+    return nickname
+
+async def relay(writer, nickname: str, frame: Frame):
+    log_ciphertext(nickname, frame.body)
+    await forward(writer, frame._replace(sender=nickname))
+
+async def handle_frame(writer, addr, nickname, frame: Frame):
+    if frame.type == FRAME_HELLO:
+        return register(writer, addr, frame.sender.strip())
+    if nickname is None:
+        return None
+    if frame.type in (FRAME_MESSAGE, FRAME_BROADCAST):
+        await relay(writer, nickname, frame)
+    elif frame.type == FRAME_JOIN:
+        routes.join(writer, frame.recipient)
+    elif frame.type == FRAME_LEAVE:
+        routes.leave(writer, frame.recipient)
+    return nickname
+
+async def handle_client(reader, writer):
+    addr = writer.get_extra_info('peername')
+    print(f"[+] Connected {addr}")
+    try:
+        data = await reader.read(1024)
+        if protocol.is_framed(data):
+            framed_clients.add(writer)
+            decoder = FrameDecoder()
+            nickname = None
+            while data:
+                for frame in decoder.feed(data):
+                    nickname = await handle_frame(writer, addr, nickname, frame)
+                data = await reader.read(RECV_SIZE)
+        else:
+            # legacy client: plain nickname, then one ciphertext per read for everyone
+            nickname = register(writer, addr, data.decode('utf-8', errors='ignore').strip())
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                await relay(writer, nickname, Frame(FRAME_BROADCAST, nickname, '', data))
+    except Exception as e:
+        print("Client error:", e)
+    finally:
+        print(f"[-] Disconnected {addr}")
+        _drop(writer)
+
+async def run(host=HOST, port=PORT):
+    server = await asyncio.start_server(handle_client, host, port,
+                                        reuse_address=True, backlog=LISTEN_BACKLOG)
+    print(f"Server listening on {host}:{port} (asyncio)")
+    async with server:
+        await server.serve_forever()
+
+def serve_asyncio(host=HOST, port=PORT, outbound_policy: str = OUTBOUND_POLICY):
+    """Run the asyncio engine until interrupted"""
+    global OUTBOUND_POLICY
+    OUTBOUND_POLICY = outbound_policy
+    try:
+        asyncio.run(run(host, port))
+    except KeyboardInterrupt:
+        pass
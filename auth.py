@@ -1,36 +1,41 @@
 # auth.py
 # Authentication system with bcrypt password hashing
-import bcrypt
-import json
+import asyncio
 import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import bcrypt
 from typing import Optional, Dict
+from storage import get_backend
 
-USERS_DB = "users.json"
+# bcrypt cost factor for new hashes (existing hashes keep their own cost)
+BCRYPT_ROUNDS = int(os.environ.get('MSECURE_BCRYPT_ROUNDS', '12'))
+# bcrypt runs on this many worker threads; at most AUTH_MAX_PENDING
+# requests may be queued or running before new ones are turned away
+AUTH_WORKERS = int(os.environ.get('MSECURE_AUTH_WORKERS', str(min(8, os.cpu_count() or 1))))
+AUTH_MAX_PENDING = int(os.environ.get('MSECURE_AUTH_MAX_PENDING', '64'))
+BUSY_MESSAGE = "Server busy, please try again in a moment"
 
 def load_users() -> Dict[str, str]:
-    """Load users from JSON file. Returns dict of username -> hashed_password"""
-    if not os.path.exists(USERS_DB):
-        return {}
+    """Load users from the storage backend. Returns dict of username -> hashed_password"""
     try:
-        with open(USERS_DB, 'r') as f:
-            return json.load(f)
+        return get_backend().load_users()
     except Exception as e:
         print(f"Error loading users: {e}")
         return {}
 
 def save_users(users: Dict[str, str]) -> bool:
-    """Save users to JSON file"""
+    """Replace all users in the storage backend"""
     try:
-        with open(USERS_DB, 'w') as f:
-            json.dump(users, f, indent=2)
+        get_backend().save_users(users)
         return True
     except Exception as e:
         print(f"Error saving users: {e}")
         return False
 
-def hash_password(password: str) -> str:
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
     """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -42,52 +47,144 @@ def verify_password(password: str, hashed: str) -> bool:
         print(f"Error verifying password: {e}")
         return False
 
-def register_user(username: str, password: str) -> tuple[bool, str]:
-    """
-    Register a new user.
-    Returns (success, message)
-    """
+def _register_user(username: str, password: str) -> tuple[bool, str]:
     if not username or not password:
         return False, "Username and password cannot be empty"
     
     if len(password) < 6:
         return False, "Password must be at least 6 characters long"
     
-    users = load_users()
-    
-    if username in users:
+    if user_exists(username):
         return False, "Username already exists"
     
     # Hash the password
     hashed = hash_password(password)
-    users[username] = hashed
     
-    if save_users(users):
-        return True, "Registration successful"
-    else:
+    try:
+        # the insert itself is atomic, so a concurrent registration of the
+        # same name loses here instead of overwriting the first one
+        if not get_backend().add_user(username, hashed):
+            return False, "Username already exists"
+    except Exception as e:
+        print(f"Error saving users: {e}")
         return False, "Error saving user data"
+    return True, "Registration successful"
 
-def login_user(username: str, password: str) -> tuple[bool, str]:
-    """
-    Authenticate a user.
-    Returns (success, message)
-    """
+def _update_password(username: str, new_password: str) -> tuple[bool, str]:
+    if len(new_password) < 6:
+        return False, "Password must be at least 6 characters long"
+    try:
+        get_backend().set_user(username, hash_password(new_password))
+    except Exception as e:
+        print(f"Error saving users: {e}")
+        return False, "Error saving user data"
+    return True, "Password updated"
+
+def _login_user(username: str, password: str) -> tuple[bool, str]:
     if not username or not password:
         return False, "Username and password cannot be empty"
     
-    users = load_users()
+    hashed = get_user_hash(username)
     
-    if username not in users:
+    if hashed is None:
         return False, "Invalid username or password"
     
-    hashed = users[username]
-    
     if verify_password(password, hashed):
         return True, "Login successful"
     else:
         return False, "Invalid username or password"
 
+class AuthService:
+    """
+    Runs bcrypt work on a bounded thread pool. bcrypt releases the GIL while
+    hashing, so the workers run in parallel and callers (the Streamlit
+    script thread, the asyncio server) are never stuck behind each other.
+    Once max_pending requests are queued or running, new requests are
+    rejected immediately with BUSY_MESSAGE instead of waiting.
+    """
+
+    def __init__(self, workers: int = AUTH_WORKERS, max_pending: int = AUTH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rejected = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='auth')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, fn, *args) -> Future:
+        """Run fn(*args) on the pool. The future resolves to (success, message)."""
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            future = Future()
+            future.set_result((False, BUSY_MESSAGE))
+            return future
+        try:
+            future = self._pool.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def login(self, username: str, password: str) -> Future:
+        return self.submit(_login_user, username, password)
+
+    def register(self, username: str, password: str) -> Future:
+        return self.submit(_register_user, username, password)
+
+    def update_password(self, username: str, new_password: str) -> Future:
+        return self.submit(_update_password, username, new_password)
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_auth_service() -> AuthService:
+    """Process-wide AuthService configured from the AUTH_* settings"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = AuthService()
+        return _service
+
+def register_user(username: str, password: str) -> tuple[bool, str]:
+    """
+    Register a new user.
+    Returns (success, message)
+    """
+    return get_auth_service().register(username, password).result()
+
+def login_user(username: str, password: str) -> tuple[bool, str]:
+    """
+    Authenticate a user.
+    Returns (success, message)
+    """
+    return get_auth_service().login(username, password).result()
+
+def update_password(username: str, new_password: str) -> tuple[bool, str]:
+    """
+    Replace a user's password.
+    Returns (success, message)
+    """
+    return get_auth_service().update_password(username, new_password).result()
+
+async def register_user_async(username: str, password: str) -> tuple[bool, str]:
+    """register_user for asyncio callers: awaits the pool without blocking the loop"""
+    return await asyncio.wrap_future(get_auth_service().register(username, password))
+
+async def login_user_async(username: str, password: str) -> tuple[bool, str]:
+    """login_user for asyncio callers: awaits the pool without blocking the loop"""
+    return await asyncio.wrap_future(get_auth_service().login(username, password))
+
+def get_user_hash(username: str) -> Optional[str]:
+    """Stored password hash for a user, or None"""
+    try:
+        return get_backend().get_user(username)
+    except Exception as e:
+        print(f"Error loading users: {e}")
+        return None
+
 def user_exists(username: str) -> bool:
     """Check if a user exists"""
-    users = load_users()
-    return username in users
+    return get_user_hash(username) is not None
@@ -0,0 +1,166 @@
+# bench_auth.py
+# Auth benchmarks.
+#
+# Users directory at 100k users: the original load-users.json-per-call
+# auth path against the cached UserDirectory (a fixed hash is stored, so
+# bcrypt is left out and only the directory is timed).
+#
+# Login storm: many clients logging in at once through AuthService with
+# 1, 8 and 32 bcrypt workers; throughput, p99 latency and fast rejections
+# once the pending queue is full.
+#
+#   python bench_auth.py --users 100000 --rounds 12
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import bcrypt
+from storage import UserDirectory
+
+HASH = "$2b$12$lZZwzn71S2FLuTKDEE3.LOtpmNygLTD9EJZI4EifH4Jk20o.7zP2m"
+
+# --- original auth.py implementation ---
+
+def json_load_users(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def json_user_exists(path, username):
+    return username in json_load_users(path)
+
+def json_register(path, username):
+    users = json_load_users(path)
+    if username in users:
+        return False
+    users[username] = HASH
+    with open(path, 'w') as f:
+        json.dump(users, f, indent=2)
+    return True
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def bench_directory(tmp, n_users, lookups, registrations):
+    path = os.path.join(tmp, 'users.json')
+    with open(path, 'w') as f:
+        json.dump({f"user{i}": HASH for i in range(n_users)}, f, indent=2)
+
+    old_lookups = max(5, lookups // 10000)
+    t0 = time.perf_counter()
+    for i in range(old_lookups):
+        json_user_exists(path, f"user{i * 7 % n_users}")
+    old_rate = old_lookups / (time.perf_counter() - t0)
+
+    directory = UserDirectory(path)
+    t0 = time.perf_counter()
+    directory.refresh(force=True)
+    cold_load = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(lookups):
+        directory.get(f"user{i * 7 % n_users}")
+    new_rate = lookups / (time.perf_counter() - t0)
+
+    old_lat = []
+    for i in range(max(3, registrations // 20)):
+        t0 = time.perf_counter()
+        json_register(path, f"old{i}")
+        old_lat.append(time.perf_counter() - t0)
+
+    directory = UserDirectory(path)
+    directory.refresh(force=True)
+    new_lat = []
+    for i in range(registrations):
+        t0 = time.perf_counter()
+        assert directory.add(f"new{i}", HASH)
+        new_lat.append(time.perf_counter() - t0)
+    return old_rate, new_rate, cold_load, old_lat, new_lat
+
+def login_storm(workers, clients, logins_per_client, max_pending):
+    """`clients` threads each logging in repeatedly through one AuthService"""
+    import auth
+    service = auth.AuthService(workers=workers, max_pending=max_pending)
+    latencies, rejected = [], []
+    lock = threading.Lock()
+    start = threading.Barrier(clients + 1)
+
+    def client(i):
+        start.wait()
+        for _ in range(logins_per_client):
+            t0 = time.perf_counter()
+            ok, message = service.login(f"storm{i}", "password123").result()
+            elapsed = time.perf_counter() - t0
+            with lock:
+                (latencies if ok else rejected).append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    service.shutdown()
+    return len(latencies) / wall, latencies, rejected
+
+def bench_login_storm(tmp, rounds, clients, logins_per_client, worker_counts):
+    os.chdir(tmp)  # storage backend files are created relative to the cwd
+    from storage import get_backend
+    hashed = bcrypt.hashpw(b"password123", bcrypt.gensalt(rounds=rounds)).decode()
+    for i in range(clients):
+        get_backend().add_user(f"storm{i}", hashed)
+    rows = []
+    for workers in worker_counts:
+        rate, lat, rej = login_storm(workers, clients, logins_per_client, max_pending=clients)
+        rows.append((workers, clients, rate, lat, rej))
+    # overload: queue limit far below the number of concurrent clients
+    workers = worker_counts[-1]
+    rate, lat, rej = login_storm(workers, clients, logins_per_client, max_pending=max(1, workers // 2))
+    rows.append((workers, clients, rate, lat, rej))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Auth benchmarks")
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=1_000_000)
+    parser.add_argument('--registrations', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=12, help="bcrypt cost for the login storm")
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--logins', type=int, default=2, help="logins per client")
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 8, 32])
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_auth_')
+    try:
+        old_rate, new_rate, cold, old_lat, new_lat = bench_directory(tmp, args.users, args.lookups, args.registrations)
+        print(f"users directory, {args.users} users")
+        print(f"  lookups/sec   load users.json per call: {old_rate:>12.1f}")
+        print(f"  lookups/sec   cached UserDirectory    : {new_rate:>12.0f}  (cold load {cold * 1000:.0f} ms)")
+        print(f"  registration  rewrite users.json      : p50 {percentile(old_lat, 50) * 1000:8.2f} ms"
+              f"  p99 {percentile(old_lat, 99) * 1000:8.2f} ms")
+        print(f"  registration  journal append + fsync  : p50 {percentile(new_lat, 50) * 1000:8.2f} ms"
+              f"  p99 {percentile(new_lat, 99) * 1000:8.2f} ms")
+
+        print(f"login storm: {args.clients} clients x {args.logins} logins, bcrypt cost {args.rounds}"
+              f" ({os.cpu_count()} CPUs)")
+        print(f"  {'workers':>7} {'max pending':>11} {'logins/s':>9} {'p50 ms':>8} {'p99 ms':>8}"
+              f" {'rejected':>8} {'reject ms':>9}")
+        rows = bench_login_storm(tmp, args.rounds, args.clients, args.logins, args.workers)
+        for i, (workers, clients, rate, lat, rej) in enumerate(rows):
+            pending = clients if i < len(rows) - 1 else max(1, workers // 2)
+            p50 = percentile(lat, 50) * 1000 if lat else float('nan')
+            p99 = percentile(lat, 99) * 1000 if lat else float('nan')
+            rej_ms = percentile(rej, 99) * 1000 if rej else 0.0
+            print(f"  {workers:>7} {pending:>11} {rate:>9.1f} {p50:>8.1f} {p99:>8.1f} {len(rej):>8} {rej_ms:>9.3f}")
+    finally:
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
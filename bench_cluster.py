@@ -0,0 +1,170 @@
+# bench_cluster.py
+# Cross-node delivery latency in cluster mode. Starts the local broker and a
+# cluster of server.py nodes (cluster.py), connects users to their home
+# node by consistent hashing (--placement ring, as a hash-aware load
+# balancer would) or to a random node, and has senders alternate direct
+# messages to a user on their own node and one on another node. Every
+# receiver measures latency from the timestamp in the body, split into
+# same-node and cross-node deliveries.
+#
+# Also reports how evenly the ring spreads the users and how many move
+# when one more node is added.
+#
+#   python bench_cluster.py --nodes 3 --users 300 --messages 3000
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import protocol
+from bench_server import HERE, free_port, percentile, start_server, stop_server
+from cluster import HashRing
+from protocol import FrameDecoder
+
+def start_broker(port):
+    proc = subprocess.Popen([sys.executable, 'cluster.py', 'broker', '--port', str(port)],
+                            cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"broker did not start on port {port}")
+
+def ring_report(names, users, replicas):
+    ring = HashRing(names, replicas)
+    counts = {name: 0 for name in names}
+    for user in users:
+        counts[ring.node_for(user)] += 1
+    before = {user: ring.node_for(user) for user in users}
+    ring.add("extra")
+    moved = sum(ring.node_for(user) != node for user, node in before.items())
+    spread = ' '.join(f"{name}={count}" for name, count in counts.items())
+    print(f"ring: {len(names)} nodes x {replicas} points, users per node {spread}; "
+          f"adding a node moves {100 * moved / len(users):.1f}% (ideal {100 / (len(names) + 1):.1f}%)")
+
+async def run_load(placement, ports, users, senders, messages, size, interval, timeout):
+    home = {user: placement(user) for user in users}
+    conns = {}
+    for user in users:
+        reader, writer = await asyncio.open_connection('127.0.0.1', ports[home[user]])
+        writer.write(protocol.hello(user))
+        conns[user] = (reader, writer)
+    await asyncio.gather(*(w.drain() for _, w in conns.values()))
+    # every node must have seen every other node's users in the presence registry
+    await asyncio.sleep(1.0 + len(users) / 2000)
+
+    latencies = {"same": [], "cross": []}
+    received = {"same": 0, "cross": 0}
+    by_node = {}
+    for user in users:
+        by_node.setdefault(home[user], []).append(user)
+    rng = random.Random(1)
+    plans = []
+    for sender in users[:senders]:
+        local = [u for u in by_node[home[sender]] if u != sender]
+        remote = [u for u in users if home[u] != home[sender]]
+        if local and remote:
+            plans.append((sender, rng.choice(local), rng.choice(remote)))
+    per_sender = max(1, messages // max(1, len(plans)))
+    expected = len(plans) * per_sender
+    done = asyncio.Event()
+
+    async def receive(user):
+        reader, _ = conns[user]
+        decoder = FrameDecoder()
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return
+            now = time.perf_counter_ns()
+            for frame in decoder.feed(chunk):
+                path = "same" if home[frame.sender] == home[user] else "cross"
+                latencies[path].append(now - int(frame.body[:16], 16))
+                received[path] += 1
+            if sum(received.values()) >= expected:
+                done.set()
+
+    async def send(sender, local, remote):
+        writer = conns[sender][1]
+        pad = '0' * max(0, size - 16)
+        for seq in range(per_sender):
+            recipient = remote if seq % 2 else local
+            writer.write(protocol.message(sender, recipient, f"{time.perf_counter_ns():016x}{pad}"))
+            await writer.drain()
+            await asyncio.sleep(interval)
+
+    readers = [asyncio.create_task(receive(user)) for user in users]
+    t0 = time.perf_counter()
+    await asyncio.gather(*(send(*plan) for plan in plans))
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - t0
+    for task in readers:
+        task.cancel()
+    for _, writer in conns.values():
+        writer.close()
+    return {
+        "expected": {"same": len(plans) * ((per_sender + 1) // 2), "cross": len(plans) * (per_sender // 2)},
+        "received": received,
+        "msgs_per_sec": sum(received.values()) / elapsed,
+        "latencies": latencies,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster mode cross-node latency")
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--senders', type=int, default=30)
+    parser.add_argument('--messages', type=int, default=3000, help="direct messages per run, half cross-node")
+    parser.add_argument('--size', type=int, default=256, help="message body bytes")
+    parser.add_argument('--interval', type=float, default=0.002, help="seconds between one sender's messages")
+    parser.add_argument('--placement', nargs='+', choices=['ring', 'random'], default=['ring', 'random'])
+    parser.add_argument('--replicas', type=int, default=128, help="ring points per node")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    args = parser.parse_args()
+
+    names = [chr(ord('a') + i) for i in range(args.nodes)]
+    users = [f"user{i}" for i in range(args.users)]
+    ring_report(names, users, args.replicas)
+
+    broker_port = free_port()
+    ports = {name: free_port() for name in names}
+    spec = ','.join(f"{name}=127.0.0.1:{port}" for name, port in ports.items())
+    env = {"MSECURE_LOG_SAMPLE": "0", "MSECURE_RING_REPLICAS": str(args.replicas)}
+    broker = start_broker(broker_port)
+    nodes = []
+    try:
+        for name in names:
+            nodes.append(start_server("threaded", ports[name], [
+                "--cluster-node", name, "--cluster-nodes", spec,
+                "--backplane", f"local://127.0.0.1:{broker_port}"], env=env))
+        ring = HashRing(names, args.replicas)
+        rng = random.Random(2)
+        placements = {"ring": ring.node_for, "random": lambda user: rng.choice(names)}
+        print(f"{args.nodes} nodes + local broker, {os.cpu_count()} CPUs, {args.size}-byte direct messages")
+        print(f"{'placement':<9} {'path':<6} {'delivered':>12} {'p50 ms':>8} {'p99 ms':>8}")
+        for placement in args.placement:
+            r = asyncio.run(run_load(placements[placement], ports, users, args.senders, args.messages,
+                                     args.size, args.interval, args.timeout))
+            for path in ("same", "cross"):
+                lat = r["latencies"][path]
+                print(f"{placement:<9} {path:<6} {r['received'][path]:>5}/{r['expected'][path]:<6} "
+                      f"{percentile(lat, 50) / 1e6:>8.2f} {percentile(lat, 99) / 1e6:>8.2f}")
+            print(f"{placement:<9} {'total':<6} {r['msgs_per_sec']:>8.0f} msgs/s")
+    finally:
+        for proc in nodes:
+            stop_server(proc)
+        stop_server(broker)
+
+if __name__ == "__main__":
+    main()
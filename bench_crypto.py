@@ -0,0 +1,387 @@
+# bench_crypto.py
+# Classical cipher throughput: the original per-character loops against the
+# compiled str.translate tables in crypto.py, at 100 B, 10 KB and 10 MB.
+# Every result is checked against the loop output before it is timed.
+#
+# Batch: encrypt_many/decrypt_many over 1M short chat messages against a
+# loop over the scalar encrypt/decrypt, with shared and per-message keys.
+#
+# caesar_break: the original 26-decryption brute force against the
+# dictionary-index version on chat-sized messages, with a same-result check.
+#
+# vigenere_break: recovered-key accuracy and timing on English corpora built
+# from english_words.txt, 1 KB to 1 MB, each under a random 3-12 letter key.
+#
+# substitution_break: solve rate and wall time for 200-5000 character
+# ciphertexts against the number of worker processes.
+#
+#   python bench_crypto.py --sizes 100 10000 10000000 --messages 1000000 --breaks 2000 \
+#       --corpora 1000 10000 100000 1000000 --subst-lengths 200 500 1000 5000 --subst-workers 1 2 4 8 \
+#       --transposition-size 1000000
+#
+# Transposition: original grid loops against cached permutations at 1 MB,
+# and transposition_break sweeping every column count.
+import argparse
+import os
+import random
+import time
+import crypto
+
+SUB_KEY = "QWERTYUIOPASDFGHJKLZXCVBNM"
+VIG_KEY = "LEMON"
+
+# --- original crypto.py implementations ---
+
+def loop_caesar_encrypt(plaintext, key):
+    result_chars = []
+    for ch in plaintext:
+        if 'a' <= ch <= 'z':
+            base = ord('a')
+            result_chars.append(chr((ord(ch) - base + key) % 26 + base))
+        elif 'A' <= ch <= 'Z':
+            base = ord('A')
+            result_chars.append(chr((ord(ch) - base + key) % 26 + base))
+        else:
+            result_chars.append(ch)
+    return ''.join(result_chars)
+
+def loop_vigenere(text, key, direction):
+    result = []
+    key = key.upper()
+    key_index = 0
+    for ch in text:
+        if ch.isalpha():
+            shift = ord(key[key_index % len(key)]) - ord('A')
+            base = ord('A') if ch.isupper() else ord('a')
+            result.append(chr((ord(ch) - base + direction * shift) % 26 + base))
+            key_index += 1
+        else:
+            result.append(ch)
+    return ''.join(result)
+
+def loop_substitution(text, key, decrypt=False):
+    clean_key = ''.join([c for c in key if c.isalpha()])
+    if len(clean_key) != 26:
+        raise ValueError("Substitution key must contain 26 letters")
+    clean_key = clean_key.upper()
+    if decrypt:
+        mapping_upper = {clean_key[i]: chr(ord('A') + i) for i in range(26)}
+    else:
+        mapping_upper = {chr(ord('A') + i): clean_key[i] for i in range(26)}
+    mapping_lower = {k.lower(): v.lower() for k, v in mapping_upper.items()}
+    result = []
+    for ch in text:
+        if ch.isupper():
+            result.append(mapping_upper.get(ch, ch))
+        elif ch.islower():
+            result.append(mapping_lower.get(ch, ch))
+        else:
+            result.append(ch)
+    return ''.join(result)
+
+def brute_force_caesar_break(ciphertext):
+    vocab = crypto.COMMON_WORDS
+    best_score = -1
+    best_text = ""
+    best_key = 0
+    for key in range(26):
+        candidate = crypto.caesar_decrypt(ciphertext, key)
+        words = candidate.split()
+        score = 0
+        for word in words:
+            clean_word = ''.join(c for c in word if c.isalpha()).lower()
+            if clean_word in vocab:
+                score += 1
+        if score > best_score:
+            best_score = score
+            best_text = candidate
+            best_key = key
+    return best_text, best_key, best_score
+
+def loop_transposition_encrypt(plaintext, key):
+    cols = int(key)
+    rows = (len(plaintext) + cols - 1) // cols
+    padded = plaintext.ljust(rows * cols, 'X')
+    result = []
+    for c in range(cols):
+        for r in range(rows):
+            result.append(padded[r * cols + c])
+    return ''.join(result)
+
+def loop_transposition_decrypt(ciphertext, key):
+    cols = int(key)
+    length = len(ciphertext)
+    rows = (length + cols - 1) // cols
+    grid = [[''] * cols for _ in range(rows)]
+    idx = 0
+    for c in range(cols):
+        for r in range(rows):
+            if idx < length:
+                grid[r][c] = ciphertext[idx]
+                idx += 1
+    result = []
+    for r in range(rows):
+        for c in range(cols):
+            result.append(grid[r][c])
+    return ''.join(result).rstrip('X')
+
+CASES = [
+    ('caesar enc', lambda t: loop_caesar_encrypt(t, 3), lambda t: crypto.encrypt(t, 3, 'caesar')),
+    ('caesar dec', lambda t: loop_caesar_encrypt(t, -3), lambda t: crypto.decrypt(t, 3, 'caesar')),
+    ('vigenere enc', lambda t: loop_vigenere(t, VIG_KEY, 1), lambda t: crypto.encrypt(t, VIG_KEY, 'vigenere')),
+    ('vigenere dec', lambda t: loop_vigenere(t, VIG_KEY, -1), lambda t: crypto.decrypt(t, VIG_KEY, 'vigenere')),
+    ('subst enc', lambda t: loop_substitution(t, SUB_KEY), lambda t: crypto.encrypt(t, SUB_KEY, 'substitution')),
+    ('subst dec', lambda t: loop_substitution(t, SUB_KEY, True), lambda t: crypto.decrypt(t, SUB_KEY, 'substitution')),
+]
+
+def make_text(size, rng):
+    words = ["the", "Quick", "brown", "fox", "jumps", "over", "LAZY", "dog", "at", "dawn",
+             "meet", "me", "by", "the", "old", "bridge", "42", "ok?", "yes!", "co-op"]
+    out, length = [], 0
+    while length < size:
+        w = rng.choice(words)
+        out.append(w)
+        length += len(w) + 1
+    return ' '.join(out)[:size]
+
+def check_edge_cases():
+    """Inputs outside the fast path must still match the loops exactly"""
+    samples = ["", "!!!", "Ünïcödé wörds ß and ASCII", "ÉCOLE école", "tab\tnew\nline",
+               "ǅemal ﬁx İstanbul", "MiXeD 123 cAsE"]
+    keys = ["LEMON", "a", "Key With Spaces", "ßeta", "k3y!"]
+    for text in samples:
+        for shift in (0, 1, 13, 25, 26, -4, 300):
+            assert crypto.caesar_encrypt(text, shift) == loop_caesar_encrypt(text, shift)
+        for key in keys:
+            assert crypto.vigenere_encrypt(text, key) == loop_vigenere(text, key, 1), (text, key)
+            assert crypto.vigenere_decrypt(text, key) == loop_vigenere(text, key, -1), (text, key)
+        for key in (SUB_KEY, SUB_KEY.lower(), "ªBCDEFGHIJKLMNOPQRSTUVWXYZ"):
+            assert crypto.substitution_encrypt(text, key) == loop_substitution(text, key), (text, key)
+            assert crypto.substitution_decrypt(text, key) == loop_substitution(text, key, True), (text, key)
+
+def random_vigenere_key(rng):
+    return ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(rng.randint(1, 8)))
+
+# per-message keys come from a pool, one key per conversation
+KEY_POOL = 200
+BATCH_METHODS = [
+    ('caesar', 7, lambda rng: rng.randrange(26)),
+    ('vigenere', VIG_KEY, random_vigenere_key),
+    ('substitution', SUB_KEY, lambda rng: ''.join(rng.sample(SUB_KEY, 26))),
+    ('transposition', 4, lambda rng: rng.randint(1, 9)),
+]
+
+def per_message_keys(random_key, count, rng):
+    pool = [random_key(rng) for _ in range(KEY_POOL)]
+    return [rng.choice(pool) for _ in range(count)]
+
+def make_messages(count, rng):
+    return [make_text(rng.randint(5, 60), rng) for _ in range(count)]
+
+def check_batch(rng):
+    """Batch output must equal the scalar API, including non-ASCII text"""
+    texts = make_messages(500, rng) + ["", "Ünïcödé wörds ß", "emoji 😀 ok", "ÉCOLE", "XXXX"]
+    for method, key, random_key in BATCH_METHODS:
+        keys = per_message_keys(random_key, len(texts), rng)
+        for k in (key, keys):
+            per = k if isinstance(k, list) else [k] * len(texts)
+            enc = crypto.encrypt_many(texts, k, method)
+            assert enc == [crypto.encrypt(t, kk, method) for t, kk in zip(texts, per)], method
+            dec = crypto.decrypt_many(enc, k, method)
+            assert dec == [crypto.decrypt(t, kk, method) for t, kk in zip(enc, per)], method
+
+def bench_batch(count, rng):
+    texts = make_messages(count, rng)
+    print(f"batch of {count} messages ({sum(map(len, texts)) / count:.0f} chars avg)")
+    print(f"  {'cipher':<13} {'keys':<7} {'scalar msg/s':>13} {'batch msg/s':>12} {'speedup':>8}"
+          f" {'batch dec msg/s':>16}")
+    for method, key, random_key in BATCH_METHODS:
+        keys = per_message_keys(random_key, count, rng)
+        for label, k in (('shared', key), ('per-msg', keys)):
+            per = k if isinstance(k, list) else [k] * count
+            t0 = time.perf_counter()
+            expected = [crypto.encrypt(t, kk, method) for t, kk in zip(texts, per)]
+            scalar_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            got = crypto.encrypt_many(texts, k, method)
+            batch_s = time.perf_counter() - t0
+            assert got == expected, method
+            t0 = time.perf_counter()
+            back = crypto.decrypt_many(got, k, method)
+            decrypt_s = time.perf_counter() - t0
+            assert back == texts, method
+            print(f"  {method:<13} {label:<7} {count / scalar_s:>13.0f} {count / batch_s:>12.0f}"
+                  f" {scalar_s / batch_s:>7.1f}x {count / decrypt_s:>16.0f}")
+
+def make_chat_message(rng, vocab):
+    words = [rng.choice(vocab) for _ in range(rng.randint(2, 15))]
+    words[0] = words[0].capitalize()
+    return ' '.join(words) + rng.choice(['', '.', '!', '?', ' :)'])
+
+def bench_caesar_break(count, rng):
+    vocab = sorted(w for w in crypto.COMMON_WORDS if w.isalpha())
+    messages = [crypto.caesar_encrypt(make_chat_message(rng, vocab), rng.randrange(26)) for _ in range(count)]
+    messages += ["Ünïcödé wörds and café", "!!! 42", "", "zzqx vprk"]
+    t0 = time.perf_counter()
+    expected = [brute_force_caesar_break(m) for m in messages]
+    brute_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    got = [crypto.caesar_break(m) for m in messages]
+    index_s = time.perf_counter() - t0
+    fallback = 0
+    for m, (text, key, score), result in zip(messages, expected, got):
+        if score > 0:
+            assert result == (text, key), m
+        else:
+            fallback += 1
+    print(f"caesar_break over {len(messages)} chat messages ({fallback} without dictionary hits)")
+    print(f"  brute force     : {brute_s / len(messages) * 1e6:9.1f} us/msg")
+    print(f"  dictionary index: {index_s / len(messages) * 1e6:9.1f} us/msg  ({brute_s / index_s:.1f}x)")
+
+    # frequency fallback alone, on longer English text
+    long_texts = [' '.join(rng.choice(vocab) for _ in range(30)) for _ in range(200)]
+    hits = 0
+    for text in long_texts:
+        shift = rng.randrange(26)
+        counts = crypto._letter_counts(crypto.caesar_encrypt(text, shift))
+        hits += int(crypto._chi_squared(counts).argmin()) == shift
+    print(f"  chi-squared fallback recovers the shift of 30-word texts: {hits}/{len(long_texts)}")
+
+def make_corpus(size, rng, vocab):
+    words, length = [], 0
+    while length < size:
+        word = rng.choice(vocab)
+        words.append(word.capitalize() if rng.random() < 0.05 else word)
+        length += len(word) + 1
+        if rng.random() < 0.08:
+            words[-1] += rng.choice('.,!?')
+    return ' '.join(words)[:size]
+
+def bench_vigenere_break(sizes, trials, rng):
+    vocab = sorted(w for w in crypto.COMMON_WORDS if w.isalpha())
+    print(f"vigenere_break on English corpora ({trials} random keys per size)")
+    print(f"  {'size':>9} {'keys found':>11} {'ms avg':>9} {'ms max':>9}")
+    for size in sizes:
+        found, times = 0, []
+        for _ in range(trials):
+            key = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(rng.randint(3, 12)))
+            key = crypto._shortest_repeat(key)
+            plaintext = make_corpus(size, rng, vocab)
+            ciphertext = crypto.vigenere_encrypt(plaintext, key)
+            t0 = time.perf_counter()
+            recovered, found_key = crypto.vigenere_break(ciphertext)
+            times.append(time.perf_counter() - t0)
+            if found_key == key:
+                assert recovered == plaintext
+                found += 1
+        print(f"  {size:>9} {found:>5}/{trials:<5} {sum(times) / trials * 1000:>9.1f} {max(times) * 1000:>9.1f}")
+
+def bench_substitution_break(lengths, worker_counts, trials, budget, rng):
+    vocab = sorted(w for w in crypto.COMMON_WORDS if w.isalpha())
+    print(f"substitution_break, {budget:.1f}s budget, {trials} random keys per row ({os.cpu_count()} CPUs)")
+    print(f"  {'length':>6} {'workers':>7} {'solved':>8} {'letters ok':>10} {'s avg':>7} {'s max':>7}")
+    for length in lengths:
+        cases = []
+        for _ in range(trials):
+            plaintext = make_corpus(length, rng, vocab)
+            cases.append((plaintext, crypto.substitution_encrypt(plaintext, ''.join(rng.sample(SUB_KEY, 26)))))
+        for workers in worker_counts:
+            solved, correct, times = 0, 0.0, []
+            for plaintext, ciphertext in cases:
+                t0 = time.perf_counter()
+                recovered, _ = crypto.substitution_break(ciphertext, time_budget=budget, workers=workers)
+                times.append(time.perf_counter() - t0)
+                solved += recovered == plaintext
+                correct += sum(a == b for a, b in zip(recovered, plaintext)) / len(plaintext)
+            print(f"  {length:>6} {workers:>7} {solved:>3}/{trials:<4} {correct / trials:>10.1%}"
+                  f" {sum(times) / trials:>7.2f} {max(times):>7.2f}")
+
+def bench_transposition(size, rng):
+    vocab = sorted(w for w in crypto.COMMON_WORDS if w.isalpha())
+    text = make_corpus(size, rng, vocab)
+    for cols in (1, 2, 7, 63, 1000, size + 5):
+        for n in (0, 1, cols - 1, cols, 3 * cols + 1, 200):
+            sample = text[:max(0, n)]
+            assert crypto.transposition_encrypt(sample, cols) == loop_transposition_encrypt(sample, cols)
+            assert crypto.transposition_decrypt(sample, cols) == loop_transposition_decrypt(sample, cols)
+    print(f"transposition, {size} characters")
+    print(f"  {'op':<10} {'cols':>5} {'loop ms':>9} {'cached ms':>10} {'speedup':>8}")
+    for cols in (5, 64):
+        ciphertext = crypto.transposition_encrypt(text, cols)
+        for name, loop, fast, arg in (
+            ('encrypt', loop_transposition_encrypt, crypto.transposition_encrypt, text),
+            ('decrypt', loop_transposition_decrypt, crypto.transposition_decrypt, ciphertext),
+        ):
+            t0 = time.perf_counter()
+            expected = loop(arg, cols)
+            loop_s = time.perf_counter() - t0
+            fast(arg, cols)  # first call builds the cached permutation
+            t0 = time.perf_counter()
+            got = fast(arg, cols)
+            fast_s = time.perf_counter() - t0
+            assert got == expected, (name, cols)
+            print(f"  {name:<10} {cols:>5} {loop_s * 1000:>9.1f} {fast_s * 1000:>10.1f} {loop_s / fast_s:>7.1f}x")
+
+    print(f"  transposition_break, columns 1..{crypto.TRANSPOSITION_MAX_COLS}")
+    for length in (60, 2000, size):
+        found, elapsed = 0, 0.0
+        trials = 5
+        for _ in range(trials):
+            plaintext = make_corpus(length, rng, vocab)
+            cols = rng.randint(2, min(crypto.TRANSPOSITION_MAX_COLS, max(2, length // 4)))
+            t0 = time.perf_counter()
+            _, got = crypto.transposition_break(crypto.transposition_encrypt(plaintext, cols))
+            elapsed += time.perf_counter() - t0
+            found += got == cols
+        print(f"  {length:>9} chars: {found}/{trials} key found, {elapsed / trials * 1000:.1f} ms per sweep")
+
+def timed(fn, text, budget):
+    runs, t0 = 0, time.perf_counter()
+    while True:
+        fn(text)
+        runs += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= budget:
+            return elapsed / runs
+
+def main():
+    parser = argparse.ArgumentParser(description="Classical cipher benchmark")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 10_000, 10_000_000])
+    parser.add_argument('--budget', type=float, default=0.5, help="seconds per measurement")
+    parser.add_argument('--messages', type=int, default=1_000_000, help="batch size (0 to skip)")
+    parser.add_argument('--breaks', type=int, default=2000, help="caesar_break messages (0 to skip)")
+    parser.add_argument('--corpora', nargs='*', type=int, default=[1000, 10_000, 100_000, 1_000_000],
+                        help="vigenere_break corpus sizes")
+    parser.add_argument('--trials', type=int, default=20, help="vigenere_break keys per corpus size")
+    parser.add_argument('--subst-lengths', nargs='*', type=int, default=[200, 500, 1000, 5000])
+    parser.add_argument('--subst-workers', nargs='+', type=int, default=[1, 2, 4, 8])
+    parser.add_argument('--subst-trials', type=int, default=10)
+    parser.add_argument('--subst-budget', type=float, default=2.0)
+    parser.add_argument('--transposition-size', type=int, default=1_000_000, help="0 to skip")
+    args = parser.parse_args()
+
+    check_edge_cases()
+    rng = random.Random(11)
+    check_batch(rng)
+    print(f"  {'cipher':<13} {'size':>10} {'loop MB/s':>10} {'table MB/s':>11} {'speedup':>8}")
+    for size in args.sizes:
+        text = make_text(size, rng)
+        for name, loop, table in CASES:
+            assert table(text) == loop(text), name
+            loop_s = timed(loop, text, args.budget)
+            table_s = timed(table, text, args.budget)
+            print(f"  {name:<13} {size:>10} {size / loop_s / 1e6:>10.2f} {size / table_s / 1e6:>11.2f}"
+                  f" {loop_s / table_s:>7.1f}x")
+    if args.messages:
+        bench_batch(args.messages, rng)
+    if args.breaks:
+        bench_caesar_break(args.breaks, rng)
+    if args.corpora:
+        bench_vigenere_break(args.corpora, args.trials, rng)
+    if args.subst_lengths:
+        bench_substitution_break(args.subst_lengths, args.subst_workers, args.subst_trials, args.subst_budget, rng)
+    if args.transposition_size:
+        bench_transposition(args.transposition_size, rng)
+
+if __name__ == "__main__":
+    main()
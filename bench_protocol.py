@@ -0,0 +1,129 @@
+# bench_protocol.py
+# Pipelined small-message throughput: legacy "one recv() = one message"
+# against the length-prefixed framing in protocol.py.
+#
+# Part 1 decodes an in-memory stream cut into TCP-sized segments.
+# Part 2 pipelines messages through a live server.py and counts how many
+# arrive intact at the receiver.
+#
+#   python bench_protocol.py --messages 20000 --engine asyncio
+import argparse
+import random
+import socket
+import threading
+import time
+import protocol
+from bench_server import free_port, start_server, stop_server
+from protocol import FrameDecoder
+
+def make_bodies(n, size):
+    rng = random.Random(7)
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    return [''.join(rng.choice(letters) for _ in range(size)).encode() for _ in range(n)]
+
+def segment(stream: bytes, mss=1460):
+    rng = random.Random(11)
+    pos = 0
+    while pos < len(stream):
+        step = rng.randint(1, mss)
+        yield stream[pos:pos + step]
+        pos += step
+
+def bench_codec(bodies):
+    legacy_stream = b''.join(b'alice|bob|' + b for b in bodies)
+    framed_stream = b''.join(protocol.message('alice', 'bob', b) for b in bodies)
+    expected = set(bodies)
+
+    t0 = time.perf_counter()
+    intact = 0
+    for chunk in segment(legacy_stream):
+        parts = chunk.decode('utf-8', errors='ignore').split('|')
+        if len(parts) >= 3 and '|'.join(parts[2:]).encode() in expected:
+            intact += 1
+    legacy_time = time.perf_counter() - t0
+    legacy_intact = intact
+
+    t0 = time.perf_counter()
+    decoder = FrameDecoder()
+    intact = 0
+    for chunk in segment(framed_stream):
+        for frame in decoder.feed(chunk):
+            if frame.body in expected:
+                intact += 1
+    framed_time = time.perf_counter() - t0
+    return (legacy_intact, legacy_time), (intact, framed_time)
+
+def _recv_until_quiet(sock, on_data, quiet=1.0):
+    sock.settimeout(quiet)
+    try:
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                return
+            on_data(data)
+    except socket.timeout:
+        pass
+
+def bench_live(engine, bodies, framed):
+    port = free_port()
+    proc = start_server(engine, port)
+    try:
+        rx = socket.create_connection(('127.0.0.1', port))
+        tx = socket.create_connection(('127.0.0.1', port))
+        if framed:
+            rx.sendall(protocol.hello('bob'))
+            tx.sendall(protocol.hello('alice'))
+        else:
+            rx.sendall(b'bob')
+            tx.sendall(b'alice')
+        time.sleep(0.3)
+
+        expected = set(bodies)
+        result = {'intact': 0, 'last': 0.0}
+        decoder = FrameDecoder()
+
+        def on_data(data):
+            if framed:
+                result['intact'] += sum(f.body in expected for f in decoder.feed(data))
+            else:
+                parts = data.decode('utf-8', errors='ignore').split('|')
+                if len(parts) >= 3 and '|'.join(parts[2:]).encode() in expected:
+                    result['intact'] += 1
+            result['last'] = time.perf_counter()
+
+        t = threading.Thread(target=_recv_until_quiet, args=(rx, on_data))
+        t.start()
+        t0 = time.perf_counter()
+        for body in bodies:
+            if framed:
+                tx.sendall(protocol.message('alice', 'bob', body))
+            else:
+                tx.sendall(b'alice|bob|' + body)
+        t.join()
+        elapsed = max(result['last'] - t0, 1e-9)
+        tx.close()
+        rx.close()
+        return result['intact'], elapsed
+    finally:
+        stop_server(proc)
+
+def main():
+    parser = argparse.ArgumentParser(description="Framing protocol throughput benchmark")
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--size', type=int, default=48, help="ciphertext bytes per message")
+    parser.add_argument('--engine', default='asyncio')
+    args = parser.parse_args()
+
+    bodies = make_bodies(args.messages, args.size)
+    n = len(bodies)
+    (li, lt), (fi, ft) = bench_codec(bodies)
+    print(f"codec  legacy: {li:>7}/{n} intact  {n / lt:>12.0f} msg/s")
+    print(f"codec  framed: {fi:>7}/{n} intact  {n / ft:>12.0f} msg/s")
+
+    for framed in (False, True):
+        intact, elapsed = bench_live(args.engine, bodies, framed)
+        name = 'framed' if framed else 'legacy'
+        print(f"live   {name}: {intact:>7}/{n} intact  {intact / elapsed:>12.0f} msg/s ({args.engine})")
+
+if __name__ == "__main__":
+    main()
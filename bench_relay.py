@@ -0,0 +1,205 @@
+# bench_relay.py
+# Threaded relay, copy mode (a new bytes object per recv, frames decoded into
+# bytes and re-encoded per message) against zerocopy mode (recv_into pooled
+# buffers; the received frame is sent to every recipient as a memoryview of
+# that buffer).
+#
+# Allocations: the server's read + handle_frame path runs in this process
+# over socketpairs and tracemalloc records the peak memory allocated while
+# one broadcast is relayed to every recipient, and the memory still held
+# after the run.
+#
+# Throughput: server.py in a subprocess (log off), senders broadcasting
+# 1 KB and 8 KB frames to a room of recipients.
+#
+#   python bench_relay.py --sizes 1024 8192 --recipients 10
+import argparse
+import os
+import random
+import socket
+import threading
+import time
+import tracemalloc
+
+os.environ.setdefault('MSECURE_LOG_SAMPLE', '0')
+import protocol
+import server
+from bench_server import free_port, start_server, stop_server
+from outbound import OutboundQueue
+from protocol import BufferPool, FrameDecoder, FrameReader
+
+MODES = ("copy", "zerocopy")
+
+def check_reader():
+    """FrameReader must agree with FrameDecoder on split, coalesced and oversized frames"""
+    rng = random.Random(7)
+    frames = [protocol.message(f"user{i}", "bob", os.urandom(rng.choice([0, 10, 5000, 200_000])))
+              for i in range(40)]
+    wire = b''.join(frames)
+    expected = FrameDecoder().feed(wire)
+    a, b = socket.socketpair()
+
+    def write():
+        pos = 0
+        while pos < len(wire):
+            step = rng.randint(1, 70_000)
+            a.sendall(wire[pos:pos + step])
+            pos += step
+        a.close()
+    threading.Thread(target=write, daemon=True).start()
+    pool = BufferPool(size=64 * 1024, keep=4)
+    reader = FrameReader(pool)
+    got = []
+    while True:
+        for f, raw in reader.frames():
+            assert protocol.encode(f) == raw
+            got.append(f._replace(body=bytes(f.body)))
+        if not reader.recv_into(b):
+            break
+    reader.close()
+    b.close()
+    assert got == expected, "FrameReader disagrees with FrameDecoder"
+    return len(got), pool.allocated
+
+def allocations(mode, size, recipients, messages):
+    """
+    One sender connection relayed single-threaded: its data is already
+    waiting when the server reads, so every allocation made for a message
+    (including recv's own buffer) falls inside that message's tracemalloc
+    window. Recipients are drained outside the window.
+    """
+    sender, conn = socket.socketpair()
+    server.routes.add(conn, "sender")
+    outs = []
+    for i in range(recipients):
+        client, peer = socket.socketpair()
+        server.routes.add(peer, f"r{i}")
+        server.routes.join(peer, "bench")
+        server.framed_clients.add(peer)
+        server.outbound[peer] = OutboundQueue(peer)
+        outs.append((client, peer))
+    frame = protocol.broadcast("sender", os.urandom(size), "bench")
+    if mode == "copy":
+        decoder = FrameDecoder()
+        read = lambda: ((f, None) for f in decoder.feed(conn.recv(server.RECV_SIZE)))
+    else:
+        reader = FrameReader(server.buffers)
+        read = lambda: (reader.recv_into(conn), reader.frames())[1]
+    sink = bytearray(256 * 1024)
+
+    def relay_one():
+        sender.sendall(frame)
+        for f, wire in read():
+            server.handle_frame(conn, "sender", "sender", f, wire)
+
+    def drain():
+        for client, _ in outs:
+            got = 0
+            while got < len(frame):
+                got += client.recv_into(sink)
+            assert got == len(frame)
+    for _ in range(20):
+        relay_one()
+        drain()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    peaks = []
+    for _ in range(messages):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        relay_one()
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        drain()
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    for _ in range(messages):
+        relay_one()
+        drain()
+    rate = messages / (time.perf_counter() - t0)
+    if mode != "copy":
+        reader.close()
+    for client, peer in outs + [(sender, conn)]:
+        server.routes.remove(peer)
+        server.framed_clients.discard(peer)
+        server.outbound.pop(peer, None)
+        client.close()
+        peer.close()
+    peaks.sort()
+    return peaks[len(peaks) // 2], peaks[-1], held, rate
+
+def throughput(mode, size, recipients, senders, messages):
+    port = free_port()
+    proc = start_server("threaded", port, ["--relay", mode], env={"MSECURE_LOG_SAMPLE": "0"})
+    try:
+        receivers = []
+        for i in range(recipients):
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(protocol.hello(f"r{i}") + protocol.join("bench"))
+            receivers.append(sock)
+        sources = []
+        for i in range(senders):
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(protocol.hello(f"s{i}"))
+            sources.append(sock)
+        time.sleep(0.5)
+        payload = os.urandom(size)
+        frames = [protocol.broadcast(f"s{i}", payload, "bench") for i in range(senders)]
+        expected = messages * sum(len(f) for f in frames)
+
+        def receive(sock):
+            buf = bytearray(256 * 1024)
+            got = 0
+            while got < expected:
+                n = sock.recv_into(buf)
+                if not n:
+                    break
+                got += n
+
+        def send(sock, frame):
+            for _ in range(messages):
+                sock.sendall(frame)
+        threads = [threading.Thread(target=receive, args=(s,)) for s in receivers]
+        threads += [threading.Thread(target=send, args=(s, f)) for s, f in zip(sources, frames)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        for sock in receivers + sources:
+            sock.close()
+    finally:
+        stop_server(proc)
+    delivered = senders * messages * recipients
+    return delivered / elapsed, delivered * size / elapsed / 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Zero-copy relay benchmarks")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1024, 8192])
+    parser.add_argument('--recipients', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=500, help="messages relayed per allocation run")
+    parser.add_argument('--senders', type=int, default=4)
+    parser.add_argument('--throughput-messages', type=int, default=2000, help="messages per sender, 0 skips")
+    args = parser.parse_args()
+
+    frames, allocated = check_reader()
+    print(f"FrameReader: {frames} split/oversized frames match FrameDecoder ({allocated} pooled buffers)")
+
+    print(f"allocations, broadcast to {args.recipients} recipients (tracemalloc)")
+    print(f"  {'size':>6} {'mode':<9} {'peak p50 KB/msg':>15} {'peak max KB':>11} {'held KB':>8} {'msgs/s':>8}")
+    for size in args.sizes:
+        for mode in MODES:
+            p50, peak, held, rate = allocations(mode, size, args.recipients, args.messages)
+            print(f"  {size:>6} {mode:<9} {p50 / 1024:>15.2f} {peak / 1024:>11.2f} {held / 1024:>8.1f} {rate:>8.0f}")
+
+    if args.throughput_messages:
+        print(f"throughput, {args.senders} senders -> room of {args.recipients} ({os.cpu_count()} CPUs)")
+        print(f"  {'size':>6} {'mode':<9} {'delivered/s':>11} {'MB/s':>8}")
+        for size in args.sizes:
+            for mode in MODES:
+                rate, mb = throughput(mode, size, args.recipients, args.senders, args.throughput_messages)
+                print(f"  {size:>6} {mode:<9} {rate:>11.0f} {mb:>8.1f}")
+
+if __name__ == "__main__":
+    main()
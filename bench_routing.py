@@ -0,0 +1,70 @@
+# bench_routing.py
+# Bytes the server sends per message as the number of connected clients
+# grows. Direct messages go through the routing table and should stay flat;
+# explicit broadcasts (and legacy clients) fan out to everyone.
+#
+#   python bench_routing.py --clients 10 100 1000 --engine asyncio
+import argparse
+import asyncio
+import protocol
+from bench_server import CONNECT_BATCH, free_port, raise_fd_limit, start_server, stop_server
+
+async def _count_bytes(reader, totals, idx, quiet):
+    while True:
+        try:
+            chunk = await asyncio.wait_for(reader.read(65536), quiet)
+        except asyncio.TimeoutError:
+            return
+        if not chunk:
+            return
+        totals[idx] += len(chunk)
+
+async def run(port, n_clients, messages, mode, quiet=1.0):
+    conns = []
+    for start in range(0, n_clients, CONNECT_BATCH):
+        batch = range(start, min(n_clients, start + CONNECT_BATCH))
+        conns += await asyncio.gather(*(asyncio.open_connection('127.0.0.1', port) for _ in batch))
+    for i, (_, writer) in enumerate(conns):
+        writer.write(protocol.hello(f"user{i}"))
+    await asyncio.gather(*(w.drain() for _, w in conns))
+    await asyncio.sleep(0.5 + n_clients / 5000)
+
+    totals = [0] * n_clients
+    readers = [asyncio.create_task(_count_bytes(r, totals, i, quiet)) for i, (r, _) in enumerate(conns)]
+    sender = conns[0][1]
+    body = b'K' * 64
+    for _ in range(messages):
+        if mode == 'direct':
+            sender.write(protocol.message('user0', 'user1', body))
+        else:
+            sender.write(protocol.broadcast('user0', body))
+    await sender.drain()
+    await asyncio.gather(*readers)
+    for _, writer in conns:
+        writer.close()
+    return sum(totals) / messages
+
+def main():
+    parser = argparse.ArgumentParser(description="Routing fan-out benchmark")
+    parser.add_argument('--clients', nargs='+', type=int, default=[10, 100, 1000])
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--engine', default='asyncio')
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    frame_size = len(protocol.message('user0', 'user1', b'K' * 64))
+    print(f"frame size: {frame_size} bytes ({args.engine} engine)")
+    print(f"{'clients':>7} {'direct B/msg':>14} {'broadcast B/msg':>16}")
+    for n in args.clients:
+        row = []
+        for mode in ('direct', 'broadcast'):
+            port = free_port()
+            proc = start_server(args.engine, port)
+            try:
+                row.append(asyncio.run(run(port, n, args.messages, mode)))
+            finally:
+                stop_server(proc)
+        print(f"{n:>7} {row[0]:>14.0f} {row[1]:>16.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# bench_rsa.py
+# RSA benchmarks.
+#
+# Decryption: decrypts/sec with the old (d, n) private key (one full-size
+# pow mod n) against the CRT key (two half-size pows mod p and q), at 1024,
+# 2048 and 4096 bits; and the recursive extended_gcd modular inverse against
+# pow(a, -1, m).
+#
+# Hybrid: round-trip throughput for 1 KB - 1 MB messages, rsa_hybrid with a
+# cached per-conversation session key and with a fresh key per message,
+# against pure RSA over chunks that fit the modulus.
+#
+# Keygen: time distribution for finding p and q at 1024, 2048 and 3072 bits,
+# the original random-odd-number search against the sieved search, on one
+# process and with p and q searched in parallel.
+#
+# Key pool: a warm KeyPool drained faster than it refills. Reports the hit
+# rate and handout latency for hits against misses; checks that no keypair
+# is handed out twice, that the pool refills afterwards, and that a pool
+# reopened from disk does not reissue keys handed out before the restart.
+#
+#   python bench_rsa.py --bits 1024 2048 4096 --hybrid-sizes 1000 10000 100000 1000000
+#   python bench_rsa.py --bits --hybrid-sizes --keygen-bits 1024 2048 3072 --keygen-trials 20
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import crypto
+from keypool import KeyPool
+
+def recursive_extended_gcd(a, b):
+    # original crypto.extended_gcd
+    if a == 0:
+        return b, 0, 1
+    g, y, x = recursive_extended_gcd(b % a, a)
+    return g, x - (b // a) * y, y
+
+def loop_generate_prime(bits):
+    # original crypto.generate_prime
+    while True:
+        n = random.getrandbits(bits)
+        if n % 2 == 0:
+            n += 1
+        if crypto.is_prime(n):
+            return n
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def rate(fn, budget):
+    runs, t0 = 0, time.perf_counter()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= budget:
+            return runs / elapsed
+
+def bench_decrypt(bits, budget):
+    t0 = time.perf_counter()
+    public_key, private_key = crypto.generate_keypair(bits)
+    keygen_s = time.perf_counter() - t0
+    message = "meet me at the old bridge at dawn"
+    ciphertexts = [crypto.rsa_encrypt(f"{message} #{i}", public_key) for i in range(16)]
+    old_key = (private_key.d, private_key.n)
+    for i, c in enumerate(ciphertexts):
+        assert crypto.rsa_decrypt(c, private_key) == crypto.rsa_decrypt(c, old_key) == f"{message} #{i}"
+    it = iter(range(sys.maxsize))
+    old = rate(lambda: crypto.rsa_decrypt(ciphertexts[next(it) % 16], old_key), budget)
+    new = rate(lambda: crypto.rsa_decrypt(ciphertexts[next(it) % 16], private_key), budget)
+    return keygen_s, old, new
+
+def bench_inverse(bits, count):
+    rng = random.Random(bits)
+    pairs = []
+    while len(pairs) < count:
+        m = rng.getrandbits(bits) | 1
+        a = rng.randrange(2, m)
+        if crypto.gcd(a, m) == 1:
+            pairs.append((a, m))
+    t0 = time.perf_counter()
+    new = [crypto.mod_inverse(a, m) for a, m in pairs]
+    new_s = time.perf_counter() - t0
+    assert all(a * x % m == 1 for (a, m), x in zip(pairs, new))
+    t0 = time.perf_counter()
+    old = []
+    try:
+        for a, m in pairs:
+            g, x, _ = recursive_extended_gcd(a, m)
+            old.append((x % m + m) % m)
+    except RecursionError:
+        return None, count / new_s
+    old_s = time.perf_counter() - t0
+    assert old == new
+    return count / old_s, count / new_s
+
+def chunked_rsa_encrypt(text, public_key):
+    # the largest whole number of ASCII characters below n
+    size = (public_key[1].bit_length() - 1) // 8
+    return [crypto.rsa_encrypt(text[i:i + size], public_key) for i in range(0, len(text), size)]
+
+def chunked_rsa_decrypt(chunks, private_key):
+    return ''.join(crypto.rsa_decrypt(c, private_key) for c in chunks)
+
+def bench_hybrid(bits, sizes, budget):
+    public_key, private_key = crypto.generate_keypair(bits)
+    modes = {
+        'rsa_hybrid, cached key': (
+            lambda t: crypto.encrypt(t, public_key, 'rsa_hybrid', ('alice', 'bob')),
+            lambda c: crypto.decrypt(c, private_key, 'rsa_hybrid')),
+        'rsa_hybrid, key per msg': (
+            lambda t: crypto.encrypt(t, public_key, 'rsa_hybrid'),
+            lambda c: crypto.decrypt(c, private_key, 'rsa_hybrid')),
+        'chunked pure RSA': (
+            lambda t: chunked_rsa_encrypt(t, public_key),
+            lambda c: chunked_rsa_decrypt(c, private_key)),
+    }
+    print(f"round trips, {bits}-bit key")
+    print(f"  {'size':>8} {'mode':<24} {'msgs/s':>9} {'MB/s':>8} {'wire bytes':>11}")
+    for size in sizes:
+        text = ("meet me at the old bridge at dawn " * (size // 34 + 1))[:size]
+        for name, (enc, dec) in modes.items():
+            if name.startswith('rsa_hybrid, key per'):
+                # a fresh key per message must not be unwrapped from the cache
+                crypto._rsa_unwrap.cache_clear()
+            ciphertext = enc(text)
+            assert dec(ciphertext) == text, name
+            wire = len(ciphertext) if isinstance(ciphertext, str) else sum(map(len, ciphertext))
+
+            def round_trip():
+                if name.startswith('rsa_hybrid, key per'):
+                    crypto._rsa_unwrap.cache_clear()
+                dec(enc(text))
+            per_sec = rate(round_trip, budget)
+            print(f"  {size:>8} {name:<24} {per_sec:>9.2f} {per_sec * size / 1e6:>8.2f} {wire:>11}")
+
+def bench_keygen(bits, trials, workers):
+    modes = {
+        'random odd numbers': lambda: (loop_generate_prime(bits // 2), loop_generate_prime(bits // 2)),
+        'sieved, 1 process': lambda: crypto._generate_primes(bits // 2, 1),
+        f'sieved, p || q ({workers} procs)': lambda: crypto._generate_primes(bits // 2, workers),
+    }
+    crypto._generate_primes(64, workers)  # start the worker processes outside the timings
+    for name, find in modes.items():
+        times, short = [], 0
+        for _ in range(trials):
+            t0 = time.perf_counter()
+            p, q = find()
+            times.append(time.perf_counter() - t0)
+            short += (p * q).bit_length() != bits
+        print(f"  {bits:>5} {name:<28} {percentile(times, 50):>8.3f} {percentile(times, 90):>8.3f}"
+              f" {max(times):>8.3f} {short:>6}/{trials}")
+
+def bench_keypool(bits, size, requests, interval):
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_keypool_'), 'keypool.json')
+    pool = KeyPool(size=size, bits=[bits], path=path)
+    t0 = time.perf_counter()
+    assert pool.wait_full(600)
+    warm_s = time.perf_counter() - t0
+    print(f"key pool, {bits}-bit keys, {size} kept ready (filled in {warm_s:.2f} s)")
+    print(f"  {'interval ms':>11} {'requests':>8} {'hits':>5} {'misses':>6} {'hit p50 ms':>10}"
+          f" {'miss p50 ms':>11} {'refill p50 ms':>13} {'refilled in s':>13}")
+    issued = set()
+    for gap in [0.0, interval]:
+        pool.wait_full(600)
+        hits, misses = pool.hits, pool.misses
+        hit_lat, miss_lat = [], []
+        for _ in range(requests):
+            before = pool.hits
+            t0 = time.perf_counter()
+            public_key, private_key = pool.get(bits)
+            (hit_lat if pool.hits > before else miss_lat).append(time.perf_counter() - t0)
+            assert public_key not in issued, "keypair handed out twice"
+            issued.add(public_key)
+            assert crypto.rsa_decrypt(crypto.rsa_encrypt("ok", public_key), private_key) == "ok"
+            time.sleep(gap)
+        t0 = time.perf_counter()
+        assert pool.wait_full(600), "pool did not refill"
+        refill_s = time.perf_counter() - t0
+        stats = pool.stats()
+        p50 = lambda lat: f"{percentile(lat, 50) * 1000:.3f}" if lat else "-"
+        print(f"  {gap * 1000:>11.0f} {requests:>8} {pool.hits - hits:>5} {pool.misses - misses:>6}"
+              f" {p50(hit_lat):>10} {p50(miss_lat):>11} {stats['refill_p50_ms']:>13.1f} {refill_s:>13.2f}")
+    pool.close()
+    reopened = KeyPool(size=size, bits=[bits], path=path)
+    restored = [reopened.get(bits)[0] for _ in range(reopened.available(bits))]
+    reopened.close()
+    assert len(restored) == size and not issued & set(restored), "restart reissued a key"
+    print(f"  restart: {len(restored)} keypairs restored from disk, none previously handed out")
+    shutil.rmtree(os.path.dirname(path))
+
+def main():
+    parser = argparse.ArgumentParser(description="RSA benchmarks")
+    parser.add_argument('--bits', nargs='*', type=int, default=[1024, 2048, 4096])
+    parser.add_argument('--budget', type=float, default=2.0, help="seconds per measurement")
+    parser.add_argument('--hybrid-bits', type=int, default=2048)
+    parser.add_argument('--hybrid-sizes', nargs='*', type=int, default=[1000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--keygen-bits', nargs='*', type=int, default=[1024, 2048, 3072])
+    parser.add_argument('--keygen-trials', type=int, default=10)
+    parser.add_argument('--keygen-workers', type=int, default=2)
+    parser.add_argument('--pool-size', type=int, default=8, help="0 skips the key pool benchmark")
+    parser.add_argument('--pool-requests', type=int, default=32)
+    parser.add_argument('--pool-interval', type=float, default=0.05, help="seconds between paced requests")
+    args = parser.parse_args()
+
+    if args.bits:
+        print(f"  {'bits':>5} {'keygen s':>9} {'(d, n) dec/s':>13} {'CRT dec/s':>10} {'speedup':>8}")
+    for bits in args.bits:
+        keygen_s, old, new = bench_decrypt(bits, args.budget)
+        print(f"  {bits:>5} {keygen_s:>9.2f} {old:>13.1f} {new:>10.1f} {new / old:>7.2f}x")
+    if args.bits:
+        print(f"  {'bits':>5} {'recursive inv/s':>16} {'pow(a, -1, m)/s':>16}")
+    for bits in args.bits:
+        old, new = bench_inverse(bits, 2000)
+        old = f"{old:>16.0f}" if old else f"{'RecursionError':>16}"
+        print(f"  {bits:>5} {old} {new:>16.0f}")
+    if args.hybrid_sizes:
+        bench_hybrid(args.hybrid_bits, args.hybrid_sizes, args.budget)
+    if args.keygen_bits and args.keygen_trials:
+        print(f"p and q search, {args.keygen_trials} trials ({os.cpu_count()} CPUs)")
+        print(f"  {'bits':>5} {'mode':<28} {'p50 s':>8} {'p90 s':>8} {'max s':>8} {'short n':>13}")
+        for bits in args.keygen_bits:
+            bench_keygen(bits, args.keygen_trials, args.keygen_workers)
+    if args.pool_size:
+        bench_keypool(1024, args.pool_size, args.pool_requests, args.pool_interval)
+
+if __name__ == "__main__":
+    main()
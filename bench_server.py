@@ -0,0 +1,311 @@
+# bench_server.py
+# Load generator for the relay server engines.
+# Starts server.py in a subprocess for each engine, connects N simulated
+# clients, has a few of them send timestamped ciphertexts and measures
+# relayed messages/sec and relay latency as seen by every receiver.
+#
+#   python bench_server.py
+#   python bench_server.py --engines asyncio --clients 100 1000 10000
+#
+# --log-modes reruns the load with the ciphertext log on (every message
+# Caesar-broken by the relay_log worker), sampled (1%) and off, using
+# text payloads so logging takes the caesar_break path.
+#
+#   python bench_server.py --clients 100 --log-modes on sampled off
+#
+# --stalled N adds N clients that connect first and never read, and compares
+# relay latency for everyone else against a run without them. Before the
+# load starts, a framed client sends each stalled client FLOOD_BYTES of
+# direct messages so its socket buffers are already full.
+#
+#   python bench_server.py --engines asyncio threaded --clients 1000 --stalled 1 --messages 500 --pad 1024
+#
+# --workers runs the threaded engine under the supervisor (server.py
+# --workers N) for each worker count. The clients are split across
+# --generators load processes so the load generator is not the bottleneck;
+# they start sending together, and every client receives every process's
+# messages, whichever worker each side landed on.
+#
+#   python bench_server.py --clients 1000 --messages 1000 --workers 1 2 4 8
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONNECT_BATCH = 500
+FLOOD_BYTES = 8 * 1024 * 1024  # direct messages to each stalled client
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+LOG_MODES = {
+    "on": {"MSECURE_LOG_SAMPLE": "1.0"},
+    "sampled": {"MSECURE_LOG_SAMPLE": "0.01"},
+    "off": {"MSECURE_LOG_SAMPLE": "0"},
+}
+
+def start_server(engine, port, extra_args=(), env=None):
+    proc = subprocess.Popen(
+        [sys.executable, 'server.py', '--engine', engine, '--port', str(port), *extra_args],
+        cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env={**os.environ, **(env or {})})
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{engine} server did not start on port {port}")
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+async def connect_stalled(port, nickname):
+    """a client that registers and then never reads (tiny receive buffer)"""
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    loop = asyncio.get_running_loop()
+    await loop.sock_connect(sock, ('127.0.0.1', port))
+    await loop.sock_sendall(sock, nickname.encode())
+    return sock
+
+async def flood(port, targets):
+    """fill the targets' socket buffers with direct messages; the writes are not drained"""
+    sys.path.insert(0, HERE)
+    import protocol
+    _, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(protocol.hello("flooder"))
+    chunk = b'0' * 65536
+    for target in targets:
+        for _ in range(FLOOD_BYTES // len(chunk)):
+            writer.write(protocol.message("flooder", target, chunk))
+    return writer
+
+def make_payload(sender_id, seq, text=False, pad=0):
+    # Long hex string so the server logs it the cheap "RSA" way; the first
+    # 16 hex digits carry the send timestamp. Text payloads are not hex, so
+    # the log runs caesar_break on them.
+    tail = " phhw ph dw wkh roug eulgjh dw gdzq" if text else '0' * (16 + pad)
+    return f"{time.perf_counter_ns():016x}{sender_id:08x}{seq:08x}{tail}\n".encode()
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+async def _reader(reader, expected, latencies, counts, idx):
+    buf = b''
+    while counts[idx] < expected:
+        chunk = await reader.read(65536)
+        if not chunk:
+            return
+        buf += chunk
+        *lines, buf = buf.split(b'\n')
+        now = time.perf_counter_ns()
+        for line in lines:
+            if len(line) >= 16:
+                latencies.append(now - int(line[:16], 16))
+                counts[idx] += 1
+
+async def run_load(port, n_clients, n_senders, messages, timeout, text=False, stalled=0, pad=0,
+                   others_sent=0, barrier=None):
+    """
+    others_sent: messages sent by other load processes, which every client
+    here receives as well. barrier: waited on (by every load process) once
+    the clients are connected, before the first message is sent.
+    """
+    # stalled clients register first, so they come first in the fan-out order
+    stalled_socks = [await connect_stalled(port, f"stalled{i}") for i in range(stalled)]
+    flooder = await flood(port, [f"stalled{i}" for i in range(stalled)]) if stalled else None
+    conns = []
+    for start in range(0, n_clients, CONNECT_BATCH):
+        batch = range(start, min(n_clients, start + CONNECT_BATCH))
+        conns += await asyncio.gather(*(asyncio.open_connection('127.0.0.1', port) for _ in batch))
+    for i, (_, writer) in enumerate(conns):
+        writer.write(f"bench{i}".encode())
+    await asyncio.gather(*(w.drain() for _, w in conns))
+    # let the server consume every nickname before traffic starts
+    await asyncio.sleep(0.5 + n_clients / 5000)
+
+    n_senders = min(n_senders, n_clients)
+    per_sender = max(1, messages // n_senders)
+    latencies = []
+    counts = [0] * n_clients
+    readers = []
+    for i, (reader, _) in enumerate(conns):
+        own = per_sender if i < n_senders else 0
+        expected = n_senders * per_sender - own + others_sent
+        readers.append(asyncio.create_task(_reader(reader, expected, latencies, counts, i)))
+
+    async def sender(i):
+        writer = conns[i][1]
+        for seq in range(per_sender):
+            writer.write(make_payload(i, seq, text, pad))
+            await writer.drain()
+            await asyncio.sleep(0.001)
+
+    if barrier is not None:
+        await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(sender(i) for i in range(n_senders)))
+    await asyncio.wait(readers, timeout=timeout)
+    elapsed = time.perf_counter() - t0
+    for task in readers:
+        task.cancel()
+    for _, writer in conns:
+        writer.close()
+    for sock in stalled_socks:
+        sock.close()
+    if flooder is not None:
+        flooder.transport.abort()
+    delivered = sum(counts)
+    return {
+        "sent": n_senders * per_sender,
+        "delivered": delivered,
+        "expected": n_senders * per_sender * (n_clients - 1) + others_sent * n_clients,
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "msgs_per_sec": delivered / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) / 1e6,
+        "p99_ms": percentile(latencies, 99) / 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay server load generator")
+    parser.add_argument('--engines', nargs='*', default=['threaded', 'asyncio'])
+    parser.add_argument('--clients', nargs='+', type=int, default=[100, 1000, 10000])
+    parser.add_argument('--senders', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=100, help="total messages sent per run")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--log-modes', nargs='*', default=[], choices=list(LOG_MODES))
+    parser.add_argument('--stalled', type=int, default=0, help="clients that never read (0 skips)")
+    parser.add_argument('--pad', type=int, default=1024, help="payload padding for the --stalled runs")
+    parser.add_argument('--policy', default=None, help="MSECURE_OUTBOUND_POLICY for the --stalled runs")
+    parser.add_argument('--workers', nargs='*', type=int, default=[], help="supervisor worker counts to compare")
+    parser.add_argument('--generators', type=int, default=min(4, os.cpu_count() or 1),
+                        help="load generator processes for the --workers runs")
+    args = parser.parse_args()
+
+    fd_limit = raise_fd_limit()
+    print(f"{'engine':<10} {'clients':>7} {'delivered':>12} {'msgs/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for engine in args.engines:
+        for n in args.clients:
+            if 2 * n + 64 > fd_limit:
+                print(f"{engine:<10} {n:>7}  skipped: fd limit {fd_limit} too low")
+                continue
+            port = free_port()
+            proc = start_server(engine, port)
+            try:
+                r = asyncio.run(run_load(port, n, args.senders, args.messages, args.timeout))
+            finally:
+                stop_server(proc)
+            print(f"{engine:<10} {n:>7} {r['delivered']:>6}/{r['expected']:<5} "
+                  f"{r['msgs_per_sec']:>10.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+    if args.log_modes:
+        print("ciphertext log, text payloads")
+        print(f"{'engine':<10} {'clients':>7} {'log':<8} {'delivered':>12} {'msgs/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for engine in args.engines:
+        for n in args.clients:
+            if not args.log_modes or 2 * n + 64 > fd_limit:
+                continue
+            for mode in args.log_modes:
+                port = free_port()
+                proc = start_server(engine, port, env=LOG_MODES[mode])
+                try:
+                    r = asyncio.run(run_load(port, n, args.senders, args.messages, args.timeout, text=True))
+                finally:
+                    stop_server(proc)
+                print(f"{engine:<10} {n:>7} {mode:<8} {r['delivered']:>6}/{r['expected']:<5} "
+                      f"{r['msgs_per_sec']:>10.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+    if args.stalled:
+        bench_stalled(args, fd_limit)
+    if args.workers:
+        bench_workers(args, fd_limit)
+
+def bench_stalled(args, fd_limit):
+    env = {"MSECURE_LOG_SAMPLE": "0"}
+    if args.policy:
+        env["MSECURE_OUTBOUND_POLICY"] = args.policy
+    print(f"stalled readers, {args.pad}-byte padding, {FLOOD_BYTES >> 20} MB of direct messages to each")
+    print(f"{'engine':<10} {'clients':>7} {'stalled':>7} {'delivered':>14} {'msgs/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for engine in args.engines:
+        for n in args.clients:
+            if 2 * (n + args.stalled) + 64 > fd_limit:
+                continue
+            for stalled in (0, args.stalled):
+                port = free_port()
+                proc = start_server(engine, port, env=env)
+                try:
+                    r = asyncio.run(run_load(port, n, args.senders, args.messages, args.timeout,
+                                             stalled=stalled, pad=args.pad))
+                finally:
+                    stop_server(proc)
+                print(f"{engine:<10} {n:>7} {stalled:>7} {r['delivered']:>7}/{r['expected']:<6} "
+                      f"{r['msgs_per_sec']:>10.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+def _generate(results, port, n_clients, n_senders, messages, others_sent, timeout, barrier):
+    """one load generator process of bench_workers"""
+    results.put(asyncio.run(run_load(port, n_clients, n_senders, messages, timeout,
+                                     others_sent=others_sent, barrier=barrier)))
+
+def bench_workers(args, fd_limit):
+    generators = max(1, args.generators)
+    senders = max(generators, args.senders)
+    per_gen = [senders // generators + (i < senders % generators) for i in range(generators)]
+    per_sender = max(1, args.messages // senders)
+    ctx = multiprocessing.get_context('fork')
+    print(f"supervisor workers, {generators} load processes, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'clients':>7} {'delivered':>16} {'msgs/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for n in args.clients:
+        if 2 * n + 64 * max(args.workers) > fd_limit:
+            print(f"{'':>7} {n:>7}  skipped: fd limit {fd_limit} too low")
+            continue
+        clients = [n // generators + (i < n % generators) for i in range(generators)]
+        sent = [s * per_sender for s in per_gen]
+        for workers in args.workers:
+            port = free_port()
+            proc = start_server("threaded", port, ["--workers", str(workers)], env={"MSECURE_LOG_SAMPLE": "0"})
+            barrier = ctx.Barrier(generators)
+            queue = ctx.Queue()
+            procs = [ctx.Process(target=_generate, args=(queue, port, clients[i], per_gen[i], sent[i],
+                                                         sum(sent) - sent[i], args.timeout, barrier))
+                     for i in range(generators)]
+            try:
+                for p in procs:
+                    p.start()
+                results = [queue.get() for _ in procs]
+                for p in procs:
+                    p.join()
+            finally:
+                stop_server(proc)
+            delivered = sum(r["delivered"] for r in results)
+            expected = sum(r["expected"] for r in results)
+            elapsed = max(r["elapsed"] for r in results)
+            latencies = [ns for r in results for ns in r["latencies"]]
+            print(f"{workers:>7} {n:>7} {delivered:>8}/{expected:<7} {delivered / elapsed:>10.0f} "
+                  f"{percentile(latencies, 50) / 1e6:>8.2f} {percentile(latencies, 99) / 1e6:>8.2f}")
+
+if __name__ == "__main__":
+    main()
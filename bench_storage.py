@@ -0,0 +1,246 @@
+# bench_storage.py
+# Message storage benchmark: the original messages.json rewrite-on-append
+# against the append-only log in message_store.py.
+#
+#   python bench_storage.py                  # 1M-message history
+#   python bench_storage.py --history 100000
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import multiprocessing
+from message_store import MessageLog, migrate_json
+from storage import FileBackend, SQLiteBackend
+
+def make_message(i):
+    return {
+        "sender": f"user{i % 97}",
+        "recipient": f"user{(i * 7) % 97}",
+        "text": f"message number {i}",
+        "ciphertext": f"phvvdjh qxpehu {i}",
+        "is_encrypted": True,
+        "timestamp": "11:35 PM",
+        "date": "2025-12-15",
+    }
+
+# --- original implementation (app.py before the message log) ---
+
+def json_load(path):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return []
+
+def json_add(path, message):
+    messages = json_load(path)
+    messages.append(message)
+    with open(path, 'w') as f:
+        json.dump(messages, f, indent=2)
+
+def bench_json_appends(tmp, history, appends):
+    path = os.path.join(tmp, 'messages.json')
+    with open(path, 'w') as f:
+        json.dump([make_message(i) for i in range(history)], f, indent=2)
+    t0 = time.perf_counter()
+    for i in range(appends):
+        json_add(path, make_message(history + i))
+    return appends / (time.perf_counter() - t0)
+
+def bench_log_appends(tmp, appends):
+    log = MessageLog(os.path.join(tmp, 'log_appends'))
+    t0 = time.perf_counter()
+    for i in range(appends):
+        log.append(make_message(i))
+    log.flush()
+    rate = appends / (time.perf_counter() - t0)
+    log.close()
+    return rate
+
+def bench_load(tmp, history):
+    path = os.path.join(tmp, 'history.json')
+    messages = [make_message(i) for i in range(history)]
+    with open(path, 'w') as f:
+        json.dump(messages, f, indent=2)
+    t0 = time.perf_counter()
+    json_load(path)
+    json_time = time.perf_counter() - t0
+
+    log = MessageLog(os.path.join(tmp, 'log_history'))
+    t0 = time.perf_counter()
+    migrate_json(path, log)
+    migrate_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    loaded = log.load()
+    log_time = time.perf_counter() - t0
+    assert len(loaded) == history
+    log.close()
+    return json_time, log_time, migrate_time
+
+def build_history(log, total, conversations, target_len=100):
+    """total messages over `conversations` chats, plus a fixed-size alice<->bob chat"""
+    every = max(1, total // target_len)
+    batch = []
+    for i in range(total):
+        c = i % conversations
+        msg = make_message(i)
+        msg["sender"], msg["recipient"] = f"u{2 * c}", f"u{2 * c + 1}"
+        if i % every == 0:
+            msg["sender"], msg["recipient"] = ("alice", "bob") if i % 2 else ("bob", "alice")
+        batch.append(msg)
+        if len(batch) == 50_000:
+            log.append_many(batch)
+            batch = []
+    log.append_many(batch)
+    log.flush()
+
+def filter_conversation(messages, current_user, active):
+    return [
+        m for m in messages
+        if (m.get("sender") == current_user and m.get("recipient") == active)
+        or (m.get("sender") == active and m.get("recipient") == current_user)
+    ]
+
+def bench_render(tmp, total, conversations, repeats=20):
+    """Render-path cost of fetching one chat: full load + filter vs the conversation index"""
+    rows = []
+    for size in sorted({max(1000, total // 100), max(1000, total // 10), total}):
+        directory = os.path.join(tmp, f'render_{size}')
+        log = MessageLog(directory)
+        build_history(log, size, conversations)
+
+        t0 = time.perf_counter()
+        expected = filter_conversation(log.load(), 'alice', 'bob')
+        scan_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        log.index.catch_up()
+        build_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            chat = log.conversation('alice', 'bob')
+        index_time = (time.perf_counter() - t0) / repeats
+        assert chat == expected
+        rows.append((size, len(chat), scan_time, index_time, build_time))
+        log.close()
+        shutil.rmtree(directory)
+    return rows
+
+def _json_add_user(path, username):
+    users = json_load(path) if os.path.exists(path) else {}
+    users[username] = "$2b$12$hash"
+    with open(path, 'w') as f:
+        json.dump(users, f, indent=2)
+
+def _open_backend(kind, tmp):
+    if kind == 'sqlite':
+        return SQLiteBackend(os.path.join(tmp, 'contention.db'))
+    return FileBackend(os.path.join(tmp, 'users.json'), os.path.join(tmp, 'log'),
+                       os.path.join(tmp, 'none.json'))
+
+def _contention_writer(kind, tmp, writer, messages, users, start):
+    start.wait()
+    errors = 0
+    backend = None if kind == 'json' else _open_backend(kind, tmp)
+    for i in range(messages):
+        msg = make_message(writer * messages + i)
+        try:
+            if kind == 'json':
+                json_add(os.path.join(tmp, 'messages.json'), msg)
+            else:
+                backend.add_message(msg)
+        except Exception:
+            errors += 1
+        if i % max(1, messages // users) == 0:
+            username = f"w{writer}_{i}"
+            try:
+                if kind == 'json':
+                    _json_add_user(os.path.join(tmp, 'users.json'), username)
+                else:
+                    backend.add_user(username, "$2b$12$hash")
+            except Exception:
+                errors += 1
+    if hasattr(backend, 'log'):
+        backend.log.flush()
+    return errors
+
+def _count_stored(kind, tmp):
+    try:
+        if kind == 'json':
+            return (len(json_load(os.path.join(tmp, 'messages.json'))),
+                    len(json_load(os.path.join(tmp, 'users.json'))))
+        backend = _open_backend(kind, tmp)
+        return len(backend.load_messages()), len(backend.load_users())
+    except Exception:
+        return 0, 0
+
+def bench_contention(tmp, kind, writers, messages, users):
+    """`writers` processes appending messages and registering users at once"""
+    directory = os.path.join(tmp, f'contention_{kind}')
+    os.makedirs(directory)
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Manager() as manager:
+        start = manager.Event()
+        with ctx.Pool(writers) as pool:
+            results = [pool.apply_async(_contention_writer, (kind, directory, w, messages, users, start))
+                       for w in range(writers)]
+            time.sleep(0.5)
+            t0 = time.perf_counter()
+            start.set()
+            errors = sum(r.get() for r in results)
+            elapsed = time.perf_counter() - t0
+    stored_messages, stored_users = _count_stored(kind, directory)
+    expected_users = writers * len(range(0, messages, max(1, messages // users)))
+    return {
+        "writes_per_sec": writers * messages / elapsed,
+        "lost_messages": writers * messages - stored_messages,
+        "lost_users": expected_users - stored_users,
+        "errors": errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Message storage benchmark")
+    parser.add_argument('--history', type=int, default=1_000_000)
+    parser.add_argument('--appends', type=int, default=20000)
+    parser.add_argument('--conversations', type=int, default=10000)
+    parser.add_argument('--writers', type=int, default=50)
+    parser.add_argument('--writer-messages', type=int, default=40)
+    parser.add_argument('--writer-users', type=int, default=4)
+    parser.add_argument('--skip', nargs='*', default=[], choices=['appends', 'load', 'render', 'contention'])
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_storage_')
+    try:
+        if 'appends' not in args.skip:
+            print("appends/sec")
+            for history in (1_000, 10_000):
+                n = max(10, 200_000 // history)
+                print(f"  messages.json rewrite, history {history:>7}: {bench_json_appends(tmp, history, n):>10.0f}")
+            print(f"  append-only log (fsync batch)          : {bench_log_appends(tmp, args.appends):>10.0f}")
+
+        if 'load' not in args.skip:
+            json_time, log_time, migrate_time = bench_load(tmp, args.history)
+            print(f"load {args.history} messages")
+            print(f"  messages.json : {json_time:.2f}s")
+            print(f"  message log   : {log_time:.2f}s (one-shot migration {migrate_time:.2f}s)")
+
+        if 'render' not in args.skip:
+            print(f"render one chat ({args.conversations} conversations)")
+            print(f"  {'store size':>10} {'chat':>5} {'load+filter':>12} {'index':>10} {'index build':>12}")
+            for size, chat, scan, index, build in bench_render(tmp, args.history, args.conversations):
+                print(f"  {size:>10} {chat:>5} {scan * 1000:>10.1f}ms {index * 1000:>8.2f}ms {build:>11.2f}s")
+
+        if 'contention' not in args.skip:
+            print(f"contention: {args.writers} writer processes x {args.writer_messages} messages")
+            print(f"  {'backend':<8} {'writes/s':>10} {'lost msgs':>10} {'lost users':>11} {'errors':>7}")
+            for kind in ('json', 'file', 'sqlite'):
+                r = bench_contention(tmp, kind, args.writers, args.writer_messages, args.writer_users)
+                print(f"  {kind:<8} {r['writes_per_sec']:>10.0f} {r['lost_messages']:>10} "
+                      f"{r['lost_users']:>11} {r['errors']:>7}")
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
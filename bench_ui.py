@@ -0,0 +1,184 @@
+# bench_ui.py
+# Chat page rerun cost without a browser: the storage reads and per-message
+# markup that app.render_messages does on every Streamlit rerun.
+# (st.markdown calls are counted, not executed; each one is a websocket
+# delta the browser also has to lay out.)
+#
+#   python bench_ui.py --messages 50000
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from bench_storage import filter_conversation, make_message
+from message_store import conversation_key
+from notifications import ChangeFeed
+from storage import FileBackend, SQLiteBackend
+
+PAGE_SIZE = 50  # app.HISTORY_PAGE_SIZE
+
+def message_markup(msg, current_user):
+    # same f-string app.render_messages builds for every message
+    sender = msg["sender"]
+    is_mine = sender == current_user
+    cls = "outgoing" if is_mine else "incoming"
+    label = "You" if is_mine else sender
+    ciphertext = msg.get("ciphertext", "[encrypted]")
+    display_cipher = ciphertext[:50] + "..." if len(ciphertext) > 50 else ciphertext
+    encrypted = f'<span class="encrypted-badge">🔒<span class="cipher-tooltip">{display_cipher}</span></span>'
+    return f'''
+        <div class="msg {cls}">
+            <div class="msg-avatar">{sender[0].upper()}</div>
+            <div class="msg-body">
+                <div class="msg-meta">{label} · {msg.get("timestamp")}</div>
+                <div class="msg-bubble">{msg['text']}{encrypted}</div>
+            </div>
+        </div>
+    '''
+
+def rerun_full(backend, me, peer):
+    """Before: whole history loaded, filtered and rendered"""
+    chat = filter_conversation(backend.load_messages(), me, peer)
+    return [message_markup(m, me) for m in chat]
+
+def rerun_window(backend, me, peer, pages=1):
+    """After: the latest pages fetched through the cursor API"""
+    window, cursor = [], None
+    for _ in range(pages):
+        page, cursor = backend.conversation_page(me, peer, PAGE_SIZE, cursor)
+        window = page + window
+        if cursor is None:
+            break
+    return [message_markup(m, me) for m in window]
+
+def timed(fn, repeats):
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        out = fn()
+    return (time.perf_counter() - t0) / repeats, len(out)
+
+def make_chat(n):
+    messages = []
+    for i in range(n):
+        msg = make_message(i)
+        msg["sender"], msg["recipient"] = ("alice", "bob") if i % 2 else ("bob", "alice")
+        messages.append(msg)
+    return messages
+
+# --- idle connected session: fixed 0.5 s polling vs the change feed ---
+
+POLL_INTERVAL = 0.5    # old chat_page: time.sleep(0.5); st.rerun()
+WAIT_SLICE = 0.25      # app.WAIT_SLICE
+IDLE_RERUN_MIN = 2.0   # app.IDLE_RERUN_MIN
+IDLE_RERUN_MAX = 30.0  # app.IDLE_RERUN_MAX
+
+def session_rerun(backend, me, peer):
+    # each rerun read users.json twice (sidebar + auth), then rendered the chat
+    backend.load_users()
+    backend.load_users()
+    return rerun_window(backend, me, peer)
+
+def simulate_session(mode, backend, feed, duration, arrivals):
+    """
+    Run one connected session for `duration` seconds while another thread
+    stores a message at each of `arrivals` (offsets in seconds). Returns
+    (CPU seconds used by the session thread, reruns, display latencies).
+    """
+    key = conversation_key('alice', 'bob')
+    sent_at = {}
+    latencies = []
+    shown = set()
+
+    def publisher(t0):
+        for i, offset in enumerate(arrivals):
+            time.sleep(max(0.0, t0 + offset - time.monotonic()))
+            msg = make_message(i)
+            msg.update(sender='bob', recipient='alice', text=f"live {i}")
+            sent_at[msg["text"]] = time.monotonic()
+            backend.add_message(msg)
+            feed.publish(key)
+
+    def rerun():
+        session_rerun(backend, 'alice', 'bob')
+        now = time.monotonic()
+        for text, t in list(sent_at.items()):
+            if text not in shown:
+                shown.add(text)
+                latencies.append(now - t)
+
+    t0 = time.monotonic()
+    pub = threading.Thread(target=publisher, args=(t0,))
+    pub.start()
+    cpu0 = time.thread_time()
+    reruns = 0
+    idle = IDLE_RERUN_MIN
+    seen = feed.version(key)
+    while time.monotonic() - t0 < duration:
+        rerun()
+        reruns += 1
+        if mode == 'poll':
+            time.sleep(POLL_INTERVAL)
+            continue
+        deadline = time.monotonic() + idle
+        while time.monotonic() < deadline:
+            version = feed.wait(key, seen, WAIT_SLICE)
+            if version != seen:
+                seen = version
+                idle = IDLE_RERUN_MIN
+                break
+        else:
+            idle = min(idle * 2, IDLE_RERUN_MAX)
+    cpu = time.thread_time() - cpu0
+    pub.join()
+    return cpu, reruns, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat page rerun benchmark")
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--idle-seconds', type=float, default=20.0)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_ui_')
+    try:
+        backends = {
+            'file': FileBackend(os.path.join(tmp, 'users.json'), os.path.join(tmp, 'log'),
+                                os.path.join(tmp, 'none.json')),
+            'sqlite': SQLiteBackend(os.path.join(tmp, 'ui.db')),
+        }
+        chat = make_chat(args.messages)
+        print(f"rerun of a {args.messages}-message chat")
+        print(f"  {'backend':<8} {'mode':<18} {'rendered':>9} {'ms/rerun':>10}")
+        for name, backend in backends.items():
+            backend.add_messages(chat)
+            if name == 'file':
+                backend.log.index.catch_up()
+            for label, fn in (
+                ('full history', lambda: rerun_full(backend, 'alice', 'bob')),
+                ('latest page', lambda: rerun_window(backend, 'alice', 'bob')),
+                ('after 4x older', lambda: rerun_window(backend, 'alice', 'bob', pages=5)),
+            ):
+                seconds, rendered = timed(fn, args.repeats)
+                print(f"  {name:<8} {label:<18} {rendered:>9} {seconds * 1000:>10.2f}")
+
+        backend = backends['file']
+        backend.save_users({f"user{i}": "$2b$12$hash" for i in range(args.users)})
+        rng = random.Random(3)
+        arrivals = sorted(rng.uniform(1, args.idle_seconds - 1) for _ in range(5))
+        print(f"connected session over {args.idle_seconds:.0f}s ({len(arrivals)} incoming messages)")
+        print(f"  {'mode':<12} {'reruns':>7} {'CPU ms/s':>9} {'display p50':>12} {'display max':>12}")
+        for mode in ('poll', 'push'):
+            cpu, reruns, lat = simulate_session(mode, backend, ChangeFeed(), args.idle_seconds, arrivals)
+            lat.sort()
+            p50 = lat[len(lat) // 2] if lat else float('nan')
+            worst = lat[-1] if lat else float('nan')
+            print(f"  {mode:<12} {reruns:>7} {cpu * 1000 / args.idle_seconds:>9.2f} "
+                  f"{p50 * 1000:>10.1f}ms {worst * 1000:>10.1f}ms")
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
@@ -2,28 +2,39 @@
 import socket
 import threading
 import json
-from crypto import encrypt, decrypt, generate_keypair
+import protocol
+from crypto import encrypt, decrypt, enable_parallel_search
+from cluster import server_address
+from keypool import get_key_pool, get_keypair
+from protocol import FrameDecoder, FRAME_MESSAGE, FRAME_BROADCAST
 
 HOST = '127.0.0.1'
 PORT = 65432
+RECV_SIZE = 65536
 
 def receiver(sock, key, method, decryption_key=None):
+    decoder = FrameDecoder()
     while True:
         try:
-            data = sock.recv(4096)
+            data = sock.recv(RECV_SIZE)
             if not data:
                 print("[*] Server closed connection")
                 break
-            ciphertext = data.decode('utf-8', errors='ignore')
-            # Decrypt locally
-            d_key = decryption_key if decryption_key is not None else key
-            plaintext = decrypt(ciphertext, d_key, method)
-            print(f"\n[RECV] (ciphertext: {ciphertext})\n[PLAINTEXT] {plaintext}\n> ", end='', flush=True)
+            for frame in decoder.feed(data):
+                if frame.type not in (FRAME_MESSAGE, FRAME_BROADCAST):
+                    continue
+                ciphertext = frame.body.decode('utf-8', errors='ignore')
+                # Decrypt locally
+                d_key = decryption_key if decryption_key is not None else key
+                plaintext = decrypt(ciphertext, d_key, method)
+                print(f"\n[RECV] from {frame.sender} (ciphertext: {ciphertext})\n[PLAINTEXT] {plaintext}\n> ", end='', flush=True)
         except Exception as e:
             print("Receive error:", e)
             break
 
 def main():
+    enable_parallel_search()
+    get_key_pool()  # start filling the RSA key pool while the user picks a cipher
     nickname = input("Choose your nickname: ").strip() or "anon"
     # choose cipher and key
     print("Choose cipher method:")
@@ -33,11 +44,39 @@ def main():
     print("4 - Transposition Cipher")
     print("5 - RSA (Public Key)")
     print("6 - Caesar Auto-Breaker")
+    print("7 - Vigenere Auto-Breaker")
+    print("8 - Substitution Auto-Breaker")
+    print("9 - Transposition Auto-Breaker")
+    print("10 - RSA Hybrid (messages of any length)")
     choice = input("Enter choice: ").strip()
     
     decryption_key = None
 
-    if choice == "6":
+    if choice == "9":
+        method = "transposition_break"
+        decryption_key = "english"
+        try:
+            key = max(1, int(input("Enter number of columns to use for SENDING: ").strip()))
+        except:
+            key = 5
+
+    elif choice == "8":
+        method = "substitution_break"
+        decryption_key = "english"
+        while True:
+            key = input("Enter substitution key to use for SENDING (26 letters): ").strip()
+            clean = ''.join([c for c in key if c.isalpha()])
+            if len(clean) == 26:
+                key = clean.upper()
+                break
+            print("Key must contain 26 letters (A-Z). Try again.")
+
+    elif choice == "7":
+        method = "vigenere_break"
+        decryption_key = "english"
+        key = input("Enter Vigenere key to use for SENDING (word): ").strip().upper() or "A"
+
+    elif choice == "6":
         method = "caesar_break"
         # Language is now defaulted to English/ignored as per request
         decryption_key = "english" 
@@ -46,10 +85,9 @@ def main():
         except:
             key = 0
 
-    elif choice == "5":
-        method = "rsa"
-        print("Generating RSA keypair (this may take a moment)...")
-        public_key, private_key = generate_keypair(1024)
+    elif choice in ("5", "10"):
+        method = "rsa" if choice == "5" else "rsa_hybrid"
+        public_key, private_key = get_keypair(1024)
         print(f"Your Public Key: (e={public_key[0]}, n={public_key[1]})")
         print("Share this with your partner.")
         
@@ -96,9 +134,10 @@ def main():
     
     print(f"Using {method} with key={key}")
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST, PORT))
-        # send nickname first (simple)
-        s.sendall(nickname.encode('utf-8'))
+        # in a cluster (MSECURE_CLUSTER_NODES), the user's home node
+        s.connect(server_address(nickname, (HOST, PORT)))
+        # send nickname first
+        s.sendall(protocol.hello(nickname))
         # start receiver thread
         t = threading.Thread(target=receiver, args=(s, key, method, decryption_key), daemon=True)
         t.start()
@@ -112,8 +151,8 @@ def main():
                     continue
                 # Encrypt locally before sending
                 try:
-                    ciphertext = encrypt(msg, key, method)
-                    s.sendall(ciphertext.encode('utf-8'))
+                    ciphertext = encrypt(msg, key, method, (nickname, None))
+                    s.sendall(protocol.broadcast(nickname, ciphertext))
                     # Also show local clear text and ciphertext
                     print(f"(sent ciphertext: {ciphertext})")
                 except Exception as e:
@@ -0,0 +1,492 @@
+# cluster.py
+# Multi-node cluster mode. Each node is a threaded server.py with its own
+# clients; nodes reach each other through a pub/sub backplane that also
+# holds the presence registry (which users are connected to which node).
+#
+#   direct message  - published to "node.<name>" for every other node the
+#                     presence registry lists for the recipient
+#   broadcast       - published to "all" (rooms are resolved by each node)
+#
+# Users are mapped to a home node by consistent hashing over the node list
+# (HashRing): client.py and app.py connect to server_address(user), so each
+# user lands on the same node and adding a node only moves ~1/N of them. The
+# presence registry keeps delivery correct wherever a user actually connected
+# (an older client, or a load balancer that is not hash-aware).
+#
+# The backplane is pluggable (Backplane); "local" is a stand-in broker
+# process speaking the protocol.py framing, enough for a cluster on one host:
+#
+#   python cluster.py broker --port 7700
+#   MSECURE_CLUSTER_NODES=a=127.0.0.1:65432,b=127.0.0.1:65433,c=127.0.0.1:65434
+#   python server.py --cluster-node a        # likewise b and c
+#   python cluster.py route alice bob        # home node of each user
+import argparse
+import bisect
+import functools
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+import protocol
+from outbound import OutboundQueue
+from protocol import BufferPool, Frame, FrameReader, FRAME_MESSAGE
+
+# name=host:port for every node, comma separated
+CLUSTER_NODES = os.environ.get('MSECURE_CLUSTER_NODES', '')
+BACKPLANE = os.environ.get('MSECURE_BACKPLANE', 'local://127.0.0.1:7700')
+RING_REPLICAS = int(os.environ.get('MSECURE_RING_REPLICAS', '128'))  # points per node on the ring
+# frames waiting for the broker (or, in the broker, for one node) before they spill to disk
+BACKPLANE_QUEUE = int(os.environ.get('MSECURE_BACKPLANE_QUEUE', '4096'))
+RECONNECT_DELAY = 1.0  # seconds between attempts to reach a lost broker
+SYNC_TIMEOUT = 10.0    # seconds to wait for the first presence snapshot
+
+ALL_CHANNEL = "all"
+
+# Backplane frames (local broker), numbered clear of the client frame types
+OP_SUBSCRIBE = 16    # recipient = channel
+OP_UNSUBSCRIBE = 17  # recipient = channel
+OP_PUBLISH = 18      # recipient = channel, body = data; the broker forwards it unchanged
+OP_ONLINE = 19       # sender = user, recipient = node; also the broker's presence event
+OP_OFFLINE = 20      # sender = user, recipient = node; also the broker's presence event
+OP_SNAPSHOT = 21     # request; the reply body is {user: [node, ...]} as JSON
+
+def node_channel(node: str) -> str:
+    return f"node.{node}"
+
+def parse_nodes(spec: str) -> Dict[str, Tuple[str, int]]:
+    """'a=127.0.0.1:65432,b=...' -> {'a': ('127.0.0.1', 65432), ...}"""
+    nodes = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, address = item.partition('=')
+        host, _, port = address.rpartition(':')
+        if not name or not host or not port.isdigit():
+            raise ValueError(f"Bad cluster node {item!r}, expected name=host:port")
+        nodes[name] = (host, int(port))
+    return nodes
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+class HashRing:
+    """
+    Consistent hashing: every node owns `replicas` points on a 64-bit ring
+    and a key belongs to the node of the first point at or after its hash.
+    Adding or removing a node only moves the keys next to its points.
+    """
+
+    def __init__(self, nodes=(), replicas: int = RING_REPLICAS):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self._nodes: Set[str] = set()
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> Set[str]:
+        return set(self._nodes)
+
+    def add(self, node: str):
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.replicas):
+            point = _ring_hash(f"{node}#{i}")
+            at = bisect.bisect_left(self._points, point)
+            self._points.insert(at, point)
+            self._owners.insert(at, node)
+
+    def remove(self, node: str):
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        keep = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in keep]
+        self._owners = [o for _, o in keep]
+
+    def node_for(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        at = bisect.bisect_left(self._points, _ring_hash(key))
+        return self._owners[at % len(self._owners)]
+
+@functools.lru_cache(maxsize=8)
+def _ring(nodes_spec: str, replicas: int) -> Tuple[HashRing, Dict[str, Tuple[str, int]]]:
+    nodes = parse_nodes(nodes_spec)
+    return HashRing(nodes, replicas), nodes
+
+def home_node(user: str, nodes_spec: str = CLUSTER_NODES) -> Optional[str]:
+    """The node consistent hashing assigns the user to (None without a cluster)"""
+    return _ring(nodes_spec, RING_REPLICAS)[0].node_for(user)
+
+def server_address(user: str, default: Tuple[str, int], nodes_spec: str = CLUSTER_NODES) -> Tuple[str, int]:
+    """Where a client for `user` connects: its home node in a cluster, otherwise default"""
+    node = home_node(user, nodes_spec)
+    return default if node is None else _ring(nodes_spec, RING_REPLICAS)[1][node]
+
+class Backplane:
+    """Interface every backplane implements: pub/sub between nodes plus the presence registry"""
+
+    def publish(self, channel: str, data):
+        """Deliver data to every subscriber of channel except this connection"""
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, callback: Callable):
+        """callback(channel, data) for every message published on channel"""
+        raise NotImplementedError
+
+    def unsubscribe(self, channel: str):
+        raise NotImplementedError
+
+    def online(self, user: str, node: str):
+        """Record that user has sessions on node"""
+        raise NotImplementedError
+
+    def offline(self, user: str, node: str):
+        raise NotImplementedError
+
+    def locate(self, user: str) -> FrozenSet[str]:
+        """Nodes the user is connected to (cached locally, no round trip)"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class LocalBackplane(Backplane):
+    """
+    Client of LocalBroker over one TCP connection. Sends go through an
+    OutboundQueue (spilling to disk rather than dropping), so a publishing
+    relay thread never waits for the broker. Presence is a local cache: a
+    snapshot on connect, then the broker's online/offline events. A lost
+    broker is reconnected and this node's subscriptions and users replayed.
+    """
+
+    def __init__(self, host: str, port: int, sync_timeout: float = SYNC_TIMEOUT):
+        self.address = (host, port)
+        self.published = 0
+        self.received = 0
+        self.lost = 0
+        self._lock = threading.Lock()
+        self._handlers: Dict[str, Callable] = {}
+        self._online: Set[Tuple[str, str]] = set()
+        self._presence: Dict[str, FrozenSet[str]] = {}
+        self._pool = BufferPool(keep=4)
+        self._queue: Optional[OutboundQueue] = None
+        self._synced = threading.Event()
+        self._closed = False
+        sock = self._connect()  # the first connection must succeed
+        threading.Thread(target=self._run, args=(sock,), name='backplane', daemon=True).start()
+        if not self._synced.wait(sync_timeout):
+            raise TimeoutError(f"No presence snapshot from broker {host}:{port}")
+
+    def _connect(self):
+        sock = socket.create_connection(self.address)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self._queue = OutboundQueue(sock, limit=BACKPLANE_QUEUE, policy="persist")
+            for channel in self._handlers:
+                self._queue.put(protocol.encode_frame(OP_SUBSCRIBE, recipient=channel))
+            for user, node in self._online:
+                self._queue.put(protocol.encode_frame(OP_ONLINE, user, node))
+            self._queue.put(protocol.encode_frame(OP_SNAPSHOT))
+        return sock
+
+    def _send(self, data):
+        queue = self._queue
+        if queue is None or not queue.put(data):
+            self.lost += 1
+
+    def publish(self, channel: str, data):
+        self.published += 1
+        self._send(protocol.encode_frame(OP_PUBLISH, recipient=channel, body=data))
+
+    def subscribe(self, channel: str, callback: Callable):
+        with self._lock:
+            self._handlers[channel] = callback
+            self._send(protocol.encode_frame(OP_SUBSCRIBE, recipient=channel))
+
+    def unsubscribe(self, channel: str):
+        with self._lock:
+            if self._handlers.pop(channel, None) is not None:
+                self._send(protocol.encode_frame(OP_UNSUBSCRIBE, recipient=channel))
+
+    def online(self, user: str, node: str):
+        with self._lock:
+            self._online.add((user, node))
+            self._send(protocol.encode_frame(OP_ONLINE, user, node))
+
+    def offline(self, user: str, node: str):
+        with self._lock:
+            self._online.discard((user, node))
+            self._send(protocol.encode_frame(OP_OFFLINE, user, node))
+
+    def locate(self, user: str) -> FrozenSet[str]:
+        return self._presence.get(user, frozenset())
+
+    def close(self):
+        self._closed = True
+        queue = self._queue
+        if queue is not None:
+            queue.close()
+
+    def _dispatch(self, frame: Frame):
+        if frame.type == OP_PUBLISH:
+            handler = self._handlers.get(frame.recipient)
+            if handler is not None:
+                self.received += 1
+                handler(frame.recipient, frame.body)
+        elif frame.type == OP_ONLINE:
+            self._presence[frame.sender] = self._presence.get(frame.sender, frozenset()) | {frame.recipient}
+        elif frame.type == OP_OFFLINE:
+            nodes = self._presence.get(frame.sender, frozenset()) - {frame.recipient}
+            if nodes:
+                self._presence[frame.sender] = nodes
+            else:
+                self._presence.pop(frame.sender, None)
+        elif frame.type == OP_SNAPSHOT:
+            state = json.loads(bytes(frame.body))
+            self._presence = {user: frozenset(nodes) for user, nodes in state.items()}
+            self._synced.set()
+
+    def _run(self, sock):
+        while True:
+            reader = FrameReader(self._pool)
+            try:
+                while reader.recv_into(sock):
+                    for frame, _ in reader.frames():
+                        self._dispatch(frame)
+            except OSError:
+                pass
+            finally:
+                reader.close()
+                sock.close()
+            if self._closed:
+                return
+            print(f"Backplane: lost broker {self.address[0]}:{self.address[1]}, reconnecting")
+            self._presence = {}
+            while not self._closed:
+                time.sleep(RECONNECT_DELAY)
+                try:
+                    sock = self._connect()
+                    break
+                except OSError:
+                    continue
+            else:
+                return
+
+class LocalBroker:
+    """
+    Stand-in broker for LocalBackplane: channels, presence and its events,
+    all in one process. Every connection has a persist-policy OutboundQueue,
+    so one slow node does not hold up the others. Published frames are
+    forwarded as received. A node's presence entries go when its connection
+    does.
+    """
+
+    def __init__(self):
+        self.published = 0
+        self.delivered = 0
+        self._lock = threading.Lock()
+        self._pool = BufferPool()
+        self._queues: Dict[socket.socket, OutboundQueue] = {}
+        self._subscribers: Dict[str, Set[socket.socket]] = {}
+        self._presence: Dict[str, Dict[str, int]] = {}  # user -> node -> announcing connections
+        self._announced: Dict[socket.socket, Set[Tuple[str, str]]] = {}
+
+    def serve(self, host: str = '127.0.0.1', port: int = 7700):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((host, port))
+            s.listen()
+            print(f"Broker listening on {host}:{port}")
+            while True:
+                conn, _ = s.accept()
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with self._lock:
+            self._queues[conn] = OutboundQueue(conn, limit=BACKPLANE_QUEUE, policy="persist")
+            self._announced[conn] = set()
+        reader = FrameReader(self._pool)
+        try:
+            while reader.recv_into(conn):
+                for frame, wire in reader.frames():
+                    self._apply(conn, frame, wire)
+        except (OSError, protocol.ProtocolError) as e:
+            print("Broker connection error:", e)
+        finally:
+            reader.close()
+            self._drop(conn)
+            conn.close()
+
+    def _apply(self, conn, frame: Frame, wire):
+        if frame.type == OP_PUBLISH:
+            with self._lock:
+                targets = [self._queues[s] for s in self._subscribers.get(frame.recipient, ()) if s is not conn]
+            self.published += 1
+            for queue in targets:
+                if queue.put(wire):
+                    self.delivered += 1
+            return
+        with self._lock:
+            if frame.type == OP_SUBSCRIBE:
+                self._subscribers.setdefault(frame.recipient, set()).add(conn)
+            elif frame.type == OP_UNSUBSCRIBE:
+                self._unsubscribe(conn, frame.recipient)
+            elif frame.type == OP_ONLINE:
+                entry = (frame.sender, frame.recipient)
+                if entry not in self._announced[conn]:
+                    self._announced[conn].add(entry)
+                    self._presence_change(entry, +1)
+            elif frame.type == OP_OFFLINE:
+                entry = (frame.sender, frame.recipient)
+                if entry in self._announced[conn]:
+                    self._announced[conn].discard(entry)
+                    self._presence_change(entry, -1)
+            elif frame.type == OP_SNAPSHOT:
+                # queued under the lock, so the events that follow it arrive after it
+                state = {user: list(nodes) for user, nodes in self._presence.items()}
+                self._queues[conn].put(protocol.encode_frame(OP_SNAPSHOT, body=json.dumps(state)))
+
+    def _unsubscribe(self, conn, channel: str):
+        members = self._subscribers.get(channel)
+        if members is not None:
+            members.discard(conn)
+            if not members:
+                del self._subscribers[channel]
+
+    def _presence_change(self, entry: Tuple[str, str], delta: int):
+        """count one connection announcing (user, node); called with the lock held"""
+        user, node = entry
+        nodes = self._presence.setdefault(user, {})
+        count = nodes.get(node, 0) + delta
+        if count > 0:
+            nodes[node] = count
+        else:
+            nodes.pop(node, None)
+            if not nodes:
+                del self._presence[user]
+        if (delta > 0 and count == 1) or count == 0:
+            event = protocol.encode_frame(OP_ONLINE if delta > 0 else OP_OFFLINE, user, node)
+            for queue in self._queues.values():
+                queue.put(event)
+
+    def _drop(self, conn):
+        with self._lock:
+            queue = self._queues.pop(conn, None)
+            for channel in [c for c, members in self._subscribers.items() if conn in members]:
+                self._unsubscribe(conn, channel)
+            for entry in self._announced.pop(conn, ()):
+                self._presence_change(entry, -1)
+        if queue is not None:
+            queue.close()
+
+BACKPLANES = {
+    'local': LocalBackplane,
+}
+
+def open_backplane(url: str = BACKPLANE) -> Backplane:
+    """Connect to the backplane at url, e.g. local://127.0.0.1:7700"""
+    scheme, _, address = url.partition('://')
+    if scheme not in BACKPLANES:
+        raise ValueError(f"Unknown backplane: {scheme}")
+    host, _, port = address.rpartition(':')
+    return BACKPLANES[scheme](host, int(port))
+
+class ClusterNode:
+    """
+    This server's membership of the cluster. The server calls update(user)
+    whenever a user's local sessions may have changed, and publish() for
+    every frame it relays from a local client; deliver(frame, wire) is
+    called for every frame another node relays to this one.
+    """
+
+    def __init__(self, name: str, nodes: Dict[str, Tuple[str, int]], backplane: Backplane,
+                 is_local: Callable[[str], bool]):
+        if name not in nodes:
+            raise ValueError(f"Node {name!r} is not in the cluster node list")
+        self.name = name
+        self.nodes = nodes
+        self.backplane = backplane
+        self.published = 0
+        self.received = 0
+        self._is_local = is_local
+        self._announced: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def start(self, deliver: Callable):
+        def receive(channel, data):
+            try:
+                frame = protocol.decode(data)
+            except protocol.ProtocolError as e:
+                print(f"Cluster: bad frame on {channel}: {e}")
+                return
+            self.received += 1
+            deliver(frame, data)
+        self.backplane.subscribe(node_channel(self.name), receive)
+        self.backplane.subscribe(ALL_CHANNEL, receive)
+
+    def update(self, user: str):
+        """Announce or withdraw the user, whichever matches the local sessions now"""
+        with self._lock:
+            local = self._is_local(user)
+            if local and user not in self._announced:
+                self._announced.add(user)
+                self.backplane.online(user, self.name)
+            elif not local and user in self._announced:
+                self._announced.discard(user)
+                self.backplane.offline(user, self.name)
+
+    def publish(self, frame: Frame, data):
+        """Pass a locally relayed frame to the nodes that may have recipients for it"""
+        if frame.type == FRAME_MESSAGE and frame.recipient:
+            for node in self.backplane.locate(frame.recipient):
+                if node != self.name:
+                    self.published += 1
+                    self.backplane.publish(node_channel(node), data)
+        else:
+            self.published += 1
+            self.backplane.publish(ALL_CHANNEL, data)
+
+    def stats(self) -> Dict:
+        return {"node": self.name, "published": self.published, "received": self.received,
+                "local_users": len(self._announced)}
+
+def start_node(name: str, nodes_spec: str, backplane_url: str, deliver: Callable,
+               is_local: Callable[[str], bool]) -> ClusterNode:
+    """Join the cluster as `name`; see ClusterNode"""
+    node = ClusterNode(name, parse_nodes(nodes_spec), open_backplane(backplane_url), is_local)
+    node.start(deliver)
+    return node
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Secured Messenger cluster tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+    broker = commands.add_parser('broker', help="run the local stand-in broker")
+    broker.add_argument('--host', default='127.0.0.1')
+    broker.add_argument('--port', type=int, default=7700)
+    route = commands.add_parser('route', help="print each user's home node")
+    route.add_argument('users', nargs='+')
+    route.add_argument('--nodes', default=CLUSTER_NODES, help="name=host:port,... (MSECURE_CLUSTER_NODES)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'broker':
+        try:
+            LocalBroker().serve(args.host, args.port)
+        except KeyboardInterrupt:
+            pass
+    else:
+        nodes = parse_nodes(args.nodes)
+        if not nodes:
+            parser.error("no cluster nodes: pass --nodes or set MSECURE_CLUSTER_NODES")
+        for user in args.users:
+            node = home_node(user, args.nodes)
+            host, port = nodes[node]
+            print(f"{user} -> {node} ({host}:{port})")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,20 @@
 # crypto.py
 # Simple Caesar cipher implementation, handles upper/lower letters.
-from typing import Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
 import random
+import secrets
+import string
+import threading
+import time
+import numpy as np
 
 # Task 1: Caesar Breaker
 def load_words():
@@ -15,33 +28,342 @@ COMMON_WORDS = load_words()
 
 def caesar_break(ciphertext: str, language: str = 'english') -> Tuple[str, int]:
     """
-    Brute-force Caesar cipher and return the most likely plaintext and the key used.
+    Find the most likely Caesar shift and return the plaintext and the key used.
+    Each ciphertext word votes for the shifts that turn it into a dictionary
+    word; the first shift with the most votes wins, exactly as if all 26
+    decryptions had been scored. Text without any dictionary hit falls back
+    to letter-frequency (chi-squared) scoring.
     """
     # We ignore the language parameter as requested and focus on English
-    vocab = COMMON_WORDS
-    best_score = -1
-    best_text = ""
-    best_key = 0
-
-    for key in range(26):
-        # Decrypt with this key
-        candidate = caesar_decrypt(ciphertext, key)
-        
-        # Score candidate
-        words = candidate.split()
-        score = 0
-        for word in words:
-            # clean word
-            clean_word = ''.join(c for c in word if c.isalpha()).lower()
-            if clean_word in vocab:
-                score += 1
-        
-        if score > best_score:
-            best_score = score
-            best_text = candidate
-            best_key = key
-            
-    return best_text, best_key
+    votes = [0] * 26
+    if ciphertext.isascii():
+        for word in ciphertext.translate(_DROP_PUNCTUATION).lower().split():
+            first = ord(word[0]) - ord('a')
+            for offset in _WORD_INDEX.get(word.translate(_CAESAR_TABLES[-first % 26]), ()):
+                votes[(first - offset) % 26] += 1
+    else:
+        for word in ciphertext.split():
+            word = ''.join(c for c in word if c.isalpha())
+            if not word:
+                continue  # scores the same under every shift
+            if word.isascii():
+                word = word.lower()
+                first = ord(word[0]) - ord('a')
+                for offset in _WORD_INDEX.get(word.translate(_CAESAR_TABLES[-first % 26]), ()):
+                    votes[(first - offset) % 26] += 1
+            else:
+                # non-ASCII letters are not shifted, so check each shift directly
+                for key in range(26):
+                    if caesar_decrypt(word, key).lower() in COMMON_WORDS:
+                        votes[key] += 1
+
+    best = max(votes)
+    best_key = votes.index(best) if best > 0 else int(np.argmin(_chi_squared(_letter_counts(ciphertext))))
+    return caesar_decrypt(ciphertext, best_key), best_key
+
+# Vigenere breaker
+VIGENERE_MAX_PERIOD = 20
+# period statistics use at most this many letters; candidates are compared
+# on the decryption of this many leading characters
+_STATS_LETTERS = 100_000
+_SCORE_CHARS = 2000
+
+def _letter_stream(text: str) -> np.ndarray:
+    """
+    0..25 for every letter vigenere_encrypt advances the key on, in order
+    (-1 for non-ASCII letters, which keep their key position but are not counted)
+    """
+    codes, _ = _pack([text])
+    alpha, _ = _letter_classes(codes)
+    letters = codes[alpha].astype(np.int64)
+    return np.where(letters < 128, (letters | 0x20) - ord('a'), -1)
+
+def _column_counts(stream: np.ndarray, periods: np.ndarray) -> np.ndarray:
+    """
+    Letter counts of every key-position column for every period at once:
+    (sum(periods), 26), the columns of periods[0] first.
+    """
+    pos = np.flatnonzero(stream >= 0)
+    first_column = np.concatenate(([0], np.cumsum(periods)[:-1]))
+    idx = (first_column[:, None] + pos[None, :] % periods[:, None]) * 26 + stream[pos][None, :]
+    return np.bincount(idx.ravel(), minlength=int(periods.sum()) * 26).reshape(-1, 26)
+
+def _index_of_coincidence(counts: np.ndarray, periods: np.ndarray) -> np.ndarray:
+    """average column index of coincidence per period (English ~0.066, random ~0.038)"""
+    n = counts.sum(axis=1)
+    column_ioc = (counts * (counts - 1)).sum(axis=1) / np.maximum(n * (n - 1), 1)
+    period_of_column = np.repeat(np.arange(len(periods)), periods)
+    return np.bincount(period_of_column, weights=column_ioc) / periods
+
+def _kasiski(stream: np.ndarray, periods: np.ndarray) -> np.ndarray:
+    """
+    Share of distances between repeated trigrams that each period divides,
+    relative to the 1/period expected by chance.
+    """
+    if len(stream) < 3:
+        return np.zeros(len(periods))
+    a, b, c = stream[:-2], stream[1:-1], stream[2:]
+    ok = (a >= 0) & (b >= 0) & (c >= 0)
+    pos = np.flatnonzero(ok)
+    trigrams = (a * 676 + b * 26 + c)[ok]
+    order = np.argsort(trigrams, kind='stable')
+    trigrams, pos = trigrams[order], pos[order]
+    distances = (pos[1:] - pos[:-1])[trigrams[1:] == trigrams[:-1]][:20_000]
+    if len(distances) == 0:
+        return np.zeros(len(periods))
+    return (distances[None, :] % periods[:, None] == 0).mean(axis=1) * periods
+
+def _dictionary_hits(text: str) -> int:
+    return sum(''.join(c for c in word if c.isalpha()).lower() in COMMON_WORDS for word in text.split())
+
+def _shortest_repeat(key: str) -> str:
+    for size in range(1, len(key)):
+        if len(key) % size == 0 and key[:size] * (len(key) // size) == key:
+            return key[:size]
+    return key
+
+def vigenere_break(ciphertext: str, language: str = 'english',
+                   max_period: int = VIGENERE_MAX_PERIOD) -> Tuple[str, str]:
+    """
+    Recover a Vigenere key without knowing it; returns (plaintext, key).
+    Candidate key lengths come from the index of coincidence and Kasiski
+    trigram distances, each key letter is the chi-squared best shift of its
+    column, and the candidate whose decryption has the most dictionary words
+    wins (ties go to the shorter key).
+    """
+    stream = _letter_stream(ciphertext)
+    letters = int((stream >= 0).sum())
+    if letters == 0:
+        return ciphertext, 'A'
+    periods = np.arange(1, max(1, min(max_period, letters // 2)) + 1)
+    sample = stream[:_STATS_LETTERS]
+    counts = _column_counts(sample, periods)
+
+    if letters <= 10 * len(periods):
+        # too short for the statistics to mean much: try every key length
+        candidates = set(periods.tolist())
+    else:
+        ioc = _index_of_coincidence(counts, periods)
+        kasiski = _kasiski(sample, periods)
+        candidates = set(periods[np.argsort(-ioc, kind='stable')[:3]].tolist())
+        candidates.add(int(periods[np.argmax(ioc >= 0.9 * ioc.max())]))
+        candidates.update(periods[1:][np.argsort(-kasiski[1:], kind='stable')[:2]].tolist())
+
+    candidates = np.array(sorted(candidates))
+    if len(sample) < len(stream):
+        counts = _column_counts(stream, candidates)
+    else:
+        counts = counts[np.concatenate([np.arange(p * (p - 1) // 2, p * (p + 1) // 2) for p in candidates])]
+    first_column = np.concatenate(([0], np.cumsum(candidates)[:-1]))
+    prefix = ciphertext[:_SCORE_CHARS]
+    best = None
+    for period, start in zip(candidates.tolist(), first_column.tolist()):
+        shifts = _chi_squared(counts[start:start + period]).argmin(axis=1)
+        key = ''.join(chr(ord('A') + int(k)) for k in shifts)
+        score = _dictionary_hits(vigenere_decrypt(prefix, key))
+        if best is None or score > best[0]:
+            best = (score, key)
+    key = _shortest_repeat(best[1])
+    return vigenere_decrypt(ciphertext, key), key
+
+# Substitution breaker: hill climbing over key permutations, scored with
+# English trigram log-probabilities over letters plus a word-boundary symbol
+# (the cipher leaves spaces and punctuation in place, so word breaks are known).
+SUBSTITUTION_TIME_BUDGET = float(os.environ.get('MSECURE_SUBST_BUDGET', '2.0'))
+# 1 = search in the calling process; entry points opt in to worker processes
+# with enable_parallel_search()
+SUBSTITUTION_WORKERS = int(os.environ.get('MSECURE_SUBST_WORKERS', '1'))
+_BOUNDARY = 26
+
+@lru_cache(maxsize=1)
+def _trigram_table() -> np.ndarray:
+    """
+    log P(c | a, b) for a, b, c in 0..26 (26 = word boundary), flattened to
+    a*729 + b*27 + c. Counted from english_words.txt, weighting each word by
+    1/rank since the file lists the most common words first.
+    """
+    try:
+        with open('english_words.txt', 'r') as f:
+            ranked = [w.strip().lower() for w in f]
+    except FileNotFoundError:
+        ranked = []
+    counts = np.full((27, 27, 27), 0.01)
+    starts, ends = np.zeros(27), np.zeros(27)
+    for rank, word in enumerate(w for w in ranked if w.isascii() and w.isalpha()):
+        weight = 1.0 / (rank + 1)
+        symbols = [_BOUNDARY] + [ord(c) - ord('a') for c in word] + [_BOUNDARY]
+        for a, b, c in zip(symbols, symbols[1:], symbols[2:]):
+            counts[a, b, c] += weight
+        starts[symbols[1]] += weight
+        ends[symbols[-2]] += weight
+    # last letter, boundary, first letter of the next word
+    if starts.sum():
+        counts[:, _BOUNDARY, :] += np.outer(ends, starts) / starts.sum()
+    return np.log(counts / counts.sum(axis=2, keepdims=True)).ravel()
+
+def _cipher_trigrams(ciphertext: str) -> Tuple[np.ndarray, np.ndarray]:
+    """distinct ciphertext trigrams (n, 3) over 0..26 and how often each occurs"""
+    raw = np.frombuffer(ciphertext.encode('ascii', 'ignore').lower(), dtype=np.uint8).astype(np.int64) - ord('a')
+    symbols = np.where((raw >= 0) & (raw < 26), raw, _BOUNDARY)
+    # runs of spaces and punctuation are one word break
+    keep = np.ones(len(symbols), dtype=bool)
+    keep[1:] = (symbols[1:] != _BOUNDARY) | (symbols[:-1] != _BOUNDARY)
+    symbols = np.concatenate(([_BOUNDARY], symbols[keep], [_BOUNDARY]))
+    if len(symbols) < 3:
+        return np.zeros((0, 3), dtype=np.int64), np.zeros(0)
+    trigrams = np.stack([symbols[:-2], symbols[1:-1], symbols[2:]], axis=1)
+    unique, counts = np.unique(trigrams, axis=0, return_counts=True)
+    return unique, counts.astype(np.float64)
+
+def _substitution_climb(trigrams, counts, seed: int, deadline: float) -> Tuple[float, List[int]]:
+    """
+    Random-restart hill climbing until the deadline (or until the best key
+    has been reached from three different starts). `plain[c]` is the
+    plaintext letter for ciphertext letter c; returns (score, plain).
+    """
+    table = _trigram_table()
+    rng = random.Random(seed)
+    present = sorted(set(trigrams.ravel().tolist()) - {_BOUNDARY})
+    pairs = [(a, b) for a in present for b in range(26) if b != a and (b not in present or b > a)]
+    letter_counts = np.bincount(trigrams[:, 1], weights=counts, minlength=27)[:26]
+
+    def score(plain):
+        mapped = plain[trigrams]
+        return float(counts @ table[mapped[:, 0] * 729 + mapped[:, 1] * 27 + mapped[:, 2]])
+
+    best, best_plain, reached = -np.inf, None, 0
+    restart = 0
+    while time.monotonic() < deadline and reached < 3:
+        plain = np.empty(27, dtype=np.int64)
+        plain[_BOUNDARY] = _BOUNDARY
+        # first start: most frequent ciphertext letter -> 'e' and so on
+        plain[np.argsort(-letter_counts, kind='stable')] = np.argsort(-_ENGLISH_FREQ, kind='stable')
+        if restart > 0:
+            for _ in range(rng.randint(3, 12)):
+                a, b = rng.randrange(26), rng.randrange(26)
+                plain[a], plain[b] = plain[b], plain[a]
+        restart += 1
+        current = score(plain)
+        improved = True
+        while improved and time.monotonic() < deadline:
+            improved = False
+            rng.shuffle(pairs)
+            for a, b in pairs:
+                plain[a], plain[b] = plain[b], plain[a]
+                candidate = score(plain)
+                if candidate > current + 1e-9:
+                    current, improved = candidate, True
+                else:
+                    plain[a], plain[b] = plain[b], plain[a]
+        if current > best + 1e-6:
+            best, best_plain, reached = current, plain[:26].tolist(), 1
+        elif abs(current - best) <= 1e-6:
+            reached += 1
+    return best, best_plain
+
+_process_pools = {}
+_process_lock = threading.Lock()
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    """shared worker processes for the CPU-bound searches (breakers, keygen)"""
+    with _process_lock:
+        if workers not in _process_pools:
+            # callers run in threaded processes (key pool refill, Streamlit,
+            # receivers): start workers from a clean process, never by fork
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            _process_pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _process_pools[workers]
+
+def _run_on_pool(workers: int, fn, calls: List[tuple]) -> Optional[list]:
+    """
+    fn(*args) for each args in calls on the shared worker processes, or None
+    if the pool broke (a worker died, e.g. the importing script starts work
+    at import time): the broken pool is dropped so the next call starts a
+    fresh one, and the caller searches serially instead.
+    """
+    pool = _process_pool(workers)
+    try:
+        return [f.result() for f in [pool.submit(fn, *args) for args in calls]]
+    except BrokenProcessPool:
+        with _process_lock:
+            if _process_pools.get(workers) is pool:
+                del _process_pools[workers]
+        pool.shutdown(wait=False)
+        print("Worker processes failed; searching in this process instead")
+        return None
+
+def enable_parallel_search():
+    """
+    Let the breakers and key generation use worker processes (unless set by
+    MSECURE_SUBST_WORKERS / MSECURE_KEYGEN_WORKERS). Workers re-import the
+    main script, so only call this from an entry point whose script keeps
+    its work under `if __name__ == "__main__"`.
+    """
+    global SUBSTITUTION_WORKERS, KEYGEN_WORKERS
+    cpus = os.cpu_count() or 1
+    if 'MSECURE_SUBST_WORKERS' not in os.environ:
+        SUBSTITUTION_WORKERS = cpus
+    if 'MSECURE_KEYGEN_WORKERS' not in os.environ:
+        KEYGEN_WORKERS = min(2, cpus)
+
+def substitution_break(ciphertext: str, language: str = 'english',
+                       time_budget: float = None, workers: int = None) -> Tuple[str, str]:
+    """
+    Recover a substitution key without knowing it; returns (plaintext, key).
+    Hill-climbing restarts run on `workers` processes and the best-scoring
+    key across them wins; the whole search stops within `time_budget` seconds.
+    """
+    time_budget = SUBSTITUTION_TIME_BUDGET if time_budget is None else time_budget
+    workers = SUBSTITUTION_WORKERS if workers is None else workers
+    trigrams, counts = _cipher_trigrams(ciphertext)
+    if len(trigrams) == 0:
+        return ciphertext, _UPPER
+    start = time.monotonic()
+    # the last quarter of the budget is kept for the dictionary pass
+    deadline = start + 0.75 * time_budget
+    seeds = [random.getrandbits(32) for _ in range(max(1, workers))]
+    results = None
+    if workers > 1:
+        # time.monotonic() is system-wide, so the deadline holds in the workers
+        results = _run_on_pool(workers, _substitution_climb,
+                               [(trigrams, counts, seed, deadline) for seed in seeds])
+    if results is None:
+        results = [_substitution_climb(trigrams, counts, seeds[0], deadline)]
+    _, plain = max(results, key=lambda r: r[0])
+    # substitution keys list the ciphertext letter for each plaintext letter
+    key = [''] * 26
+    for cipher_letter, plain_letter in enumerate(plain):
+        key[plain_letter] = _UPPER[cipher_letter]
+    key = _polish_substitution_key(ciphertext, ''.join(key), start + time_budget)
+    return substitution_decrypt(ciphertext, key), key
+
+def _polish_substitution_key(ciphertext: str, key: str, deadline: float) -> str:
+    """
+    Trigrams say little about rare letters in short texts, so finish by
+    swapping pairs of key letters while that adds dictionary words.
+    """
+    sample = ciphertext[:_SCORE_CHARS]
+    present = sorted({c for c in sample.upper() if c in _UPPER})
+    # plaintext letters whose ciphertext letter occurs in the text
+    letters = [i for i in range(26) if key[i] in present]
+    best = _dictionary_hits(substitution_decrypt(sample, key))
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in letters:
+            if time.monotonic() >= deadline:
+                break
+            for j in range(26):
+                if j == i:
+                    continue
+                swapped = list(key)
+                swapped[i], swapped[j] = swapped[j], swapped[i]
+                swapped = ''.join(swapped)
+                hits = _dictionary_hits(substitution_decrypt(sample, swapped))
+                if hits > best:
+                    key, best, improved = swapped, hits, True
+    return key
 
 # Task 2: RSA Implementation
 def gcd(a, b):
@@ -50,18 +372,21 @@ def gcd(a, b):
     return a
 
 def extended_gcd(a, b):
-    if a == 0:
-        return b, 0, 1
-    else:
-        g, y, x = extended_gcd(b % a, a)
-        return g, x - (b // a) * y, y
+    """(g, x, y) with a*x + b*y == g == gcd(a, b)"""
+    # iterative, so large inputs cannot hit the recursion limit
+    x0, y0, x1, y1 = 0, 1, 1, 0
+    while a != 0:
+        q = b // a
+        a, b = b % a, a
+        x0, x1 = x1, x0 - q * x1
+        y0, y1 = y1, y0 - q * y1
+    return b, x0, y0
 
 def mod_inverse(a, m):
-    g, x, y = extended_gcd(a, m)
-    if g != 1:
+    try:
+        return pow(a, -1, m)
+    except ValueError:
         raise Exception('modular inverse does not exist')
-    else:
-        return (x % m + m) % m
 
 def is_prime(n, k=5):
     if n <= 1: return False
@@ -87,20 +412,55 @@ def is_prime(n, k=5):
             return False
     return True
 
+# Prime search: windows of consecutive odd candidates are sieved against the
+# small primes first, so Miller-Rabin only runs on the few candidates
+# without a small factor.
+KEYGEN_WORKERS = int(os.environ.get('MSECURE_KEYGEN_WORKERS', '1'))  # see enable_parallel_search()
+_SIEVE_WINDOW = 4096  # odd candidates per window
+
+def _small_primes(limit: int) -> List[int]:
+    sieve = np.ones(limit, dtype=bool)
+    sieve[:2] = False
+    for i in range(2, int(limit ** 0.5) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = False
+    return np.flatnonzero(sieve).tolist()
+
+_SIEVE_PRIMES = _small_primes(1 << 14)[1:]  # odd primes below 16384
+
 def generate_prime(bits=128):
+    """Random prime of exactly `bits` bits with the top two bits set"""
+    if bits < 32:
+        while True:
+            n = secrets.randbits(bits) | (1 << (bits - 1)) | 1
+            if is_prime(n):
+                return n
     while True:
-        n = random.getrandbits(bits)
-        if n % 2 == 0:
-            n += 1
-        if is_prime(n):
-            return n
+        # the top two bits make the product of two such primes a full 2*bits
+        base = secrets.randbits(bits) | (3 << (bits - 2)) | 1
+        alive = np.ones(_SIEVE_WINDOW, dtype=bool)
+        for p in _SIEVE_PRIMES:
+            # base + 2i is divisible by p for i = -base / 2 (mod p)
+            alive[(p - base % p) * ((p + 1) // 2) % p::p] = False
+        for i in np.flatnonzero(alive).tolist():
+            n = base + 2 * i
+            if n.bit_length() != bits:
+                break
+            if is_prime(n):
+                return n
 
-def generate_keypair(keysize=1024):
-    # Step 1: Generate two distinct large prime numbers p and q
-    p = generate_prime(keysize // 2)
-    q = generate_prime(keysize // 2)
+def _generate_primes(bits: int, workers: int) -> Tuple[int, int]:
+    """two distinct primes, searched on two processes when workers > 1"""
+    primes = _run_on_pool(workers, generate_prime, [(bits,), (bits,)]) if workers > 1 else None
+    p, q = primes if primes is not None else (generate_prime(bits), generate_prime(bits))
     while p == q:
-        q = generate_prime(keysize // 2)
+        q = generate_prime(bits)
+    return p, q
+
+def generate_keypair(keysize=1024, workers=None):
+    workers = KEYGEN_WORKERS if workers is None else workers
+    # Step 1: Generate two distinct large prime numbers p and q
+    p, q = _generate_primes(keysize // 2, workers)
 
     # Step 2: Compute n = p * q
     n = p * q
@@ -111,18 +471,32 @@ def generate_keypair(keysize=1024):
     # Step 4: Choose an integer e such that 1 < e < phi(n) and gcd(e, phi(n)) = 1
     e = 65537
     while gcd(e, phi) != 1:
-        p = generate_prime(keysize // 2)
-        q = generate_prime(keysize // 2)
-        while p == q:
-            q = generate_prime(keysize // 2)
+        p, q = _generate_primes(keysize // 2, workers)
         n = p * q
         phi = (p - 1) * (q - 1)
         
     # Step 5: Determine d as d = e^(-1) mod phi(n)
     d = mod_inverse(e, phi)
     
-    # Return Public Key (e, n) and Private Key (d, n)
-    return ((e, n), (d, n))
+    # Return Public Key (e, n) and Private Key (d, n, p, q, dP, dQ, qInv)
+    return ((e, n), rsa_private_key(d, p, q))
+
+class RSAPrivateKey(NamedTuple):
+    """
+    Private key with the CRT parameters, so decryption works mod p and mod q
+    (half-size exponents and moduli) instead of mod n. The first two fields
+    are the old (d, n) pair.
+    """
+    d: int
+    n: int
+    p: int
+    q: int
+    dP: int
+    dQ: int
+    qInv: int
+
+def rsa_private_key(d: int, p: int, q: int) -> RSAPrivateKey:
+    return RSAPrivateKey(d, p * q, p, q, d % (p - 1), d % (q - 1), mod_inverse(q, p))
 
 def rsa_encrypt(plaintext: str, public_key) -> str:
     e, n = public_key
@@ -134,108 +508,275 @@ def rsa_encrypt(plaintext: str, public_key) -> str:
     c = pow(m, e, n)
     return hex(c)[2:]
 
-def rsa_decrypt(ciphertext: str, private_key) -> str:
+def _rsa_private_op(c: int, private_key) -> int:
+    # an RSAPrivateKey (or its 7 fields as a plain list, e.g. from JSON)
+    # takes the CRT path; an old (d, n) pair still works
+    if len(private_key) == len(RSAPrivateKey._fields):
+        crt = RSAPrivateKey(*private_key)
+        # Garner's recombination of c^dP mod p and c^dQ mod q
+        m1 = pow(c, crt.dP, crt.p)
+        m2 = pow(c, crt.dQ, crt.q)
+        return m2 + (crt.qInv * (m1 - m2) % crt.p) * crt.q
     d, n = private_key
+    # Decryption formula: m = c^d mod n
+    return pow(c, d, n)
+
+def rsa_decrypt(ciphertext: str, private_key) -> str:
     try:
         c = int(ciphertext, 16)
-        # Decryption formula: m = c^d mod n
-        m = pow(c, d, n)
+        m = _rsa_private_op(c, private_key)
         num_bytes = (m.bit_length() + 7) // 8
         return m.to_bytes(num_bytes, 'big').decode('utf-8')
     except Exception as e:
         return f"[Error decrypting RSA: {e}]"
 
+# Hybrid RSA: RSA only wraps a random 256-bit session key; the message body
+# is XORed with a SHAKE-256 keystream and authenticated with HMAC-SHA256, so
+# messages of any length cost one RSA operation at most, and none while the
+# session key of a conversation is reused.
+# Wire format: "h1.<base64 wrapped key>.<base64 nonce + body + tag>"
+SESSION_KEY_MAX_MESSAGES = 10_000
+SESSION_KEY_MAX_AGE = 3600.0
+_HYBRID_VERSION = "h1"
+_SESSION_KEY_BYTES = 32
+_NONCE_BYTES = 16
+_TAG_BYTES = 32
+
+def _stream_xor(session_key: bytes, nonce: bytes, data: bytes) -> bytes:
+    stream = hashlib.shake_256(b'enc' + session_key + nonce).digest(len(data))
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(stream, 'big')).to_bytes(len(data), 'big')
+
+def _hybrid_tag(session_key: bytes, wrapped: bytes, nonce: bytes, body: bytes) -> bytes:
+    mac_key = hashlib.sha256(b'mac' + session_key).digest()
+    return hmac.new(mac_key, wrapped + nonce + body, hashlib.sha256).digest()
+
+def _rsa_wrap(session_key: bytes, public_key) -> bytes:
+    e, n = public_key
+    c = pow(int.from_bytes(session_key, 'big'), e, n)
+    return c.to_bytes((n.bit_length() + 7) // 8, 'big')
+
+@lru_cache(maxsize=1024)
+def _rsa_unwrap(wrapped: bytes, private_key: tuple) -> bytes:
+    """session key inside a wrapped key; cached, so a reused key costs no RSA"""
+    m = _rsa_private_op(int.from_bytes(wrapped, 'big'), private_key)
+    return m.to_bytes(_SESSION_KEY_BYTES, 'big')
+
+class SessionKeyCache:
+    """
+    Sender-side session keys per (conversation, public key). A key is reused
+    for up to max_messages messages or max_age seconds, then replaced.
+    """
+
+    def __init__(self, max_messages: int = SESSION_KEY_MAX_MESSAGES, max_age: float = SESSION_KEY_MAX_AGE):
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, conversation, public_key) -> Tuple[bytes, bytes]:
+        """(session key, RSA-wrapped session key) for this conversation"""
+        cache_key = (conversation, tuple(public_key))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[2] < self.max_messages and now - entry[3] < self.max_age:
+                entry[2] += 1
+                self.hits += 1
+                return entry[0], entry[1]
+            self.misses += 1
+        session_key = os.urandom(_SESSION_KEY_BYTES)
+        wrapped = _rsa_wrap(session_key, public_key)
+        with self._lock:
+            self._entries[cache_key] = [session_key, wrapped, 1, now]
+        return session_key, wrapped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+session_keys = SessionKeyCache()
+
+def rsa_hybrid_encrypt(plaintext: str, public_key, conversation=None) -> str:
+    """
+    Encrypt a message of any length. With a conversation (e.g. a (sender,
+    recipient) pair) the session key is cached and reused; without one every
+    message gets a fresh key.
+    """
+    if conversation is None:
+        session_key = os.urandom(_SESSION_KEY_BYTES)
+        wrapped = _rsa_wrap(session_key, public_key)
+    else:
+        session_key, wrapped = session_keys.get(conversation, public_key)
+    nonce = os.urandom(_NONCE_BYTES)
+    body = _stream_xor(session_key, nonce, plaintext.encode('utf-8'))
+    tag = _hybrid_tag(session_key, wrapped, nonce, body)
+    return '.'.join((_HYBRID_VERSION, base64.b64encode(wrapped).decode('ascii'),
+                     base64.b64encode(nonce + body + tag).decode('ascii')))
+
+def rsa_hybrid_decrypt(ciphertext: str, private_key) -> str:
+    try:
+        version, wrapped, payload = ciphertext.split('.')
+        if version != _HYBRID_VERSION:
+            raise ValueError(f"unknown format {version!r}")
+        wrapped = base64.b64decode(wrapped, validate=True)
+        payload = base64.b64decode(payload, validate=True)
+        if len(payload) < _NONCE_BYTES + _TAG_BYTES:
+            raise ValueError("ciphertext too short")
+        nonce, body, tag = payload[:_NONCE_BYTES], payload[_NONCE_BYTES:-_TAG_BYTES], payload[-_TAG_BYTES:]
+        session_key = _rsa_unwrap(wrapped, tuple(private_key))
+        if not hmac.compare_digest(tag, _hybrid_tag(session_key, wrapped, nonce, body)):
+            raise ValueError("message authentication failed")
+        return _stream_xor(session_key, nonce, body).decode('utf-8')
+    except Exception as e:
+        return f"[Error decrypting RSA: {e}]"
+
+# Compiled cipher tables: every classical cipher below is a per-character
+# letter mapping, so it is precomputed once as a str.maketrans table and
+# applied with str.translate, which runs in C.
+_UPPER = string.ascii_uppercase
+_LOWER = string.ascii_lowercase
+_ASCII_LETTERS = _UPPER + _LOWER
+_NON_LETTER_BYTES = bytes(c for c in range(256) if chr(c) not in _ASCII_LETTERS)
+_IS_LETTER = np.zeros(256, dtype=bool)
+_IS_LETTER[list(_ASCII_LETTERS.encode('ascii'))] = True
+
+def _shifted(shift: int) -> str:
+    return _UPPER[shift:] + _UPPER[:shift] + _LOWER[shift:] + _LOWER[:shift]
+
+# _CAESAR_TABLES[k] shifts letters forward by k; the byte tables do the
+# same for ASCII-encoded text
+_CAESAR_TABLES = [str.maketrans(_ASCII_LETTERS, _shifted(k)) for k in range(26)]
+_CAESAR_BYTE_TABLES = [bytes.maketrans(_ASCII_LETTERS.encode('ascii'), _shifted(k).encode('ascii'))
+                       for k in range(26)]
+
+# Dictionary index for caesar_break: each word shifted so it starts with
+# 'a', mapped to the offsets of the original first letters. A ciphertext word
+# with the same normalized form decrypts to one of those words.
+def _build_word_index(vocab) -> dict:
+    index = {}
+    for word in vocab:
+        if word and word.isascii() and word.isalpha() and word.islower():
+            first = ord(word[0]) - ord('a')
+            index.setdefault(word.translate(_CAESAR_TABLES[-first % 26]), []).append(first)
+    return index
+
+_WORD_INDEX = _build_word_index(COMMON_WORDS)
+# strips what str.isalpha() rejects from ASCII text, keeping the whitespace
+# that str.split() breaks words on
+_DROP_PUNCTUATION = {c: None for c in range(128) if not (chr(c).isalpha() or chr(c).isspace())}
+
+# English letter frequencies a..z, for scoring candidate shifts
+_ENGLISH_FREQ = np.array([
+    8.167, 1.492, 2.782, 4.253, 12.702, 2.228, 2.015, 6.094, 6.966, 0.153, 0.772, 4.025, 2.406,
+    6.749, 7.507, 1.929, 0.095, 5.987, 6.327, 9.056, 2.758, 0.978, 2.360, 0.150, 1.974, 0.074,
+]) / 100
+# _SHIFT_INDEX[k, i] is the ciphertext letter that shift k decrypts to letter i
+_SHIFT_INDEX = (np.arange(26)[None, :] + np.arange(26)[:, None]) % 26
+
+def _letter_counts(text: str) -> np.ndarray:
+    """occurrences of each ASCII letter a..z, ignoring case"""
+    raw = np.frombuffer(text.encode('ascii', 'ignore').lower(), dtype=np.uint8)
+    return np.bincount(raw[(raw >= ord('a')) & (raw <= ord('z'))] - ord('a'), minlength=26)
+
+def _chi_squared(counts: np.ndarray) -> np.ndarray:
+    """
+    chi-squared distance from English for each of the 26 decryption shifts.
+    counts is (..., 26) letter counts; the result is (..., 26).
+    """
+    total = counts.sum(axis=-1, keepdims=True)
+    expected = _ENGLISH_FREQ * np.maximum(total, 1)
+    chi = (((counts[..., _SHIFT_INDEX] - expected[..., None, :]) ** 2) / expected[..., None, :]).sum(axis=-1)
+    return np.where(total > 0, chi, 0.0)
+
 def caesar_encrypt(plaintext: str, key: int) -> str:
-    result_chars = []
-    for ch in plaintext:
-        if 'a' <= ch <= 'z':
-            base = ord('a')
-            result_chars.append(chr((ord(ch) - base + key) % 26 + base))
-        elif 'A' <= ch <= 'Z':
-            base = ord('A')
-            result_chars.append(chr((ord(ch) - base + key) % 26 + base))
-        else:
-            result_chars.append(ch)
-    return ''.join(result_chars)
+    return plaintext.translate(_CAESAR_TABLES[key % 26])
 
 def caesar_decrypt(ciphertext: str, key: int) -> str:
     return caesar_encrypt(ciphertext, (-key) % 26)
 
-def vigenere_encrypt(plaintext: str, key: str) -> str:
+def _vigenere_loop(text: str, key: str, direction: int) -> str:
+    # reference implementation; also handles non-ASCII letters, which
+    # the translation tables do not cover
     result = []
     key = key.upper()
     key_index = 0
 
-    for ch in plaintext:
+    for ch in text:
         if ch.isalpha():
             shift = ord(key[key_index % len(key)]) - ord('A')
             base = ord('A') if ch.isupper() else ord('a')
-            result.append(chr((ord(ch) - base + shift) % 26 + base))
+            result.append(chr((ord(ch) - base + direction * shift) % 26 + base))
             key_index += 1
         else:
             result.append(ch)
     return ''.join(result)
 
-
-def vigenere_decrypt(ciphertext: str, key: str) -> str:
-    result = []
+def _vigenere(text: str, key: str, direction: int) -> str:
     key = key.upper()
-    key_index = 0
+    if not key or not text.isascii():
+        return _vigenere_loop(text, key, direction)
+    # Key position j applies to letters j, j+period, ... of the letters-only
+    # text, so each position is one strided slice through one Caesar table.
+    raw = text.encode('ascii')
+    letters = raw.translate(None, _NON_LETTER_BYTES)
+    period = len(key)
+    out = bytearray(letters)
+    for j, k in enumerate(key):
+        out[j::period] = letters[j::period].translate(_CAESAR_BYTE_TABLES[(direction * (ord(k) - ord('A'))) % 26])
+    if len(letters) == len(raw):
+        return out.decode('ascii')
+    # put the letters back between the spaces and punctuation
+    result = np.frombuffer(raw, dtype=np.uint8).copy()
+    result[_IS_LETTER[result]] = np.frombuffer(out, dtype=np.uint8)
+    return result.tobytes().decode('ascii')
+
+def vigenere_encrypt(plaintext: str, key: str) -> str:
+    return _vigenere(plaintext, key, 1)
 
-    for ch in ciphertext:
-        if ch.isalpha():
-            shift = ord(key[key_index % len(key)]) - ord('A')
-            base = ord('A') if ch.isupper() else ord('a')
-            result.append(chr((ord(ch) - base - shift) % 26 + base))
-            key_index += 1
-        else:
-            result.append(ch)
-    return ''.join(result)
+
+def vigenere_decrypt(ciphertext: str, key: str) -> str:
+    return _vigenere(ciphertext, key, -1)
 
 
 # Substitution cipher (monoalphabetic substitution)
-def substitution_encrypt(plaintext: str, key: str) -> str:
+@lru_cache(maxsize=256)
+def _substitution_tables(key: str) -> Tuple[dict, dict]:
+    """(encrypt table, decrypt table) for a key, built once per distinct key"""
     # key: 26-letter mapping representing ciphertext letters for A..Z
     clean_key = ''.join([c for c in key if c.isalpha()])
     if len(clean_key) != 26:
         raise ValueError("Substitution key must contain 26 letters")
     clean_key = clean_key.upper()
-    mapping_upper = {chr(ord('A') + i): clean_key[i] for i in range(26)}
-    mapping_lower = {k.lower(): v.lower() for k, v in mapping_upper.items()}
 
-    result = []
-    for ch in plaintext:
-        if ch.isupper():
-            result.append(mapping_upper.get(ch, ch))
-        elif ch.islower():
-            result.append(mapping_lower.get(ch, ch))
-        else:
-            result.append(ch)
-    return ''.join(result)
+    def table(mapping_upper):
+        mapping_lower = {k.lower(): v.lower() for k, v in mapping_upper.items()}
+        # same rule as mapping each character by hand: only upper-case
+        # characters use the upper mapping and lower-case the lower one
+        mapping = {k: v for k, v in mapping_lower.items() if len(k) == 1 and k.islower()}
+        mapping.update({k: v for k, v in mapping_upper.items() if len(k) == 1 and k.isupper()})
+        return str.maketrans(mapping)
 
+    encrypt_table = table({chr(ord('A') + i): clean_key[i] for i in range(26)})
+    decrypt_table = table({clean_key[i]: chr(ord('A') + i) for i in range(26)})
+    return encrypt_table, decrypt_table
 
-def substitution_decrypt(ciphertext: str, key: str) -> str:
-    clean_key = ''.join([c for c in key if c.isalpha()])
-    if len(clean_key) != 26:
-        raise ValueError("Substitution key must contain 26 letters")
-    clean_key = clean_key.upper()
-    mapping_upper = {clean_key[i]: chr(ord('A') + i) for i in range(26)}
-    mapping_lower = {k.lower(): v.lower() for k, v in mapping_upper.items()}
+def substitution_encrypt(plaintext: str, key: str) -> str:
+    return plaintext.translate(_substitution_tables(key)[0])
 
-    result = []
-    for ch in ciphertext:
-        if ch.isupper():
-            result.append(mapping_upper.get(ch, ch))
-        elif ch.islower():
-            result.append(mapping_lower.get(ch, ch))
-        else:
-            result.append(ch)
-    return ''.join(result)
+
+def substitution_decrypt(ciphertext: str, key: str) -> str:
+    return ciphertext.translate(_substitution_tables(key)[1])
 
 
 # Simple columnar transposition cipher
 # key: number of columns (int > 0). Encryption writes plaintext into rows
 # left-to-right with that many columns and reads out column-by-column.
+TRANSPOSITION_MAX_COLS = 64
+# below this many characters a list comprehension gathers faster than numpy
+_GATHER_NUMPY_MIN = 4096
+
 def transposition_encrypt(plaintext: str, key: int) -> str:
     cols = int(key)
     if cols <= 0:
@@ -243,55 +784,101 @@ def transposition_encrypt(plaintext: str, key: int) -> str:
     # keep all characters (including spaces and punctuation)
     # fill into rows
     rows = (len(plaintext) + cols - 1) // cols
-    padded_len = rows * cols
-    pad_char = 'X'
-    padded = plaintext.ljust(padded_len, pad_char)
+    padded = plaintext.ljust(rows * cols, 'X')
+    # column c of the grid is every cols-th character starting at c
+    return ''.join([padded[c::cols] for c in range(cols)])
 
-    result = []
-    for c in range(cols):
-        for r in range(rows):
-            idx = r * cols + c
-            result.append(padded[idx])
-    return ''.join(result)
 
+# orders for messages up to this length are cached (int32: at most
+# 256 entries x 64 KB = 16 MB); longer ones are rebuilt per call
+_ORDER_CACHE_MAX_LEN = 16384
+
+def _transposition_order(length: int, cols: int) -> np.ndarray:
+    """
+    Ciphertext index of each plaintext character: the grid is filled
+    column by column with `length` characters and read back row by row,
+    skipping the cells past the end of the ciphertext.
+    """
+    if length <= _ORDER_CACHE_MAX_LEN:
+        return _cached_transposition_order(length, cols)
+    return _build_transposition_order(length, cols)
+
+def _build_transposition_order(length: int, cols: int) -> np.ndarray:
+    rows = (length + cols - 1) // cols
+    dtype = np.int32 if rows * cols < 2 ** 31 else np.int64
+    cell = np.arange(rows * cols, dtype=dtype)
+    src = (cell % cols) * rows + cell // cols
+    order = src[src < length]
+    order.flags.writeable = False
+    return order
+
+_cached_transposition_order = lru_cache(maxsize=256)(_build_transposition_order)
+
+def _gather(text: str, order: np.ndarray) -> str:
+    if len(order) < _GATHER_NUMPY_MIN:
+        return ''.join([text[i] for i in order.tolist()])
+    codes, _ = _pack([text])
+    return _unpack(np.take(codes, order), np.array([0, len(order)]))[0]
 
 def transposition_decrypt(ciphertext: str, key: int) -> str:
     cols = int(key)
     if cols <= 0:
         raise ValueError("Transposition key must be a positive integer")
+    plaintext = _gather(ciphertext, _transposition_order(len(ciphertext), cols))
+    # strip potential padding X characters added during encryption
+    return plaintext.rstrip('X')
+
+
+def _transposition_prefixes(ciphertext: str, candidates: np.ndarray, size: int) -> List[str]:
+    """
+    First `size` characters of the decryption under every column count in
+    `candidates`, gathered in one pass.
+    """
     length = len(ciphertext)
-    rows = (length + cols - 1) // cols
-    # build empty grid
-    grid = [[''] * cols for _ in range(rows)]
-    idx = 0
-    for c in range(cols):
-        for r in range(rows):
-            if idx < length:
-                grid[r][c] = ciphertext[idx]
-                idx += 1
-
-    # read row-wise
-    result = []
-    for r in range(rows):
-        for c in range(cols):
-            result.append(grid[r][c])
+    rows = (length + candidates - 1) // candidates
+    # empty cells (fewer than cols of them) come last in column order, so
+    # size + cols cells read row by row always hold `size` filled ones
+    cells = np.minimum(rows * candidates, size + candidates)
+    offsets = np.zeros(len(candidates) + 1, dtype=np.int64)
+    np.cumsum(cells, out=offsets[1:])
+    owner = _owner(offsets)
+    k = np.arange(offsets[-1], dtype=np.int64) - offsets[owner]
+    cols = candidates[owner]
+    src = (k % cols) * rows[owner] + k // cols
+    valid = src < length
+    codes, _ = _pack([ciphertext])
+    out_offsets = np.zeros(len(candidates) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner[valid], minlength=len(candidates)), out=out_offsets[1:])
+    return [p[:size] for p in _unpack(codes[src[valid]], out_offsets)]
 
-    # strip potential padding X characters added during encryption
-    return ''.join(result).rstrip('X')
+def transposition_break(ciphertext: str, language: str = 'english',
+                        max_cols: int = TRANSPOSITION_MAX_COLS) -> Tuple[str, int]:
+    """
+    Try every column count up to max_cols and return (plaintext, columns) for
+    the one whose decryption starts with the most dictionary words.
+    """
+    if not ciphertext:
+        return ciphertext, 1
+    candidates = np.arange(1, min(max_cols, len(ciphertext)) + 1)
+    scores = [_dictionary_hits(p) for p in _transposition_prefixes(ciphertext, candidates, _SCORE_CHARS)]
+    cols = int(candidates[int(np.argmax(scores))])
+    return transposition_decrypt(ciphertext, cols), cols
 
 
 # A generic interface for later adding more ciphers
-def encrypt(text: str, key, method: str = "caesar") -> str:
+def encrypt(text: str, key, method: str = "caesar", conversation=None) -> str:
     if method == "caesar" or method == "caesar_break":
         return caesar_encrypt(text, int(key) % 26)
-    elif method == "vigenere":
+    elif method == "vigenere" or method == "vigenere_break":
         return vigenere_encrypt(text, str(key))
-    elif method == "substitution":
+    elif method == "substitution" or method == "substitution_break":
         return substitution_encrypt(text, str(key))
-    elif method == "transposition":
+    elif method == "transposition" or method == "transposition_break":
         return transposition_encrypt(text, int(key))
     elif method == "rsa":
         return rsa_encrypt(text, key)
+    elif method == "rsa_hybrid":
+        return rsa_hybrid_encrypt(text, key, conversation)
     else:
         raise ValueError("Unknown method")
 
@@ -305,16 +892,249 @@ def decrypt(text: str, key, method: str = "caesar") -> str:
         return f"{plaintext} (shift {found_key})"
     elif method == "vigenere":
         return vigenere_decrypt(text, str(key))
+    elif method == "vigenere_break":
+        # key here is the language string (ignored now)
+        plaintext, found_key = vigenere_break(text, str(key))
+        return f"{plaintext} (key {found_key})"
     elif method == "substitution":
         return substitution_decrypt(text, str(key))
+    elif method == "substitution_break":
+        # key here is the language string (ignored now)
+        plaintext, found_key = substitution_break(text, str(key))
+        return f"{plaintext} (key {found_key})"
     elif method == "transposition":
         return transposition_decrypt(text, int(key))
+    elif method == "transposition_break":
+        # key here is the language string (ignored now)
+        plaintext, cols = transposition_break(text, str(key))
+        return f"{plaintext} (cols {cols})"
     elif method == "rsa":
         return rsa_decrypt(text, key)
+    elif method == "rsa_hybrid":
+        return rsa_hybrid_decrypt(text, key)
     else:
         raise ValueError("Unknown method")
 
 
+# Batch API: many messages per call. The texts are packed into one flat
+# code-point array (uint8 when everything is ASCII, uint32 otherwise) plus an
+# offsets array, so message i is codes[offsets[i]:offsets[i + 1]], and each
+# cipher runs as a handful of numpy operations over the whole batch. Results
+# are identical to calling encrypt/decrypt once per message.
+#
+# `key` is either one key shared by every message or a list (or numpy array)
+# with one key per message. Methods without a vectorized form (rsa and the
+# breakers) fall back to the scalar functions.
+
+# _CAESAR_LUT[k, c] is byte c shifted by k
+_CAESAR_LUT = np.array([np.frombuffer(bytes(range(256)).translate(t), dtype=np.uint8)
+                        for t in _CAESAR_BYTE_TABLES])
+
+def _pack(texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    joined = ''.join(texts)
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)), out=offsets[1:])
+    if joined.isascii():
+        return np.frombuffer(joined.encode('ascii'), dtype=np.uint8), offsets
+    return np.frombuffer(joined.encode('utf-32-le', 'surrogatepass'), dtype='<u4'), offsets
+
+def _unpack(codes: np.ndarray, offsets: np.ndarray) -> List[str]:
+    if len(offsets) > 2 and not (codes == 0).any():
+        # NUL between messages, then one C-level split instead of a slice per message
+        codes = np.insert(codes, offsets[1:-1], 0)
+        split = True
+    else:
+        split = False
+    if codes.dtype == np.uint8:
+        joined = codes.tobytes().decode('latin-1')
+    else:
+        joined = codes.astype('<u4').tobytes().decode('utf-32-le', 'surrogatepass')
+    if split:
+        return joined.split('\0')
+    bounds = offsets.tolist()
+    return [joined[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+def _owner(offsets: np.ndarray) -> np.ndarray:
+    """message number of every code point"""
+    return np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+
+def _batch_keys(key, count: int):
+    """key as a list of per-message keys, or None when one key is shared"""
+    if isinstance(key, (list, np.ndarray)):
+        if len(key) != count:
+            raise ValueError(f"Expected {count} keys, got {len(key)}")
+        return key
+    return None
+
+def _caesar_many(codes, offsets, key, count, direction):
+    keys = _batch_keys(key, count)
+    if keys is None:
+        shift = (direction * int(key)) % 26
+        if codes.dtype == np.uint8:
+            return np.frombuffer(codes.tobytes().translate(_CAESAR_BYTE_TABLES[shift]), dtype=np.uint8)
+    else:
+        shift = ((direction * np.array([int(k) for k in keys], dtype=np.int64)) % 26)[_owner(offsets)]
+        if codes.dtype == np.uint8:
+            return _CAESAR_LUT[shift, codes]
+    # only ASCII letters move, so the byte table covers the wide case too
+    out = codes.copy()
+    narrow = codes < 256
+    shift = shift if np.ndim(shift) == 0 else shift[narrow]
+    out[narrow] = _CAESAR_LUT[shift, codes[narrow]]
+    return out
+
+def _letter_classes(codes):
+    """(isalpha, isupper) per code point, the same tests the scalar loop uses"""
+    alpha = _IS_LETTER[np.minimum(codes, 255)]
+    upper = (codes >= 65) & (codes <= 90)
+    wide = codes >= 128
+    if wide.any():
+        points = np.unique(codes[wide])
+        chars = [chr(c) for c in points.tolist()]
+        is_alpha = np.array([c.isalpha() for c in chars])
+        is_upper = np.array([c.isupper() for c in chars])
+        where = np.searchsorted(points, codes[wide])
+        alpha[wide] = is_alpha[where]
+        upper[wide] = is_upper[where]
+    return alpha, upper
+
+def _vigenere_many(codes, offsets, key, count, direction):
+    alpha, upper = _letter_classes(codes)
+    letters_before = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(alpha, out=letters_before[1:])
+    pos = np.flatnonzero(alpha)
+    msg = _owner(offsets)[pos]
+    # index of each letter among the letters of its own message
+    letter_index = letters_before[pos] - letters_before[offsets[:-1]][msg]
+
+    keys = _batch_keys(key, count)
+    if keys is None:
+        key_codes = np.array([ord(c) for c in str(key).upper()], dtype=np.int64)
+        if len(key_codes) == 0:
+            if len(pos):
+                raise ValueError("Vigenere key must not be empty")
+            return codes.copy()
+        shift = key_codes[letter_index % len(key_codes)] - ord('A')
+    else:
+        key_codes, key_offsets = _pack([str(k).upper() for k in keys])
+        key_lengths = np.diff(key_offsets)
+        if (key_lengths[msg] == 0).any():
+            raise ValueError("Vigenere key must not be empty")
+        key_codes = key_codes.astype(np.int64)
+        shift = key_codes[key_offsets[msg] + letter_index % np.maximum(key_lengths[msg], 1)] - ord('A')
+
+    base = np.where(upper[pos], ord('A'), ord('a'))
+    shifted = (codes[pos].astype(np.int64) - base + direction * shift) % 26 + base
+    out = codes.copy()
+    out[pos] = shifted.astype(codes.dtype)
+    return out
+
+def _substitution_lut(key: str, decrypt: bool):
+    """128-entry code-point table for a key, or None if it maps outside ASCII input"""
+    table = _substitution_tables(key)[1 if decrypt else 0]
+    if any(k >= 128 or len(v) != 1 for k, v in table.items()):
+        return None
+    lut = np.arange(128, dtype=np.uint32)
+    for k, v in table.items():
+        lut[k] = ord(v)
+    return lut
+
+def _substitution_many(codes, offsets, key, count, direction):
+    keys = _batch_keys(key, count)
+    distinct = {}
+    if keys is None:
+        distinct[str(key)] = 0
+    else:
+        key_ids = np.array([distinct.setdefault(str(k), len(distinct)) for k in keys], dtype=np.int32)
+    luts = [_substitution_lut(k, direction < 0) for k in distinct]
+    if any(lut is None for lut in luts):
+        return None
+    luts = np.stack(luts)
+    dtype = np.uint8 if codes.dtype == np.uint8 and luts.max() < 256 else np.uint32
+    if len(distinct) == 1 and dtype == np.uint8:
+        table = bytes(luts[0].astype(np.uint8)) + bytes(range(128, 256))
+        return np.frombuffer(codes.tobytes().translate(table), dtype=np.uint8)
+    luts = luts.astype(dtype)
+    out = codes.astype(dtype)
+    narrow = codes < 128
+    if len(distinct) == 1:
+        out[narrow] = luts[0][codes[narrow]]
+    elif codes.dtype == np.uint8:
+        out = luts[key_ids[_owner(offsets)], codes]
+    else:
+        out[narrow] = luts[key_ids[_owner(offsets)[narrow]], codes[narrow]]
+    return out
+
+def _transposition_many(codes, offsets, key, count, direction):
+    keys = _batch_keys(key, count)
+    lengths = np.diff(offsets)
+    if keys is None:
+        cols = np.full(count, int(key), dtype=np.int64)
+    else:
+        cols = np.array([int(k) for k in keys], dtype=np.int64)
+    if (cols <= 0).any():
+        raise ValueError("Transposition key must be a positive integer")
+    rows = (lengths + cols - 1) // cols
+    cells = rows * cols
+    cell_offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(cells, out=cell_offsets[1:])
+    cell_owner = _owner(cell_offsets)
+    k = np.arange(cell_offsets[-1], dtype=np.int64) - cell_offsets[cell_owner]
+    r, c, length = rows[cell_owner], cols[cell_owner], lengths[cell_owner]
+    if direction > 0:
+        # output cell k reads the grid column-major; short grids pad with 'X'
+        src = (k % r) * c + k // r
+        out = np.full(len(k), ord('X'), dtype=codes.dtype)
+        valid = src < length
+        out[valid] = codes[offsets[cell_owner[valid]] + src[valid]]
+        return out, cell_offsets
+    # decrypt: read the column-major filled grid row by row, skipping the
+    # cells past the end of the ciphertext
+    src = (k % c) * r + k // c
+    valid = src < length
+    return codes[offsets[cell_owner[valid]] + src[valid]], offsets
+
+def _many(texts, key, method: str, direction: int) -> List[str]:
+    texts = list(texts)
+    count = len(texts)
+    if direction > 0 and method.endswith("_break"):
+        method = method[:-len("_break")]
+    if method not in ("caesar", "vigenere", "substitution", "transposition") or count == 0:
+        scalar = encrypt if direction > 0 else decrypt
+        keys = _batch_keys(key, count)
+        if keys is None:
+            return [scalar(t, key, method) for t in texts]
+        return [scalar(t, k, method) for t, k in zip(texts, keys)]
+
+    codes, offsets = _pack(texts)
+    if method == "caesar":
+        return _unpack(_caesar_many(codes, offsets, key, count, direction), offsets)
+    if method == "vigenere":
+        return _unpack(_vigenere_many(codes, offsets, key, count, direction), offsets)
+    if method == "substitution":
+        out = _substitution_many(codes, offsets, key, count, direction)
+        if out is None:
+            # keys with non-ASCII letters: per-message tables
+            keys = _batch_keys(key, count) or [key] * count
+            fn = substitution_encrypt if direction > 0 else substitution_decrypt
+            return [fn(t, str(k)) for t, k in zip(texts, keys)]
+        return _unpack(out, offsets)
+    out, out_offsets = _transposition_many(codes, offsets, key, count, direction)
+    result = _unpack(out, out_offsets)
+    if direction < 0:
+        result = [t.rstrip('X') for t in result]
+    return result
+
+def encrypt_many(texts: Sequence[str], key, method: str = "caesar") -> List[str]:
+    """encrypt() over a batch of messages; key is shared or one per message"""
+    return _many(texts, key, method, 1)
+
+
+def decrypt_many(texts: Sequence[str], key, method: str = "caesar") -> List[str]:
+    """decrypt() over a batch of messages; key is shared or one per message"""
+    return _many(texts, key, method, -1)
+
+
 # quick test
 if __name__ == "__main__":
     print("[Caesar]", encrypt("Hello", 3), "→", decrypt(encrypt("Hello", 3), 3))
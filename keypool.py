@@ -0,0 +1,181 @@
+# keypool.py
+# Pre-generated RSA keypairs. A background thread keeps KEYPOOL_SIZE
+# keypairs per key size ready, so choosing RSA in the app or the CLI client
+# takes one off the pool instead of searching for primes on the request path.
+#
+# Set MSECURE_KEYPOOL_PATH to keep the pool on disk (mode 0600) so a
+# restart does not start cold. A keypair is removed from the file before
+# get() returns it, so it is never handed out twice.
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from crypto import RSAPrivateKey, generate_keypair, rsa_private_key
+
+KEYPOOL_SIZE = int(os.environ.get('MSECURE_KEYPOOL_SIZE', '4'))
+# key sizes filled from startup; other sizes get a pool on first request
+KEYPOOL_BITS = [int(b) for b in os.environ.get('MSECURE_KEYPOOL_BITS', '1024').split(',') if b]
+KEYPOOL_PATH = os.environ.get('MSECURE_KEYPOOL_PATH', '')
+
+Keypair = Tuple[Tuple[int, int], RSAPrivateKey]
+
+class KeyPool:
+    """
+    One deque of ready keypairs per key size; get() pops from it under a
+    lock. A single refill thread tops up whichever pool is emptiest, one
+    keypair at a time. When a pool is empty, get() generates a keypair
+    itself (a miss) rather than waiting for the refill thread.
+    """
+
+    def __init__(self, size: int = KEYPOOL_SIZE, bits: List[int] = KEYPOOL_BITS,
+                 path: str = KEYPOOL_PATH, generate=generate_keypair):
+        self.size = size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_latencies = deque(maxlen=1024)  # seconds per generated keypair
+        self._generate = generate
+        self._cond = threading.Condition()
+        self._save_lock = threading.Lock()  # one writer; each save snapshots the pools inside it
+        self._pools: Dict[int, deque] = {b: deque() for b in bits}
+        self._dirty = False
+        self._closed = False
+        if path:
+            self._load()
+        self._thread = threading.Thread(target=self._refill_loop, name='keypool', daemon=True)
+        self._thread.start()
+
+    def get(self, bits: int = 1024) -> Keypair:
+        """A fresh ((e, n), private_key) that has not been handed out before"""
+        with self._cond:
+            pool = self._pools.setdefault(bits, deque())
+            if pool:
+                self.hits += 1
+                keypair = pool.popleft()
+                self._cond.notify_all()
+            else:
+                keypair = None
+                self.misses += 1
+                self._cond.notify_all()
+        if keypair is None:
+            return self._generate(bits)
+        # the keypair must be gone from disk before anyone can use it; if the
+        # file cannot be rewritten it is still there, so hand out a new one
+        if self.path and not self._save():
+            return self._generate(bits)
+        return keypair
+
+    def available(self, bits: int = 1024) -> int:
+        with self._cond:
+            return len(self._pools.get(bits, ()))
+
+    def wait_full(self, timeout: Optional[float] = None) -> bool:
+        """Block until every pool holds `size` keypairs. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._deficit() is None, timeout)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            latencies = sorted(self.refill_latencies)
+            available = {bits: len(pool) for bits, pool in self._pools.items()}
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] if latencies else 0.0
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "refills": self.refills,
+            "refill_p50_ms": pct(50) * 1000,
+            "refill_p99_ms": pct(99) * 1000,
+            "available": available,
+        }
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop refilling; the keypair being generated (if any) is discarded"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._dirty:
+            self._save()
+
+    def _deficit(self) -> Optional[int]:
+        """the key size whose pool is furthest below target, or None when all are full"""
+        short = [(len(pool), bits) for bits, pool in self._pools.items() if len(pool) < self.size]
+        return min(short)[1] if short else None
+
+    def _refill_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or self._dirty or self._deficit() is not None)
+                if self._closed:
+                    return
+                bits = self._deficit()
+                dirty, self._dirty = self._dirty, False
+            if dirty:
+                self._save()
+            if bits is None:
+                continue
+            t0 = time.perf_counter()
+            keypair = self._generate(bits)
+            elapsed = time.perf_counter() - t0
+            with self._cond:
+                if self._closed:
+                    return
+                self._pools[bits].append(keypair)
+                self.refills += 1
+                self.refill_latencies.append(elapsed)
+                self._dirty = bool(self.path)
+                self._cond.notify_all()
+
+    def _save(self) -> bool:
+        with self._save_lock:
+            with self._cond:
+                state = {str(bits): [[pub[0], pub[1], priv.d, priv.p, priv.q] for pub, priv in pool]
+                         for bits, pool in self._pools.items()}
+            tmp = f"{self.path}.tmp{os.getpid()}"
+            try:
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(state, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                return True
+            except OSError as e:
+                print(f"Error saving key pool: {e}")
+                return False
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+            for bits, keypairs in state.items():
+                pool = self._pools.setdefault(int(bits), deque())
+                for e, n, d, p, q in keypairs:
+                    if p * q == n:
+                        pool.append(((e, n), rsa_private_key(d, p, q)))
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Error loading key pool: {e}")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_key_pool() -> KeyPool:
+    """Process-wide KeyPool configured from the KEYPOOL_* settings"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = KeyPool()
+            atexit.register(_pool.close, 1.0)
+        return _pool
+
+def get_keypair(bits: int = 1024) -> Keypair:
+    """generate_keypair(bits), served from the background pool when one is ready"""
+    return get_key_pool().get(bits)
@@ -0,0 +1,354 @@
+# message_store.py
+# Append-only, segmented JSON Lines message log.
+#
+# Each message is one compact JSON line appended with a single O_APPEND
+# write, so concurrent sessions (threads or processes) never overwrite each
+# other and a send costs O(1) I/O instead of rewriting the whole history.
+# Segments roll over at SEGMENT_BYTES; fsync is batched every FSYNC_BATCH
+# records or FSYNC_INTERVAL seconds, whichever comes first. A timer syncs
+# records still pending FSYNC_INTERVAL after a write, so an idle log does not
+# keep them unsynced until the next append.
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+LOG_DIR = 'messages_log'
+SEGMENT_BYTES = 64 * 1024 * 1024
+FSYNC_BATCH = 64
+FSYNC_INTERVAL = 1.0
+SEGMENT_SUFFIX = '.jsonl'
+
+def _encode(record: Dict) -> bytes:
+    return json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n'
+
+def _decode(line: bytes) -> Optional[Dict]:
+    """One log line, or None if it is not a complete record"""
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+def _repair_tail(path: str):
+    """Cut a torn final line (crash mid-write) so the next append starts a fresh line"""
+    try:
+        with open(path, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            pos = end
+            while pos > 0:
+                step = min(pos, 64 * 1024)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                if pos == end and chunk.endswith(b'\n'):
+                    return
+                newline = chunk.rfind(b'\n')
+                if newline >= 0:
+                    pos = pos - step + newline + 1
+                    break
+                pos -= step
+            f.truncate(pos)
+            print(f"Message log: dropped a torn {end - pos}-byte record at the end of {path}")
+    except FileNotFoundError:
+        pass
+
+def conversation_key(user_a: str, user_b: str) -> Tuple[str, str]:
+    """Unordered pair identifying the chat between two users"""
+    return (user_a, user_b) if user_a <= user_b else (user_b, user_a)
+
+class ConversationIndex:
+    """
+    (user_a, user_b) -> [(segment, offset), ...] for every message in the log.
+
+    Built by one scan on first use, then kept current incrementally: appends
+    through the owning MessageLog are recorded directly, and anything written
+    by other processes is picked up by reading only the bytes past the last
+    indexed position of each segment.
+    """
+
+    def __init__(self, log: 'MessageLog'):
+        self.log = log
+        self._lock = threading.Lock()
+        self._entries = {}  # conversation key -> list of (segment, offset)
+        self._scanned = {}  # segment -> bytes indexed so far
+
+    def _add(self, record: Dict, location: Tuple[int, int]):
+        sender, recipient = record.get("sender"), record.get("recipient")
+        if sender is not None and recipient is not None:
+            self._entries.setdefault(conversation_key(sender, recipient), []).append(location)
+
+    def record_append(self, record: Dict, segment: int, offset: int, length: int):
+        with self._lock:
+            # only contiguous with what we have indexed; otherwise another
+            # writer got in between and catch_up() will read both in order
+            if self._scanned.get(segment, 0) == offset:
+                self._add(record, (segment, offset))
+                self._scanned[segment] = offset + length
+
+    def catch_up(self):
+        with self._lock:
+            for segment in self.log.segments():
+                pos = self._scanned.get(segment, 0)
+                path = self.log._path(segment)
+                if os.path.getsize(path) <= pos:
+                    continue
+                with open(path, 'rb') as f:
+                    f.seek(pos)
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            break
+                        record = _decode(line)
+                        if record is not None:
+                            self._add(record, (segment, pos))
+                        pos += len(line)
+                self._scanned[segment] = pos
+
+    def locations(self, user_a: str, user_b: str) -> List[Tuple[int, int]]:
+        self.catch_up()
+        with self._lock:
+            return list(self._entries.get(conversation_key(user_a, user_b), ()))
+
+    def page(self, user_a: str, user_b: str, limit: int, before: Optional[int] = None):
+        """
+        Locations of up to `limit` messages older than cursor `before`
+        (None = newest). Returns (locations, cursor for the next older page
+        or None when the start of the chat is reached).
+        """
+        self.catch_up()
+        with self._lock:
+            entries = self._entries.get(conversation_key(user_a, user_b), [])
+            end = len(entries) if before is None else min(before, len(entries))
+            start = max(0, end - limit)
+            return entries[start:end], (start if start > 0 else None)
+
+    def __len__(self):
+        return len(self._entries)
+
+class MessageLog:
+    def __init__(self, directory: str = LOG_DIR, segment_bytes: int = SEGMENT_BYTES,
+                 fsync_batch: int = FSYNC_BATCH, fsync_interval: float = FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._fd = None
+        segments = self.segments()
+        self._segment = segments[-1] if segments else 1
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._timer = None  # pending deadline sync, started by the first unsynced write
+        self._index = None
+
+    @property
+    def index(self) -> ConversationIndex:
+        """Per-conversation index, built on first use"""
+        if self._index is None:
+            self._index = ConversationIndex(self)
+        return self._index
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:08d}{SEGMENT_SUFFIX}")
+
+    def segments(self) -> List[int]:
+        """Segment numbers currently on disk, oldest first"""
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+    def _tail_fd(self, incoming: int):
+        if self._fd is not None:
+            size = os.fstat(self._fd).st_size
+            if size and size + incoming > self.segment_bytes:
+                self._sync()
+                os.close(self._fd)
+                self._fd = None
+                self._segment += 1
+        if self._fd is None:
+            # the tail may end in a record torn by a crash: appending onto it
+            # would merge the two into one unreadable line
+            _repair_tail(self._path(self._segment))
+            self._fd = os.open(self._path(self._segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        return self._fd
+
+    def _sync(self):
+        if self._fd is not None and self._unsynced:
+            os.fsync(self._fd)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _write(self, data: bytes, count: int) -> Tuple[int, int]:
+        fd = self._tail_fd(len(data))
+        os.write(fd, data)
+        # with O_APPEND the file position is the end of our own write
+        offset = os.lseek(fd, 0, os.SEEK_CUR) - len(data)
+        self._unsynced += count
+        if self._unsynced >= self.fsync_batch or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self._sync()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.fsync_interval, self._deadline_sync)
+            self._timer.daemon = True
+            self._timer.start()
+        return self._segment, offset
+
+    def _deadline_sync(self):
+        with self._lock:
+            self._timer = None
+            self._sync()
+
+    def append(self, record: Dict) -> Tuple[int, int]:
+        """Append one message. Returns its (segment, byte offset) location."""
+        data = _encode(record)
+        with self._lock:
+            segment, offset = self._write(data, 1)
+        if self._index is not None:
+            self._index.record_append(record, segment, offset, len(data))
+        return segment, offset
+
+    def append_many(self, records: List[Dict]) -> List[Tuple[int, int]]:
+        """Append several messages with one write per segment. Returns their locations."""
+        lines = [_encode(r) for r in records]
+        locations = []
+        with self._lock:
+            batch, size = [], 0
+            for line in lines:
+                if batch and size + len(line) > self.segment_bytes:
+                    locations += self._write_batch(batch)
+                    batch, size = [], 0
+                batch.append(line)
+                size += len(line)
+            if batch:
+                locations += self._write_batch(batch)
+        return locations
+
+    def _write_batch(self, lines: List[bytes]) -> List[Tuple[int, int]]:
+        segment, offset = self._write(b''.join(lines), len(lines))
+        locations = []
+        for line in lines:
+            locations.append((segment, offset))
+            offset += len(line)
+        return locations
+
+    def flush(self):
+        """Force pending appends to disk"""
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._sync()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def iter_records(self) -> Iterator[Dict]:
+        for segment in self.segments():
+            with open(self._path(segment), 'rb') as f:
+                for line in f:
+                    # a torn line (crash mid-write) is skipped
+                    record = _decode(line) if line.endswith(b'\n') else None
+                    if record is not None:
+                        yield record
+
+    def load(self) -> List[Dict]:
+        """Every message in append order"""
+        records = []
+        for segment in self.segments():
+            with open(self._path(segment), 'rb') as f:
+                data = f.read()
+            data = data[:data.rfind(b'\n') + 1]
+            if data:
+                # JSON strings never contain a raw newline, so one segment
+                # parses as a single array far faster than line by line;
+                # a segment with a damaged line falls back to skipping it
+                try:
+                    records += json.loads(b'[' + data[:-1].replace(b'\n', b',') + b']')
+                except ValueError:
+                    records += [r for r in map(_decode, data.splitlines()) if r is not None]
+        return records
+
+    def read_at(self, segment: int, offset: int) -> Dict:
+        """Read the message stored at a location returned by append()"""
+        with open(self._path(segment), 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def read_many(self, locations: List[Tuple[int, int]]) -> List[Dict]:
+        """Read messages at several locations, opening each segment once"""
+        records = []
+        f, current = None, None
+        try:
+            for segment, offset in locations:
+                if segment != current:
+                    if f is not None:
+                        f.close()
+                    f, current = open(self._path(segment), 'rb'), segment
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        finally:
+            if f is not None:
+                f.close()
+        return records
+
+    def conversation(self, user_a: str, user_b: str) -> List[Dict]:
+        """Messages exchanged between two users, oldest first, via the index"""
+        return self.read_many(self.index.locations(user_a, user_b))
+
+    def conversation_page(self, user_a: str, user_b: str, limit: int, before: Optional[int] = None):
+        """One page of a chat, oldest first, plus the cursor for older messages"""
+        locations, cursor = self.index.page(user_a, user_b, limit, before)
+        return self.read_many(locations), cursor
+
+    def is_empty(self) -> bool:
+        return all(os.path.getsize(self._path(s)) == 0 for s in self.segments())
+
+def migrate_json(json_path: str, log: MessageLog) -> int:
+    """
+    One-shot import of a legacy messages.json array into the log.
+    The JSON file is renamed to <name>.migrated afterwards. Returns the
+    number of messages imported.
+    """
+    if not os.path.exists(json_path):
+        return 0
+    with open(json_path, 'r') as f:
+        messages = json.load(f)
+    log.append_many(messages)
+    log.flush()
+    os.replace(json_path, json_path + '.migrated')
+    return len(messages)
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+def open_log(directory: str = LOG_DIR, legacy_json: str = None) -> MessageLog:
+    """
+    Process-wide MessageLog for a directory. On first open, an empty log is
+    seeded from legacy_json if that file exists.
+    """
+    with _logs_lock:
+        log = _logs.get(directory)
+        if log is None:
+            log = MessageLog(directory)
+            if legacy_json and log.is_empty():
+                migrate_json(legacy_json, log)
+            _logs[directory] = log
+        return log
+
+@atexit.register
+def _close_all():
+    for log in list(_logs.values()):
+        log.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Message log maintenance")
+    parser.add_argument('--migrate', metavar='JSON', help="import a legacy messages.json")
+    parser.add_argument('--dir', default=LOG_DIR)
+    args = parser.parse_args()
+    if args.migrate:
+        count = migrate_json(args.migrate, MessageLog(args.dir))
+        print(f"Migrated {count} messages into {args.dir}/")
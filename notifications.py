@@ -0,0 +1,32 @@
+# notifications.py
+# In-process change feed: a version counter per conversation that is bumped
+# whenever a message for that chat is stored. Streamlit sessions block on
+# wait() instead of re-running the whole script on a fixed timer.
+import threading
+from typing import Hashable
+
+class ChangeFeed:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._versions = {}
+
+    def version(self, key: Hashable) -> int:
+        with self._cond:
+            return self._versions.get(key, 0)
+
+    def publish(self, key: Hashable) -> int:
+        """Record a change for key and wake every waiter"""
+        with self._cond:
+            version = self._versions.get(key, 0) + 1
+            self._versions[key] = version
+            self._cond.notify_all()
+            return version
+
+    def wait(self, key: Hashable, seen: int, timeout: float) -> int:
+        """Block until key's version differs from `seen` or timeout. Returns the current version."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._versions.get(key, 0) != seen, timeout)
+            return self._versions.get(key, 0)
+
+# Shared by every session in this Streamlit process (modules survive reruns)
+feed = ChangeFeed()
@@ -0,0 +1,298 @@
+# outbound.py
+# Per-connection outbound queues for the threaded relay. forward() never
+# blocks on a slow recipient: a frame the socket cannot take right away is
+# queued, and a writer thread for that connection sends it. Once a queue
+# holds OUTBOUND_QUEUE frames the overflow policy applies:
+#
+#   drop_oldest - discard the oldest queued frame
+#   disconnect  - close the connection
+#   persist     - spill frames to a temp file, sent once the client catches up
+#
+# AsyncOutboundQueue is the same queue for the asyncio engine: a writer task
+# per connection instead of a thread.
+import asyncio
+import os
+import socket
+import struct
+import tempfile
+import threading
+from collections import deque
+from typing import Callable, Dict, Optional
+
+OUTBOUND_QUEUE = int(os.environ.get('MSECURE_OUTBOUND_QUEUE', '256'))
+OUTBOUND_POLICY = os.environ.get('MSECURE_OUTBOUND_POLICY', 'drop_oldest')
+POLICIES = ("drop_oldest", "disconnect", "persist")
+WRITE_BATCH_BYTES = 256 * 1024  # queued frames joined into one send
+
+# try a direct send first where the platform can do it without blocking
+_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+_LENGTH = struct.Struct('!I')
+
+class _SpillFile:
+    """Frames that overflowed a persist-policy queue, oldest first, in a temp file"""
+
+    def __init__(self):
+        self.count = 0  # frames not sent yet
+        self._file = None
+        self._pos = 0   # next frame to send
+
+    def append(self, data):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix='msecure_spill_')
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(_LENGTH.pack(len(data)))
+        self._file.write(data)
+        self.count += 1
+
+    def pop(self) -> bytes:
+        self._file.seek(self._pos)
+        (length,) = _LENGTH.unpack(self._file.read(_LENGTH.size))
+        data = self._file.read(length)
+        self.count -= 1
+        self._pos += _LENGTH.size + length
+        if not self.count:
+            self._file.seek(0)
+            self._file.truncate()
+            self._pos = 0
+        return data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.count = 0
+
+class OutboundQueue:
+    """
+    put() sends directly while the connection keeps up and nothing is
+    queued, so a healthy client costs no copy and no thread. Otherwise the
+    data is copied into the queue and the connection's writer thread
+    (started on first use) drains it with blocking sends.
+    """
+
+    def __init__(self, sock, limit: int = OUTBOUND_QUEUE, policy: str = OUTBOUND_POLICY,
+                 on_close: Optional[Callable] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"outbound policy must be one of {POLICIES}")
+        self.sock = sock
+        self.limit = limit
+        self.policy = policy
+        self.sent = 0
+        self.dropped = 0
+        self.spilled = 0
+        self._on_close = on_close
+        self._queue = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._busy = False      # the writer is sending outside the lock
+        self._closed = False
+        self._shut = False
+        self._thread = None
+        self._spill = _SpillFile()
+
+    @property
+    def depth(self) -> int:
+        """Frames waiting to be sent, in memory and spilled"""
+        return len(self._queue) + self._spill.count
+
+    def put(self, data) -> bool:
+        """Queue data for the connection without blocking. False once it is closed."""
+        with self._cond:
+            if self._closed:
+                return False
+            if _DONTWAIT and not self._busy and not self._queue and not self._spill.count:
+                try:
+                    n = self.sock.send(data, _DONTWAIT)
+                except BlockingIOError:
+                    n = 0
+                except OSError:
+                    self._closed = True
+                    n = -1
+                if n == len(data):
+                    self.sent += 1
+                    return True
+                if n > 0:
+                    data = memoryview(data)[n:]
+            if not self._closed:
+                accepted = self._enqueue(data)
+        if self._closed:
+            self.close()
+            return False
+        return accepted
+
+    def _enqueue(self, data) -> bool:
+        """queue or apply the overflow policy; called with the lock held"""
+        if self._spill.count or len(self._queue) >= self.limit:
+            if self.policy == "disconnect":
+                self._closed = True
+                return False
+            if self.policy == "persist":
+                self._spill.append(data)
+                self.spilled += 1
+            else:
+                self._queue.popleft()
+                self.dropped += 1
+                self._queue.append(bytes(data))
+        else:
+            self._queue.append(bytes(data))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='outbound', daemon=True)
+            self._thread.start()
+        self._cond.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or self._queue or self._spill.count)
+                if self._closed:
+                    return
+                # memory holds the older frames: spilling only starts once it is full
+                if self._queue:
+                    batch = [self._queue.popleft()]
+                    size = len(batch[0])
+                    while self._queue and size < WRITE_BATCH_BYTES:
+                        batch.append(self._queue.popleft())
+                        size += len(batch[-1])
+                else:
+                    batch = [self._spill.pop()]
+                self._busy = True
+            try:
+                # one send for everything queued: a backed-up client is
+                # caught up with few syscalls
+                self.sock.sendall(batch[0] if len(batch) == 1 else b''.join(batch))
+            except OSError:
+                self.close()
+                return
+            with self._cond:
+                self._busy = False
+                self.sent += len(batch)
+
+    def close(self):
+        """Stop sending and shut the socket down; the reader sees EOF and cleans up"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            if self._shut:
+                return
+            self._shut = True
+            self._spill.close()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        if self._on_close is not None:
+            self._on_close(self.sock)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {"depth": self.depth, "sent": self.sent, "dropped": self.dropped,
+                    "spilled": self.spilled, "closed": self._closed}
+
+class AsyncOutboundQueue:
+    """
+    OutboundQueue for an asyncio StreamWriter; call put() from the event
+    loop. A frame goes straight to the transport while its buffer is below
+    the high-water mark and nothing is queued. Otherwise it waits here, and
+    the connection's writer task (started on first use) writes it once the
+    transport has drained, so the transport buffer stays bounded and the
+    overflow policy applies to this queue.
+    """
+
+    def __init__(self, writer, limit: int = OUTBOUND_QUEUE, policy: str = OUTBOUND_POLICY,
+                 on_close: Optional[Callable] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"outbound policy must be one of {POLICIES}")
+        self.writer = writer
+        self.limit = limit
+        self.policy = policy
+        self.sent = 0
+        self.dropped = 0
+        self.spilled = 0
+        self._on_close = on_close
+        self._queue = deque()
+        self._spill = _SpillFile()
+        self._wake = asyncio.Event()
+        self._writing = False  # the writer task is waiting for a drain or writing
+        self._closed = False
+        self._task = None
+
+    @property
+    def depth(self) -> int:
+        """Frames waiting to be written, in memory and spilled"""
+        return len(self._queue) + self._spill.count
+
+    def put(self, data) -> bool:
+        """Queue data for the connection without waiting. False once it is closed."""
+        if self._closed:
+            return False
+        transport = self.writer.transport
+        if transport.is_closing():
+            self.close()
+            return False
+        if (not self._writing and not self._queue and not self._spill.count
+                and transport.get_write_buffer_size() < transport.get_write_buffer_limits()[1]):
+            self.writer.write(data)
+            self.sent += 1
+            return True
+        if self._spill.count or len(self._queue) >= self.limit:
+            if self.policy == "disconnect":
+                self.close(abort=True)
+                return False
+            if self.policy == "persist":
+                self._spill.append(data)
+                self.spilled += 1
+            else:
+                self._queue.popleft()
+                self.dropped += 1
+                self._queue.append(bytes(data))
+        else:
+            self._queue.append(bytes(data))
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self._wake.set()
+        return True
+
+    async def _run(self):
+        while not self._closed:
+            if not self._queue and not self._spill.count:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            self._writing = True
+            try:
+                await self.writer.drain()
+                if self._closed:
+                    return
+                if self._queue:
+                    batch = [self._queue.popleft()]
+                    size = len(batch[0])
+                    while self._queue and size < WRITE_BATCH_BYTES:
+                        batch.append(self._queue.popleft())
+                        size += len(batch[-1])
+                else:
+                    batch = [self._spill.pop()]
+                self.writer.write(batch[0] if len(batch) == 1 else b''.join(batch))
+                self.sent += len(batch)
+            except Exception:
+                self.close(abort=True)
+                return
+            finally:
+                self._writing = False
+
+    def close(self, abort: bool = False):
+        """Stop writing; abort drops unsent data (a client that stopped reading)"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._spill.close()
+        if abort:
+            self.writer.transport.abort()
+        else:
+            self.writer.close()
+        if self._on_close is not None:
+            self._on_close(self.writer)
+
+    def stats(self) -> Dict:
+        return {"depth": self.depth, "sent": self.sent, "dropped": self.dropped,
+                "spilled": self.spilled, "closed": self._closed}
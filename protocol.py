@@ -0,0 +1,257 @@
+# protocol.py
+# Length-prefixed binary framing shared by server.py, client.py and app.py.
+#
+# Every frame is an 8-byte header followed by three variable-length fields:
+#
+#   version (1) | type (1) | sender_len (1) | recipient_len (1) | body_len (4)
+#   sender (utf-8) | recipient (utf-8) | body (raw ciphertext bytes)
+#
+# The version byte is 0xF8 | PROTOCOL_VERSION. Bytes 0xF8-0xFF never appear
+# in UTF-8 text, so the server can tell a framed client from a legacy
+# raw-text client by looking at the first byte it receives.
+import os
+import struct
+import threading
+from typing import Iterator, List, NamedTuple, Tuple
+
+PROTOCOL_VERSION = 1
+VERSION_BYTE = 0xF8 | PROTOCOL_VERSION
+
+HEADER = struct.Struct('!BBBBI')
+HEADER_SIZE = HEADER.size
+MAX_NAME = 255
+MAX_BODY = 16 * 1024 * 1024
+
+# Frame types
+FRAME_HELLO = 1      # sender = nickname, sent once right after connecting
+FRAME_MESSAGE = 2    # sender -> recipient ciphertext (no recipient = everyone)
+FRAME_BROADCAST = 3  # fan-out to a room (recipient = room name) or everyone
+FRAME_JOIN = 4       # recipient = room to join
+FRAME_LEAVE = 5      # recipient = room to leave
+
+# FrameReader buffers: RECV_BUFFER_SIZE bytes each, at most POOL_KEEP idle
+# ones are kept for reuse
+RECV_BUFFER_SIZE = int(os.environ.get('MSECURE_RECV_BUFFER', str(64 * 1024)))
+POOL_KEEP = int(os.environ.get('MSECURE_RECV_POOL', '256'))
+
+# Consumed bytes are only discarded from the decoder buffer once they pass
+# this size, so a burst of small frames does not memmove the buffer each time.
+COMPACT_THRESHOLD = 64 * 1024
+
+class ProtocolError(ValueError):
+    pass
+
+class Frame(NamedTuple):
+    type: int
+    sender: str = ''
+    recipient: str = ''
+    body: bytes = b''  # a memoryview for frames from FrameReader
+
+def encode_frame(frame_type: int, sender: str = '', recipient: str = '', body=b'') -> bytes:
+    """Serialize one frame. body may be bytes or str (encoded as UTF-8)."""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    s = sender.encode('utf-8')
+    r = recipient.encode('utf-8')
+    if len(s) > MAX_NAME or len(r) > MAX_NAME:
+        raise ProtocolError("Sender/recipient name too long")
+    if len(body) > MAX_BODY:
+        raise ProtocolError("Frame body too large")
+    return HEADER.pack(VERSION_BYTE, frame_type, len(s), len(r), len(body)) + s + r + body
+
+def encode(frame: Frame) -> bytes:
+    return encode_frame(frame.type, frame.sender, frame.recipient, frame.body)
+
+def decode(data) -> Frame:
+    """Parse one complete frame. The body is a view when data is a memoryview."""
+    if len(data) < HEADER_SIZE:
+        raise ProtocolError("Incomplete frame")
+    version, frame_type, slen, rlen, blen = HEADER.unpack_from(data)
+    if version != VERSION_BYTE:
+        raise ProtocolError(f"Unsupported protocol version byte 0x{version:02x}")
+    r = HEADER_SIZE + slen
+    b = r + rlen
+    if b + blen != len(data):
+        raise ProtocolError("Frame length does not match its header")
+    return Frame(frame_type, str(data[HEADER_SIZE:r], 'utf-8', 'replace'),
+                 str(data[r:b], 'utf-8', 'replace'), data[b:])
+
+def hello(nickname: str) -> bytes:
+    return encode_frame(FRAME_HELLO, nickname)
+
+def message(sender: str, recipient: str, ciphertext) -> bytes:
+    return encode_frame(FRAME_MESSAGE, sender, recipient, ciphertext)
+
+def broadcast(sender: str, ciphertext, room: str = '') -> bytes:
+    return encode_frame(FRAME_BROADCAST, sender, room, ciphertext)
+
+def join(room: str) -> bytes:
+    return encode_frame(FRAME_JOIN, recipient=room)
+
+def leave(room: str) -> bytes:
+    return encode_frame(FRAME_LEAVE, recipient=room)
+
+def is_framed(data: bytes) -> bool:
+    """True if a connection's first bytes start with a frame header"""
+    return len(data) > 0 and data[0] == VERSION_BYTE
+
+class FrameDecoder:
+    """
+    Streaming decoder: feed() it whatever recv() returned and get back every
+    complete frame. Partial frames stay buffered until the rest arrives;
+    coalesced frames are all returned from one call.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def feed(self, data) -> List[Frame]:
+        buf = self._buf
+        buf += data
+        pos = self._pos
+        end = len(buf)
+        frames = []
+        while end - pos >= HEADER_SIZE:
+            version, frame_type, slen, rlen, blen = HEADER.unpack_from(buf, pos)
+            if version != VERSION_BYTE:
+                raise ProtocolError(f"Unsupported protocol version byte 0x{version:02x}")
+            if blen > MAX_BODY:
+                raise ProtocolError("Frame body too large")
+            start = pos + HEADER_SIZE
+            stop = start + slen + rlen + blen
+            if stop > end:
+                break
+            r = start + slen
+            b = r + rlen
+            frames.append(Frame(
+                frame_type,
+                buf[start:r].decode('utf-8', errors='replace'),
+                buf[r:b].decode('utf-8', errors='replace'),
+                bytes(buf[b:stop]),
+            ))
+            pos = stop
+
+        if pos == end:
+            buf.clear()
+            pos = 0
+        elif pos >= COMPACT_THRESHOLD:
+            del buf[:pos]
+            pos = 0
+        self._pos = pos
+        return frames
+
+    def pending(self) -> int:
+        """Number of buffered bytes that do not yet form a complete frame"""
+        return len(self._buf) - self._pos
+
+class BufferPool:
+    """Recycled bytearrays for recv_into, so connections do not allocate per read"""
+
+    def __init__(self, size: int = RECV_BUFFER_SIZE, keep: int = POOL_KEEP):
+        self.size = size
+        self.keep = keep
+        self.allocated = 0
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bytearray:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            self.allocated += 1
+        return bytearray(self.size)
+
+    def release(self, buf: bytearray):
+        if len(buf) != self.size:
+            return
+        with self._lock:
+            if len(self._free) < self.keep:
+                self._free.append(buf)
+
+    def idle(self) -> int:
+        with self._lock:
+            return len(self._free)
+
+class FrameReader:
+    """
+    Zero-copy counterpart of FrameDecoder for socket connections: recv_into()
+    fills a pooled buffer and frames() parses it in place, yielding
+    (frame, wire) where frame.body and wire (the frame's complete encoding)
+    are memoryviews into that buffer. They are valid only until the next
+    recv_into(); anything that keeps one must copy it with bytes().
+    """
+
+    def __init__(self, pool: BufferPool, initial=b''):
+        self._pool = pool
+        self._buf = pool.acquire()
+        self._view = memoryview(self._buf)
+        self._start = 0   # first byte not yet returned as a frame
+        self._end = 0     # end of received data
+        self._need = 0    # size of a frame that does not fit the buffer
+        if initial:
+            self._reserve(len(initial))
+            self._view[:len(initial)] = initial
+            self._end = len(initial)
+
+    def _reserve(self, room: int):
+        """make room for at least `room` more bytes after the unparsed data"""
+        pending = self._end - self._start
+        if pending == 0 and len(self._buf) != self._pool.size and room <= self._pool.size:
+            # an oversized frame has been consumed: go back to a pooled buffer
+            self._swap(self._pool.acquire())
+        if self._end + room <= len(self._buf):
+            return
+        if pending + room > len(self._buf):
+            buf = bytearray(max(pending + room, 2 * len(self._buf)))
+            buf[:pending] = self._view[self._start:self._end]
+            self._swap(buf, pending)
+            return
+        # move the partial frame to the front of the buffer
+        self._view[:pending] = bytes(self._view[self._start:self._end])
+        self._start, self._end = 0, pending
+
+    def _swap(self, buf: bytearray, pending: int = 0):
+        self._pool.release(self._buf)
+        self._buf = buf
+        self._view = memoryview(buf)
+        self._start, self._end = 0, pending
+
+    def recv_into(self, sock) -> int:
+        """Read once from sock. Returns the byte count (0 at EOF)."""
+        if self._start == self._end:
+            self._start = self._end = 0
+        self._reserve(max(self._need - (self._end - self._start), 1))
+        n = sock.recv_into(self._view[self._end:])
+        self._end += n
+        return n
+
+    def frames(self) -> Iterator[Tuple[Frame, memoryview]]:
+        buf, view = self._buf, self._view
+        pos, end = self._start, self._end
+        self._need = 0
+        while end - pos >= HEADER_SIZE:
+            version, frame_type, slen, rlen, blen = HEADER.unpack_from(buf, pos)
+            if version != VERSION_BYTE:
+                raise ProtocolError(f"Unsupported protocol version byte 0x{version:02x}")
+            if blen > MAX_BODY:
+                raise ProtocolError("Frame body too large")
+            start = pos + HEADER_SIZE
+            stop = start + slen + rlen + blen
+            if stop > end:
+                self._need = stop - pos
+                break
+            r = start + slen
+            b = r + rlen
+            frame = Frame(
+                frame_type,
+                str(view[start:r], 'utf-8', 'replace') if slen else '',
+                str(view[r:b], 'utf-8', 'replace') if rlen else '',
+                view[b:stop],
+            )
+            wire = view[pos:stop]
+            pos = self._start = stop
+            yield frame, wire
+
+    def close(self):
+        self._pool.release(self._buf)
@@ -0,0 +1,151 @@
+# relay_log.py
+# Ciphertext log for the relay servers. The relay path only appends
+# (nickname, body) to a bounded in-memory queue; a background thread does
+# the decoding and optional cryptanalysis (RSA integer / Caesar guess) and
+# writes one JSON line per message, a batch at a time.
+#
+#   MSECURE_LOG_SAMPLE   fraction of relayed messages logged (0 turns logging off)
+#   MSECURE_LOG_INSPECT  1 to add the RSA integer / Caesar guess, 0 for ciphertext only
+#   MSECURE_LOG_QUEUE    records waiting for the worker before the drop policy applies
+#   MSECURE_LOG_DROP     "newest" drops incoming records when full, "oldest" evicts the oldest
+#   MSECURE_LOG_PATH     append to this file instead of stdout
+import atexit
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, TextIO
+from crypto import caesar_break
+
+LOG_SAMPLE = float(os.environ.get('MSECURE_LOG_SAMPLE', '1.0'))
+LOG_INSPECT = os.environ.get('MSECURE_LOG_INSPECT', '1') != '0'
+LOG_QUEUE = int(os.environ.get('MSECURE_LOG_QUEUE', '10000'))
+LOG_DROP = os.environ.get('MSECURE_LOG_DROP', 'newest')
+LOG_PATH = os.environ.get('MSECURE_LOG_PATH', '')
+LOG_BATCH = 256            # records per write
+LOG_FLUSH_INTERVAL = 0.2   # seconds a partial batch may wait
+LOG_INSPECT_CHARS = 4096   # longer ciphertexts are inspected by their prefix
+DROP_POLICIES = ("newest", "oldest")
+
+def inspect(body: bytes) -> Dict:
+    """The log fields for one ciphertext: its RSA integer, or a Caesar guess"""
+    msg = body[:LOG_INSPECT_CHARS].decode('utf-8', errors='ignore')
+    # RSA 1024 bits is ~256 hex chars. We use a threshold to distinguish from short text.
+    if len(msg) > 32:
+        try:
+            return {"c": str(int(msg, 16))}
+        except ValueError:
+            pass
+    record = {"ciphertext": msg}
+    try:
+        record["plaintext"], record["shift"] = caesar_break(msg)
+    except Exception:
+        pass
+    return record
+
+class CiphertextLog:
+    """
+    submit() is safe to call from any thread or the event loop and never
+    blocks: it is a sampling draw and a deque append. Once `queue_size`
+    records are waiting, the drop policy decides which record is lost;
+    drops are counted and reported in the log itself.
+    """
+
+    def __init__(self, sample: float = LOG_SAMPLE, inspect_ciphertext: bool = LOG_INSPECT,
+                 queue_size: int = LOG_QUEUE, drop: str = LOG_DROP, stream: Optional[TextIO] = None,
+                 batch: int = LOG_BATCH, flush_interval: float = LOG_FLUSH_INTERVAL):
+        if drop not in DROP_POLICIES:
+            raise ValueError(f"drop policy must be one of {DROP_POLICIES}")
+        self.sample = sample
+        self.inspect = inspect_ciphertext
+        self.queue_size = queue_size
+        self.drop = drop
+        self.batch = batch
+        self.flush_interval = flush_interval
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self._reported_drops = 0
+        self._stream = stream
+        # "oldest" lets the deque evict; "newest" checks the length before appending
+        self._queue = deque(maxlen=queue_size if drop == "oldest" else None)
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='relay-log', daemon=True)
+        self._thread.start()
+
+    def submit(self, nickname: str, body: bytes):
+        if self.sample < 1.0 and random.random() >= self.sample:
+            return
+        self.submitted += 1
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            if self.drop == "newest":
+                return
+        # bodies may be views into a reused receive buffer
+        self._queue.append((time.time(), nickname, bytes(body)))
+        if len(self._queue) >= self.batch:
+            self._wake.set()
+
+    def close(self, timeout: Optional[float] = None):
+        """Write out everything still queued and stop the worker"""
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _format(self, ts: float, nickname: str, body: bytes) -> str:
+        record = {"ts": round(ts, 6), "from": nickname, "bytes": len(body)}
+        if self.inspect:
+            record.update(inspect(body))
+        else:
+            record["ciphertext"] = body[:LOG_INSPECT_CHARS].decode('utf-8', errors='ignore')
+        return json.dumps(record, ensure_ascii=False)
+
+    def _write_batch(self) -> int:
+        lines = []
+        while len(lines) < self.batch:
+            try:
+                lines.append(self._format(*self._queue.popleft()))
+            except IndexError:
+                break
+        records = len(lines)
+        dropped = self.dropped
+        if dropped != self._reported_drops:
+            lines.append(json.dumps({"ts": round(time.time(), 6), "dropped": dropped - self._reported_drops}))
+            self._reported_drops = dropped
+        if lines:
+            stream = self._stream or sys.stdout
+            try:
+                stream.write('\n'.join(lines) + '\n')
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+            self.written += records
+        return records
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            while self._write_batch() >= self.batch:
+                pass
+            if self._closed and not self._queue:
+                return
+
+_log = None
+_log_lock = threading.Lock()
+
+def get_ciphertext_log() -> Optional[CiphertextLog]:
+    """Process-wide CiphertextLog from the LOG_* settings; None when logging is off"""
+    global _log
+    if _log is not None or LOG_SAMPLE <= 0:
+        return _log
+    with _log_lock:
+        if _log is None:
+            stream = open(LOG_PATH, 'a', encoding='utf-8') if LOG_PATH else None
+            _log = CiphertextLog(stream=stream)
+            atexit.register(_log.close, 1.0)
+        return _log
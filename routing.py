@@ -0,0 +1,74 @@
+# routing.py
+# Username -> connection routing index shared by both server engines.
+# Direct messages go only to the recipient's sessions; fan-out happens only
+# for explicit FRAME_BROADCAST frames (to a room, or to everyone).
+import threading
+from protocol import Frame, FRAME_BROADCAST, FRAME_MESSAGE
+
+class RoutingTable:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.users = {}  # username -> set of connections (one per session)
+        self.names = {}  # connection -> username
+        self.rooms = {}  # room name -> set of connections
+
+    def __contains__(self, conn):
+        return conn in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, conn, username: str):
+        """Route username to conn; a connection that renames itself leaves its old name"""
+        with self._lock:
+            previous = self.names.get(conn)
+            if previous is not None and previous != username:
+                sessions = self.users.get(previous)
+                if sessions is not None:
+                    sessions.discard(conn)
+                    if not sessions:
+                        del self.users[previous]
+            self.names[conn] = username
+            self.users.setdefault(username, set()).add(conn)
+
+    def remove(self, conn):
+        with self._lock:
+            username = self.names.pop(conn, None)
+            if username is not None:
+                sessions = self.users.get(username)
+                if sessions is not None:
+                    sessions.discard(conn)
+                    if not sessions:
+                        del self.users[username]
+            for room in [r for r, members in self.rooms.items() if conn in members]:
+                self.rooms[room].discard(conn)
+                if not self.rooms[room]:
+                    del self.rooms[room]
+
+    def join(self, conn, room: str):
+        with self._lock:
+            self.rooms.setdefault(room, set()).add(conn)
+
+    def leave(self, conn, room: str):
+        with self._lock:
+            members = self.rooms.get(room)
+            if members is not None:
+                members.discard(conn)
+                if not members:
+                    del self.rooms[room]
+
+    def connections(self):
+        with self._lock:
+            return list(self.names)
+
+    def targets(self, sender_conn, frame: Frame) -> list:
+        """Connections a frame from sender_conn should be delivered to"""
+        with self._lock:
+            if frame.type == FRAME_MESSAGE and frame.recipient:
+                candidates = self.users.get(frame.recipient, ())
+            elif frame.type == FRAME_BROADCAST and frame.recipient:
+                candidates = self.rooms.get(frame.recipient, ())
+            else:
+                # broadcast to everyone (also legacy clients, which have no recipient)
+                candidates = self.names
+            return [c for c in candidates if c is not sender_conn]
@@ -1,83 +1,271 @@
 # server.py
+import argparse
+import json
+import os
 import socket
 import threading
-from crypto import caesar_break
+import time
+from typing import Dict, List
+import crypto
+import protocol
+from protocol import (BufferPool, Frame, FrameDecoder, FrameReader, FRAME_HELLO,
+                      FRAME_MESSAGE, FRAME_BROADCAST, FRAME_JOIN, FRAME_LEAVE)
+import outbound as outbound_queues
+from outbound import OutboundQueue
+from relay_log import get_ciphertext_log
+from routing import RoutingTable
 
 HOST = '127.0.0.1'   # localhost for testing
 PORT = 65432
 
-clients = {}  # socket -> nickname
+RECV_SIZE = 65536
+LEGACY_RECV_SIZE = 4096
 
-def broadcast(sender_sock, data: bytes):
-    # forward ciphertext to all other clients (or implement targeted forwarding)
-    for sock in list(clients.keys()):
-        if sock is not sender_sock:
-            try:
-                sock.sendall(data)
-            except:
-                sock.close()
-                del clients[sock]
+# zerocopy: connections read into pooled buffers (protocol.FrameReader) and
+# relay frame bodies as views into them; copy: a new bytes object per recv
+RELAY_MODES = ("zerocopy", "copy")
+RELAY_MODE = os.environ.get('MSECURE_RELAY', 'zerocopy')
+buffers = BufferPool()
+# what a client's full outbound queue does with more frames (outbound.py)
+OUTBOUND_POLICY = outbound_queues.OUTBOUND_POLICY
 
-def handle_client(conn, addr):
-    print(f"[+] Connected {addr}")
+routes = RoutingTable()  # username <-> sockets, rooms
+framed_clients = set()  # sockets speaking the protocol.py framing
+outbound = {}  # socket -> OutboundQueue, created when the client registers
+bus = None  # supervisor.WorkerBus when running as one of several worker processes
+cluster = None  # cluster.ClusterNode when running as one node of a cluster
+
+def log_ciphertext(nickname: str, body: bytes):
+    """Queue a relayed ciphertext for the background log (relay_log.py)"""
+    log = get_ciphertext_log()
+    if log is not None:
+        log.submit(nickname, body)
+
+def forward(sender_sock, frame: Frame, wire=None):
+    """
+    Hand a frame to the outbound queue of every connection the routing
+    table selects; a slow recipient only ever delays itself. `wire` is the
+    frame's encoding when the caller already has it (e.g. a view of the
+    received bytes); otherwise it is encoded once for all targets.
+    """
+    framed_data = protocol.encode(frame) if wire is None else wire
+    body = frame.body
+    for sock in routes.targets(sender_sock, frame):
+        queue = outbound.get(sock)
+        if queue is None:
+            continue
+        # legacy clients only understand the raw ciphertext
+        framed = sock in framed_clients
+        data = framed_data if framed else body
+        if queue.depth and isinstance(data, memoryview):
+            # a backed-up client will queue the frame: copy the received
+            # view once and share the copy with every other such client
+            data = bytes(data)
+            if framed:
+                framed_data = data
+            else:
+                body = data
+        queue.put(data)
+    # frames from the bus or another node (no sender socket) are not passed on again
+    if bus is not None and sender_sock is not None:
+        bus.publish(framed_data)
+    if cluster is not None and sender_sock is not None:
+        cluster.publish(frame, framed_data)
+
+def _unroute(sock):
+    """Stop routing to a connection (closed by its outbound queue or its reader)"""
+    nickname = routes.names.get(sock)
+    routes.remove(sock)
+    framed_clients.discard(sock)
+    if cluster is not None and nickname is not None:
+        cluster.update(nickname)
+
+def outbound_stats() -> List[Dict]:
+    """Per-client outbound queue gauges (depth, sent, dropped, spilled)"""
+    return [{"client": routes.names.get(sock, ''), **queue.stats()} for sock, queue in list(outbound.items())]
+
+def report_outbound(interval: float):
+    """Print the gauges of backed-up clients every `interval` seconds"""
+    while True:
+        time.sleep(interval)
+        backed_up = [g for g in outbound_stats() if g["depth"] or g["dropped"] or g["spilled"]]
+        print(json.dumps({"ts": round(time.time(), 3), "clients": len(outbound), "outbound": backed_up}))
+
+def register(conn, addr, nickname: str) -> str:
+    if not nickname:
+        nickname = str(addr)
+    previous = routes.names.get(conn)
+    routes.add(conn, nickname)
+    if conn not in outbound:
+        outbound[conn] = OutboundQueue(conn, policy=OUTBOUND_POLICY, on_close=_unroute)
+    if cluster is not None:
+        cluster.update(nickname)
+        if previous is not None and previous != nickname:
+            cluster.update(previous)
+    print(f"Client name: {nickname}")
+    return nickname
+
+def relay(conn, nickname: str, frame: Frame, wire=None):
+    # data is expected to be ciphertext bytes; only queued here, the
+    # relay_log worker decodes and inspects it
+    log_ciphertext(nickname, frame.body)
+    # Forward ciphertext, stamped with the registered sender. Clients stamp
+    # their own nickname, so the received bytes can usually go out unchanged.
+    if frame.sender != nickname:
+        frame, wire = frame._replace(sender=nickname), None
+    forward(conn, frame, wire)
+
+def handle_frame(conn, addr, nickname, frame: Frame, wire=None):
+    """Apply one frame from a framed client. Returns the (possibly new) nickname."""
+    if frame.type == FRAME_HELLO:
+        return register(conn, addr, frame.sender.strip())
+    if nickname is None:
+        return None
+    if frame.type in (FRAME_MESSAGE, FRAME_BROADCAST):
+        relay(conn, nickname, frame, wire)
+    elif frame.type == FRAME_JOIN:
+        routes.join(conn, frame.recipient)
+    elif frame.type == FRAME_LEAVE:
+        routes.leave(conn, frame.recipient)
+    return nickname
+
+def read_frames(conn, addr, data: bytes):
+    """Framed client loop, parsing in place from a pooled buffer"""
+    reader = FrameReader(buffers, data)
+    try:
+        nickname = None
+        while True:
+            for frame, wire in reader.frames():
+                nickname = handle_frame(conn, addr, nickname, frame, wire)
+            if not reader.recv_into(conn):
+                break
+    finally:
+        reader.close()
+
+def read_legacy(conn, nickname: str):
+    """Legacy client loop: every recv is one ciphertext for everyone"""
+    buf = buffers.acquire()
+    view = memoryview(buf)[:LEGACY_RECV_SIZE]
     try:
-        # first message: nickname (plaintext or encrypted? for simplicity, treat nickname as first message in plain)
-        nickname = conn.recv(1024).decode('utf-8', errors='ignore').strip()
-        if not nickname:
-            nickname = str(addr)
-        clients[conn] = nickname
-        print(f"Client name: {nickname}")
         while True:
-            data = conn.recv(4096)
-            if not data:
+            n = conn.recv_into(view)
+            if not n:
                 break
-            # data is expected to be ciphertext bytes
-            msg = data.decode('utf-8', errors='ignore')
-            
-            # Log ciphertext only:
-            # If it looks like RSA (long hex string), print the integer value c (result of the formula)
-            try:
-                # RSA 1024 bits is ~256 hex chars. We use a threshold to distinguish from short text.
-                if len(msg) > 32: 
-                    c_val = int(msg, 16)
-                    print(f"[Encrypted log] from {nickname}: c = {c_val}")
-                else:
-                    # Try to auto-break Caesar for logging purposes
-                    try:
-                        broken_text, shift = caesar_break(msg)
-                        # Only show if it looks meaningful (shift != 0 or just show it anyway)
-                        print(f"[Encrypted log] from {nickname}: {msg} -> {broken_text} (shift {shift})")
-                    except:
-                        print(f"[Encrypted log] from {nickname}: {msg}")
-            except ValueError:
-                # Not a hex string (e.g. Caesar text), print as is
-                try:
-                    broken_text, shift = caesar_break(msg)
-                    print(f"[Encrypted log] from {nickname}: {msg} -> {broken_text} (shift {shift})")
-                except:
-                    print(f"[Encrypted log] from {nickname}: {msg}")
-
-            # Forward ciphertext to other clients
-            broadcast(conn, data)
+            relay(conn, nickname, Frame(FRAME_BROADCAST, nickname, '', view[:n]))
+    finally:
+        buffers.release(buf)
+
+def handle_client(conn, addr):
+    print(f"[+] Connected {addr}")
+    try:
+        data = conn.recv(1024)
+        if protocol.is_framed(data):
+            framed_clients.add(conn)
+            if RELAY_MODE == "zerocopy":
+                read_frames(conn, addr, data)
+                return
+            decoder = FrameDecoder()
+            nickname = None
+            while data:
+                for frame in decoder.feed(data):
+                    nickname = handle_frame(conn, addr, nickname, frame)
+                data = conn.recv(RECV_SIZE)
+        else:
+            # legacy client: first message is the plain nickname, then every
+            # recv() is treated as one ciphertext for everyone
+            nickname = register(conn, addr, data.decode('utf-8', errors='ignore').strip())
+            if RELAY_MODE == "zerocopy":
+                read_legacy(conn, nickname)
+                return
+            while True:
+                data = conn.recv(LEGACY_RECV_SIZE)
+                if not data:
+                    break
+                relay(conn, nickname, Frame(FRAME_BROADCAST, nickname, '', data))
     except Exception as e:
         print("Client error:", e)
     finally:
         print(f"[-] Disconnected {addr}")
-        if conn in clients:
-            del clients[conn]
+        _unroute(conn)
+        queue = outbound.pop(conn, None)
+        if queue is not None:
+            queue.close()
         conn.close()
 
-def main():
+def serve_threaded(host=HOST, port=PORT, reuse_port=False):
+    """Thread-per-connection engine (the original server)"""
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         # Allow reusing the address to avoid "Address already in use" errors
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
+        if reuse_port:
+            # several worker processes accept on the same port (supervisor.py)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        s.bind((host, port))
         s.listen()
-        print(f"Server listening on {HOST}:{PORT}")
+        print(f"Server listening on {host}:{port}")
         while True:
             conn, addr = s.accept()
             t = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
             t.start()
 
+ENGINES = ("threaded", "asyncio")
+
+def main(argv=None):
+    global RELAY_MODE, OUTBOUND_POLICY, cluster
+    parser = argparse.ArgumentParser(description="Secured Messenger relay server")
+    parser.add_argument("--engine", choices=ENGINES, default="threaded",
+                        help="threaded: one thread per client, asyncio: single event loop")
+    parser.add_argument("--host", default=None, help=f"default {HOST}, or the cluster node's address")
+    parser.add_argument("--port", type=int, default=None, help=f"default {PORT}, or the cluster node's address")
+    parser.add_argument("--relay", choices=RELAY_MODES, default=RELAY_MODE,
+                        help="threaded engine: zerocopy reads into pooled buffers, copy allocates per recv")
+    parser.add_argument("--stats-interval", type=float, default=0,
+                        help="threaded engine: print outbound queue gauges every N seconds (0 = off)")
+    parser.add_argument("--outbound-policy", choices=outbound_queues.POLICIES, default=OUTBOUND_POLICY,
+                        help="full client queue drops its oldest frame, disconnects, or spills to disk")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="threaded engine: worker processes sharing the port (SO_REUSEPORT)")
+    parser.add_argument("--cluster-node", default=None,
+                        help="threaded engine: run as this node of the cluster (cluster.py)")
+    parser.add_argument("--cluster-nodes", default=None,
+                        help="name=host:port,... for every node (default MSECURE_CLUSTER_NODES)")
+    parser.add_argument("--backplane", default=None,
+                        help="backplane URL, e.g. local://127.0.0.1:7700 (default MSECURE_BACKPLANE)")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and args.engine != "threaded":
+        parser.error("--workers needs the threaded engine")
+    if args.cluster_node and (args.engine != "threaded" or args.workers > 1):
+        parser.error("--cluster-node needs the threaded engine with one worker")
+    host, port = args.host or HOST, args.port or PORT
+    if args.cluster_node:
+        import cluster as cluster_mode
+        nodes_spec = args.cluster_nodes or cluster_mode.CLUSTER_NODES
+        try:
+            node_host, node_port = cluster_mode.parse_nodes(nodes_spec)[args.cluster_node]
+        except (KeyError, ValueError):
+            parser.error(f"--cluster-node {args.cluster_node} is not in the cluster nodes {nodes_spec!r}")
+        host, port = args.host or node_host, args.port or node_port
+    RELAY_MODE = args.relay
+    OUTBOUND_POLICY = args.outbound_policy
+    crypto.enable_parallel_search()
+    if args.stats_interval > 0 and args.engine == "threaded" and args.workers == 1:
+        threading.Thread(target=report_outbound, args=(args.stats_interval,), daemon=True).start()
+
+    if args.engine == "asyncio":
+        from async_server import serve_asyncio
+        serve_asyncio(host, port, outbound_policy=args.outbound_policy)
+    elif args.workers > 1:
+        from supervisor import serve_workers
+        serve_workers(host, port, args.workers, relay=args.relay,
+                      outbound_policy=args.outbound_policy, stats_interval=args.stats_interval)
+    else:
+        if args.cluster_node:
+            cluster = cluster_mode.start_node(
+                args.cluster_node, nodes_spec, args.backplane or cluster_mode.BACKPLANE,
+                deliver=lambda frame, wire: forward(None, frame, wire),
+                is_local=lambda user: user in routes.users)
+            print(f"Cluster node {args.cluster_node} via {args.backplane or cluster_mode.BACKPLANE}")
+        serve_threaded(host, port)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,378 @@
+# storage.py
+# Pluggable persistence for users and messages.
+#
+#   file   - users.json + the append-only message log (message_store.py)
+#   sqlite - one SQLite database in WAL mode, safe for concurrent writers
+#
+# The backend is chosen with the MSECURE_STORAGE environment variable
+# ("file" by default). auth.py and app.py only talk to get_backend().
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from message_store import open_log
+
+BACKEND = os.environ.get('MSECURE_STORAGE', 'file')
+USERS_FILE = 'users.json'
+MESSAGES_FILE = 'messages.json'  # legacy store, migrated into the log on first use
+MESSAGES_LOG_DIR = 'messages_log'
+SQLITE_PATH = os.environ.get('MSECURE_DB', 'msecure.db')
+
+class StorageBackend:
+    """Interface every backend implements"""
+
+    # users: username -> bcrypt hash
+    def load_users(self) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def save_users(self, users: Dict[str, str]):
+        raise NotImplementedError
+
+    def get_user(self, username: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def add_user(self, username: str, hashed: str) -> bool:
+        """Insert a new user. Returns False if the username is taken."""
+        raise NotImplementedError
+
+    def set_user(self, username: str, hashed: str):
+        """Insert or replace one user's password hash"""
+        raise NotImplementedError
+
+    # messages: dicts with sender, recipient, text, ciphertext, ...
+    def load_messages(self) -> List[Dict]:
+        raise NotImplementedError
+
+    def add_message(self, message: Dict):
+        raise NotImplementedError
+
+    def add_messages(self, messages: List[Dict]):
+        for message in messages:
+            self.add_message(message)
+
+    def conversation(self, user_a: str, user_b: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def conversation_page(self, user_a: str, user_b: str, limit: int,
+                          before=None) -> Tuple[List[Dict], Optional[object]]:
+        """
+        Up to `limit` messages of a chat older than the opaque cursor
+        `before` (None = the newest), oldest first. Returns the messages and
+        the cursor for the next older page, or None at the start of the chat.
+        """
+        messages = self.conversation(user_a, user_b)
+        end = len(messages) if before is None else before
+        start = max(0, end - limit)
+        return messages[start:end], (start if start > 0 else None)
+
+def _file_signature(path: str):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+class UserDirectory:
+    """
+    In-memory cache of users.json plus an append-only journal of changes.
+
+    Lookups are dict hits. The files are re-checked (stat only) at most every
+    CHECK_INTERVAL seconds, and only the new journal lines are parsed when
+    another process has registered someone. Registrations and password
+    changes append one line to the journal with O_APPEND, so they never
+    rewrite users.json and never lose a concurrent writer's entry.
+    save_users() still rewrites users.json atomically and empties the journal.
+    """
+
+    CHECK_INTERVAL = 0.1
+
+    def __init__(self, path: str = USERS_FILE, check_interval: float = CHECK_INTERVAL):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + '.journal'
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._users = {}
+        self._base_sig = False  # never matches, forces the first load
+        self._journal_sig = None
+        self._journal_pos = 0
+        self._checked = 0.0
+
+    def _apply(self, entry: Dict):
+        if entry.get("op") == "set":
+            self._users[entry["username"]] = entry["hash"]
+        else:
+            # concurrent adds of one name: the first journal line wins
+            self._users.setdefault(entry["username"], entry["hash"])
+
+    def _read_journal(self):
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_pos)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    self._apply(json.loads(line))
+                    self._journal_pos += len(line)
+        except FileNotFoundError:
+            pass
+        self._journal_sig = _file_signature(self.journal_path)
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            base_sig = _file_signature(self.path)
+            journal_sig = _file_signature(self.journal_path)
+            if base_sig != self._base_sig or (
+                    journal_sig is not None and journal_sig[2] < self._journal_pos) or (
+                    journal_sig is None and self._journal_pos):
+                # users.json replaced or journal truncated: full reload
+                users = {}
+                if base_sig is not None:
+                    with open(self.path, 'r') as f:
+                        users = json.load(f)
+                self._users = users
+                self._base_sig = base_sig
+                self._journal_pos = 0
+                self._read_journal()
+            elif journal_sig != self._journal_sig:
+                self._read_journal()
+
+    def get(self, username: str) -> Optional[str]:
+        self.refresh()
+        return self._users.get(username)
+
+    def snapshot(self) -> Dict[str, str]:
+        with self._lock:
+            self.refresh()
+            return dict(self._users)
+
+    def _append(self, entry: Dict):
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, json.dumps(entry, separators=(',', ':')).encode('utf-8') + b'\n')
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def add(self, username: str, hashed: str) -> bool:
+        with self._lock:
+            self.refresh(force=True)
+            if username in self._users:
+                return False
+            self._append({"op": "add", "username": username, "hash": hashed})
+            self.refresh(force=True)
+            # another process may have appended the same name just before us
+            return self._users.get(username) == hashed
+
+    def set(self, username: str, hashed: str):
+        with self._lock:
+            self._append({"op": "set", "username": username, "hash": hashed})
+            self.refresh(force=True)
+
+    def replace_all(self, users: Dict[str, str]):
+        with self._lock:
+            tmp = f"{self.path}.tmp{os.getpid()}"
+            with open(tmp, 'w') as f:
+                json.dump(users, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            if os.path.exists(self.journal_path):
+                os.truncate(self.journal_path, 0)
+            self.refresh(force=True)
+
+class FileBackend(StorageBackend):
+    def __init__(self, users_path: str = USERS_FILE, log_dir: str = MESSAGES_LOG_DIR,
+                 legacy_messages: str = MESSAGES_FILE):
+        self.users = UserDirectory(users_path)
+        self.log = open_log(log_dir, legacy_json=legacy_messages)
+
+    def load_users(self) -> Dict[str, str]:
+        return self.users.snapshot()
+
+    def save_users(self, users: Dict[str, str]):
+        self.users.replace_all(users)
+
+    def get_user(self, username: str) -> Optional[str]:
+        return self.users.get(username)
+
+    def add_user(self, username: str, hashed: str) -> bool:
+        return self.users.add(username, hashed)
+
+    def set_user(self, username: str, hashed: str):
+        self.users.set(username, hashed)
+
+    def load_messages(self) -> List[Dict]:
+        return self.log.load()
+
+    def add_message(self, message: Dict):
+        self.log.append(message)
+
+    def add_messages(self, messages: List[Dict]):
+        self.log.append_many(messages)
+
+    def conversation(self, user_a: str, user_b: str) -> List[Dict]:
+        return self.log.conversation(user_a, user_b)
+
+    def conversation_page(self, user_a: str, user_b: str, limit: int, before=None):
+        return self.log.conversation_page(user_a, user_b, limit, before)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username      TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    sender    TEXT,
+    recipient TEXT,
+    date      TEXT,
+    data      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_recipient_sender_date
+    ON messages (recipient, sender, date);
+CREATE INDEX IF NOT EXISTS idx_messages_recipient_sender_id
+    ON messages (recipient, sender, id);
+"""
+
+# Fixed SQL strings: sqlite3 keeps them in its per-connection statement
+# cache, so every call after the first reuses the prepared statement.
+SQL_INSERT_MESSAGE = "INSERT INTO messages (sender, recipient, date, data) VALUES (?, ?, ?, ?)"
+SQL_SELECT_MESSAGES = "SELECT data FROM messages ORDER BY id"
+SQL_SELECT_CONVERSATION = (
+    "SELECT data FROM messages WHERE (recipient = ? AND sender = ?) "
+    "OR (recipient = ? AND sender = ?) ORDER BY id"
+)
+# Each direction walks idx_messages_recipient_sender_id backwards from the
+# cursor, so a page costs O(limit) no matter how long the chat is. UNION (not
+# UNION ALL): in a chat with oneself both directions return the same rows.
+SQL_SELECT_CONVERSATION_PAGE = (
+    "SELECT id, data FROM ("
+    " SELECT * FROM (SELECT id, data FROM messages WHERE recipient = ? AND sender = ? AND id < ?"
+    "  ORDER BY id DESC LIMIT ?)"
+    " UNION"
+    " SELECT * FROM (SELECT id, data FROM messages WHERE recipient = ? AND sender = ? AND id < ?"
+    "  ORDER BY id DESC LIMIT ?)"
+    ") ORDER BY id DESC LIMIT ?"
+)
+SQL_INSERT_USER = "INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)"
+SQL_UPSERT_USER = "INSERT OR REPLACE INTO users (username, password_hash) VALUES (?, ?)"
+SQL_SELECT_USER = "SELECT password_hash FROM users WHERE username = ?"
+SQL_SELECT_USERS = "SELECT username, password_hash FROM users ORDER BY rowid"
+
+def _message_row(message: Dict):
+    return (message.get("sender"), message.get("recipient"), message.get("date"),
+            json.dumps(message, separators=(',', ':'), ensure_ascii=False))
+
+class SQLiteBackend(StorageBackend):
+    def __init__(self, path: str = SQLITE_PATH, busy_timeout: float = 30.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; each one shares the WAL file
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load_users(self) -> Dict[str, str]:
+        return dict(self._conn().execute(SQL_SELECT_USERS).fetchall())
+
+    def save_users(self, users: Dict[str, str]):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM users")
+            conn.executemany(SQL_UPSERT_USER, users.items())
+
+    def get_user(self, username: str) -> Optional[str]:
+        row = self._conn().execute(SQL_SELECT_USER, (username,)).fetchone()
+        return row[0] if row else None
+
+    def add_user(self, username: str, hashed: str) -> bool:
+        with self._conn() as conn:
+            return conn.execute(SQL_INSERT_USER, (username, hashed)).rowcount == 1
+
+    def set_user(self, username: str, hashed: str):
+        with self._conn() as conn:
+            conn.execute(SQL_UPSERT_USER, (username, hashed))
+
+    def load_messages(self) -> List[Dict]:
+        rows = self._conn().execute(SQL_SELECT_MESSAGES).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def add_message(self, message: Dict):
+        with self._conn() as conn:
+            conn.execute(SQL_INSERT_MESSAGE, _message_row(message))
+
+    def add_messages(self, messages: List[Dict]):
+        # one transaction for the whole batch
+        with self._conn() as conn:
+            conn.executemany(SQL_INSERT_MESSAGE, (_message_row(m) for m in messages))
+
+    def conversation(self, user_a: str, user_b: str) -> List[Dict]:
+        rows = self._conn().execute(SQL_SELECT_CONVERSATION, (user_a, user_b, user_b, user_a)).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def conversation_page(self, user_a: str, user_b: str, limit: int, before=None):
+        # cursor = id of the oldest message already shown
+        before = (1 << 63) - 1 if before is None else before
+        rows = self._conn().execute(SQL_SELECT_CONVERSATION_PAGE,
+                                    (user_a, user_b, before, limit + 1,
+                                     user_b, user_a, before, limit + 1, limit + 1)).fetchall()
+        older = len(rows) > limit
+        rows = rows[:limit][::-1]
+        return [json.loads(data) for _, data in rows], (rows[0][0] if older else None)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+BACKENDS = {
+    'file': FileBackend,
+    'sqlite': SQLiteBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend() -> StorageBackend:
+    """Process-wide backend selected by MSECURE_STORAGE"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown storage backend: {BACKEND}")
+            _backend = BACKENDS[BACKEND]()
+        return _backend
+
+def migrate(source: StorageBackend, dest: StorageBackend, batch_size: int = 10000):
+    """Copy every user and message from one backend into another"""
+    users = source.load_users()
+    for username, hashed in users.items():
+        dest.add_user(username, hashed)
+    messages = source.load_messages()
+    for start in range(0, len(messages), batch_size):
+        dest.add_messages(messages[start:start + batch_size])
+    return len(users), len(messages)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy users and messages between storage backends")
+    parser.add_argument('--from', dest='source', choices=BACKENDS, default='file')
+    parser.add_argument('--to', dest='dest', choices=BACKENDS, default='sqlite')
+    args = parser.parse_args()
+    users, messages = migrate(BACKENDS[args.source](), BACKENDS[args.dest]())
+    print(f"Migrated {users} users and {messages} messages from {args.source} to {args.dest}")
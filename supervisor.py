@@ -0,0 +1,171 @@
+# supervisor.py
+# Multi-process relay: a supervisor forks N threaded workers that all
+# listen on the same port with SO_REUSEPORT, so the kernel spreads new
+# connections across them. Workers are linked by a bus of Unix sockets:
+# every frame a worker relays is also published to its peers, which deliver
+# it to their own connections. Routing state (users, rooms) stays local to
+# each worker; a frame reaches a recipient wherever it is connected.
+#
+#   python server.py --workers 4
+import multiprocessing
+import multiprocessing.connection
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import server
+from outbound import OutboundQueue
+from protocol import FrameReader
+
+# frames waiting for one peer worker before they are spilled to disk
+BUS_QUEUE = int(os.environ.get('MSECURE_BUS_QUEUE', '4096'))
+BUS_RETRY = 1.0  # seconds before reconnecting to a peer that was not reachable
+RESTART_DELAY = 1.0  # seconds before a crashed worker is started again
+
+class WorkerBus:
+    """
+    Full mesh of Unix stream sockets between the workers of one supervisor.
+    publish() hands the frame to a bounded queue per peer (outbound.py,
+    spilling to disk rather than dropping), so a busy peer never blocks the
+    relay. Frames arriving from peers are delivered locally and never
+    republished.
+    """
+
+    def __init__(self, index: int, bus_dir: str, workers: int):
+        self.index = index
+        self.paths = [os.path.join(bus_dir, f"worker{i}.sock") for i in range(workers)]
+        self.published = 0
+        self.received = 0
+        self.unreachable = 0
+        self._peers: Dict[int, OutboundQueue] = {}
+        self._retry_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def start(self, deliver: Callable):
+        """Listen for peers; deliver(frame, wire) is called for every frame they send"""
+        path = self.paths[self.index]
+        if os.path.exists(path):
+            os.unlink(path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen()
+        threading.Thread(target=self._accept, args=(listener, deliver), name='bus', daemon=True).start()
+
+    def _accept(self, listener, deliver):
+        while True:
+            conn, _ = listener.accept()
+            threading.Thread(target=self._receive, args=(conn, deliver), name='bus-peer', daemon=True).start()
+
+    def _receive(self, conn, deliver):
+        reader = FrameReader(server.buffers)
+        try:
+            while reader.recv_into(conn):
+                for frame, wire in reader.frames():
+                    self.received += 1
+                    deliver(frame, wire)
+        except OSError:
+            pass
+        finally:
+            reader.close()
+            conn.close()
+
+    def _peer(self, i: int) -> Optional[OutboundQueue]:
+        queue = self._peers.get(i)
+        if queue is not None:
+            return queue
+        with self._lock:
+            if i in self._peers:
+                return self._peers[i]
+            if time.monotonic() < self._retry_at.get(i, 0.0):
+                return None
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.paths[i])
+            except OSError:
+                sock.close()
+                self._retry_at[i] = time.monotonic() + BUS_RETRY
+                return None
+            queue = OutboundQueue(sock, limit=BUS_QUEUE, policy="persist",
+                                  on_close=lambda s, i=i: self._lost(i, s))
+            self._peers[i] = queue
+            return queue
+
+    def _lost(self, i: int, sock):
+        with self._lock:
+            if i in self._peers and self._peers[i].sock is sock:
+                del self._peers[i]
+        sock.close()
+
+    def publish(self, data):
+        """Send one encoded frame to every other worker"""
+        self.published += 1
+        for i in range(len(self.paths)):
+            if i == self.index:
+                continue
+            queue = self._peer(i)
+            if queue is None or not queue.put(data):
+                self.unreachable += 1
+
+    def stats(self) -> Dict:
+        return {"worker": self.index, "published": self.published, "received": self.received,
+                "unreachable": self.unreachable,
+                "peer_depth": {i: q.depth for i, q in list(self._peers.items())}}
+
+def run_worker(index: int, host: str, port: int, bus_dir: str, workers: int, settings: Dict):
+    """Worker process: the threaded engine plus its end of the bus"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor decides when to stop
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)  # not the supervisor's handler, inherited by fork
+    # server.py's command-line settings (it may be running as __main__, not `server`)
+    server.RELAY_MODE = settings["relay"]
+    server.OUTBOUND_POLICY = settings["outbound_policy"]
+    if settings["stats_interval"] > 0:
+        threading.Thread(target=server.report_outbound, args=(settings["stats_interval"],), daemon=True).start()
+    bus = WorkerBus(index, bus_dir, workers)
+    bus.start(lambda frame, wire: server.forward(None, frame, wire))
+    server.bus = bus
+    server.serve_threaded(host, port, reuse_port=True)
+
+def serve_workers(host: str = server.HOST, port: int = server.PORT, workers: int = 2,
+                  relay: str = server.RELAY_MODE, outbound_policy: str = server.OUTBOUND_POLICY,
+                  stats_interval: float = 0):
+    """Run `workers` worker processes until interrupted, restarting any that die"""
+    settings = {"relay": relay, "outbound_policy": outbound_policy, "stats_interval": stats_interval}
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise SystemExit("--workers needs SO_REUSEPORT (Linux or BSD)")
+    ctx = multiprocessing.get_context('fork')
+    bus_dir = tempfile.mkdtemp(prefix='msecure_bus_')
+    procs: List[multiprocessing.Process] = [None] * workers
+
+    def start(i):
+        procs[i] = ctx.Process(target=run_worker, args=(i, host, port, bus_dir, workers, settings),
+                               name=f"worker{i}", daemon=True)
+        procs[i].start()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Supervisor: {workers} workers on {host}:{port}")
+    try:
+        for i in range(workers):
+            start(i)
+        while True:
+            sentinels = {p.sentinel: i for i, p in enumerate(procs)}
+            for ready in multiprocessing.connection.wait(list(sentinels)):
+                i = sentinels[ready]
+                print(f"Worker {i} exited with code {procs[i].exitcode}, restarting")
+                time.sleep(RESTART_DELAY)
+                start(i)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            if p is not None and p.is_alive():
+                p.terminate()
+        for p in procs:
+            if p is not None:
+                p.join(5)
+        shutil.rmtree(bus_dir, ignore_errors=True)